@@ -1,17 +1,31 @@
 import os
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from pathlib import Path
 import time
 import sys
 
+# DuckDB consolida en streaming (sin concatenar todo en RAM); si no está
+# instalado se usa el motor PyArrow
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
 # Configuración de Rutas
 DATA_DIR = Path(__file__).parent.parent / 'data'
 PARTS_DIR = DATA_DIR / 'works_parts'
 OUTPUT_FILE = DATA_DIR / 'latin_american_works.parquet'
 
+# Tipo de download_date en las partes nuevas; las antiguas lo guardan como texto ISO
+DOWNLOAD_DATE_TYPE = pa.timestamp('ms')
+
 def consolidate():
+    engine = "DuckDB Engine" if duckdb is not None else "PyArrow Engine"
     print("="*60)
-    print("CONSOLIDACIÓN ROBUSTA DE ARCHIVOS PARQUET (Pandas Engine)")
+    print(f"CONSOLIDACIÓN ROBUSTA DE ARCHIVOS PARQUET ({engine})")
     print("="*60)
     
     if not PARTS_DIR.exists():
@@ -33,8 +47,92 @@ def consolidate():
     
     start_time = time.time()
     
+    if duckdb is not None:
+        try:
+            consolidate_duckdb(files, start_time)
+            return
+        except Exception as e:
+            print(f"\n❌ Error en consolidación con DuckDB: {e}")
+            print("↪️ Reintentando con el motor PyArrow...")
+    
+    consolidate_arrow(files, start_time)
+
+
+def consolidate_duckdb(files, start_time):
+    """
+    Consolida con una sola consulta DuckDB: lectura multihilo de todas las partes,
+    unión por nombre de columna y deduplicación por ID en streaming.
+    """
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads={os.cpu_count() or 1}")
+        con.execute("PRAGMA enable_object_cache")
+        
+        # union_by_name tolera partes con columnas distintas (faltantes -> NULL)
+        file_list = ", ".join("'" + f.as_posix().replace("'", "''") + "'" for f in files)
+        source = f"read_parquet([{file_list}], union_by_name=true, filename=true, file_row_number=true)"
+        columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+        
+        select = "* EXCLUDE (filename, file_row_number)"
+        if 'download_date' in columns:
+            # Partes antiguas con download_date en texto ISO: todo a timestamp[ms]
+            select += " REPLACE (CAST(download_date AS TIMESTAMP_MS) AS download_date)"
+        query = f"SELECT {select} FROM {source}"
+        if 'id' in columns:
+            # Mismo criterio que keep='last': gana la última aparición (por archivo y fila)
+            print("🔍 Eliminando duplicados por ID...")
+            query += (
+                " QUALIFY row_number() OVER "
+                "(PARTITION BY id ORDER BY filename DESC, file_row_number DESC) = 1"
+            )
+        
+        output = OUTPUT_FILE.as_posix().replace("'", "''")
+        print(f"💾 Guardando archivo maestro: {OUTPUT_FILE}...")
+        con.execute(f"COPY ({query}) TO '{output}' (FORMAT parquet)")
+        
+        total_rows = con.execute(f"SELECT count(*) FROM read_parquet('{output}')").fetchone()[0]
+    finally:
+        con.close()
+    
+    final_size_mb = OUTPUT_FILE.stat().st_size / (1024*1024)
+    print(f"\n🎉 CONSOLIDACIÓN EXITOSA")
+    print(f"  📄 Filas finales: {total_rows:,}")
+    print(f"  📦 Tamaño final: {final_size_mb:.2f} MB")
+    print(f"  ⏱️ Tiempo total: {time.time() - start_time:.2f} s")
+
+
+def is_text(arrow_type):
+    """True para columnas de texto (string o large_string)."""
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def normalize_download_date(table):
+    """Convierte download_date en texto ISO (partes antiguas) a timestamp[ms]."""
+    i = table.schema.get_field_index('download_date')
+    if i < 0 or not is_text(table.schema.field(i).type):
+        return table
+    # El texto ISO se parsea a microsegundos y luego se trunca a ms
+    dates = pc.cast(pc.cast(table.column(i), pa.timestamp('us')), DOWNLOAD_DATE_TYPE, safe=False)
+    return table.set_column(i, pa.field('download_date', DOWNLOAD_DATE_TYPE), dates)
+
+
+def keep_last_by_id(table):
+    """Deduplica por 'id' conservando la última aparición (como keep='last')."""
+    row_idx = pa.array(np.arange(table.num_rows, dtype=np.int64))
+    last = (
+        pa.table({'id': table['id'], '__row': row_idx})
+        .group_by('id', use_threads=False)
+        .aggregate([('__row', 'max')])
+    )
+    keep = last['__row_max']
+    # Mantener el orden original de las filas sobrevivientes
+    return table.take(pc.take(keep, pc.sort_indices(keep)))
+
+
+def consolidate_arrow(files, start_time):
+    """Consolida leyendo todas las partes como tablas Arrow (requiere todo en RAM)."""
     # Leer y concatenar
-    dfs = []
+    tables = []
     success_count = 0
     fail_count = 0
     
@@ -43,14 +141,13 @@ def consolidate():
         try:
             # Imprimir progreso visualmente
             if i % 5 == 0 or i == len(files)-1:
-                sys.stdout.write(f"\r  Procesando {i+1}/{len(files)}: {f.name} ({len(dfs)} ok)")
+                sys.stdout.write(f"\r  Procesando {i+1}/{len(files)}: {f.name} ({len(tables)} ok)")
                 sys.stdout.flush()
             
-            df = pd.read_parquet(f)
-            if not df.empty:
-                # Optimización preliminar de tipos para ahorrar memoria si es posible
-                # (Opcional, pero pandas suele ser eficiente con parquet)
-                dfs.append(df)
+            table = normalize_download_date(pq.read_table(f))
+            if table.num_rows > 0:
+                # Buffers columnares de Arrow: sin copia a objetos Python
+                tables.append(table)
                 success_count += 1
             else:
                 print(f"\n  ⚠️ Archivo vacío: {f.name}")
@@ -63,34 +160,38 @@ def consolidate():
     if fail_count > 0:
         print(f"❌ Fallaron: {fail_count} archivos.")
     
-    if not dfs:
+    if not tables:
         print("⛔ No se pudieron leer datos válidos. Abortando.")
         return
         
-    print(f"\n🧩 Concatenando {len(dfs)} DataFrames en memoria...")
+    print(f"\n🧩 Concatenando {len(tables)} tablas Arrow...")
     try:
-        # Concatenación con alineación automática de columnas (outer join implícito)
-        # Esto maneja diferencias de esquema (columnas faltantes se llenan con NaN)
-        full_df = pd.concat(dfs, ignore_index=True, sort=False)
-        print(f"  ✓ Filas totales (bruto): {len(full_df):,}")
+        # Concatenación sin copia (solo se encadenan los chunks); promote_options
+        # alinea esquemas distintos (columnas faltantes se llenan con nulos)
+        full_table = pa.concat_tables(tables, promote_options='default')
+        del tables
+        print(f"  ✓ Filas totales (bruto): {full_table.num_rows:,}")
         
         # Deduplicar
         print("🔍 Eliminando duplicados por ID...")
-        if 'id' in full_df.columns:
-            before = len(full_df)
-            full_df = full_df.drop_duplicates(subset=['id'], keep='last')
-            print(f"  ✓ Eliminados {before - len(full_df):,} duplicados.")
+        if 'id' in full_table.column_names:
+            before = full_table.num_rows
+            full_table = keep_last_by_id(full_table)
+            print(f"  ✓ Eliminados {before - full_table.num_rows:,} duplicados.")
         
         # Verificar integridad mínima
         print("🛡️ Verificando integridad...")
-        print(f"  Columnas ({len(full_df.columns)}): {list(full_df.columns)}")
+        print(f"  Columnas ({full_table.num_columns}): {full_table.column_names}")
         
         print(f"💾 Guardando archivo maestro: {OUTPUT_FILE}...")
-        full_df.to_parquet(OUTPUT_FILE, index=False)
+        pq.write_table(
+            full_table, OUTPUT_FILE,
+            compression='snappy', use_dictionary=True, row_group_size=100_000
+        )
         
         final_size_mb = OUTPUT_FILE.stat().st_size / (1024*1024)
         print(f"\n🎉 CONSOLIDACIÓN EXITOSA")
-        print(f"  📄 Filas finales: {len(full_df):,}")
+        print(f"  📄 Filas finales: {full_table.num_rows:,}")
         print(f"  📦 Tamaño final: {final_size_mb:.2f} MB")
         print(f"  ⏱️ Tiempo total: {time.time() - start_time:.2f} s")
         
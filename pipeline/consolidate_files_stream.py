@@ -1,17 +1,234 @@
 import os
-import pandas as pd
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 from pathlib import Path
 import time
 import sys
 import gc
+import queue
+import threading
 
 # Configuración
 DATA_DIR = Path(__file__).parent.parent / 'data'
 PARTS_DIR = DATA_DIR / 'works_parts'
 OUTPUT_FILE = DATA_DIR / 'latin_american_works.parquet'
 
+# Cada parte se lee en streaming por bloques de filas (no el archivo completo):
+# la memoria pico es de unos pocos bloques sin importar el tamaño de la parte
+READ_BATCH_ROWS = 65536
+# Lectura anticipada: un hilo lee los bloques siguientes (Arrow decodifica sin
+# el GIL) mientras se deduplica/escribe
+MAX_PREFETCH = 16  # bloques leídos en memoria por delante, como máximo
+
+# Filas por row group del archivo consolidado
+ROW_GROUP_ROWS = 2_000_000
+
+# Tipo de download_date en las partes nuevas; las antiguas lo guardan como texto ISO
+DOWNLOAD_DATE_TYPE = pa.timestamp('ms')
+
+def is_text(arrow_type):
+    """True para columnas de texto (string o large_string)."""
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def base_schema(schema):
+    """Esquema de salida: download_date siempre como timestamp[ms]."""
+    i = schema.get_field_index('download_date')
+    if i < 0:
+        return schema
+    return schema.set(i, pa.field('download_date', DOWNLOAD_DATE_TYPE))
+
+
+def part_schema(schema, physical_schema):
+    """
+    Esquema de lectura de una parte: el base, salvo download_date que se lee como
+    texto en las partes antiguas (Arrow no castea ese texto a timestamp[ms]).
+    """
+    i = physical_schema.get_field_index('download_date')
+    if i < 0 or not is_text(physical_schema.field(i).type):
+        return schema
+    return schema.set(schema.get_field_index('download_date'), physical_schema.field(i))
+
+
+def normalize_download_date(batch):
+    """Convierte download_date en texto ISO (partes antiguas) a timestamp[ms]."""
+    i = batch.schema.get_field_index('download_date')
+    if i < 0 or not is_text(batch.schema.field(i).type):
+        return batch
+    # El texto ISO se parsea a microsegundos y luego se trunca a ms
+    dates = pc.cast(pc.cast(batch.column(i), pa.timestamp('us')), DOWNLOAD_DATE_TYPE, safe=False)
+    return batch.set_column(i, pa.field('download_date', DOWNLOAD_DATE_TYPE), dates)
+
+
+def prefetch_batches(files, schema):
+    """
+    Genera (nombre de archivo, RecordBatch, error) en el orden de files, leídos
+    por un hilo con hasta MAX_PREFETCH bloques por delante. Cada parte se lee
+    como fragmento del dataset con el esquema base: Arrow agrega columnas
+    faltantes como nulos, descarta las extras, reordena y castea tipos compatibles;
+    download_date en texto (partes antiguas) se convierte a timestamp[ms].
+    """
+    dataset = ds.dataset([str(f) for f in files], schema=schema, format='parquet')
+    pending = queue.Queue(maxsize=MAX_PREFETCH)
+    done = object()
+    stop = threading.Event()
+    
+    def put(item):
+        # Si el consumidor dejó de leer (generador cerrado), el hilo termina
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def producer():
+        try:
+            for fragment in dataset.get_fragments():
+                name = os.path.basename(fragment.path)
+                try:
+                    read_schema = part_schema(schema, fragment.physical_schema)
+                    for batch in fragment.to_batches(schema=read_schema, batch_size=READ_BATCH_ROWS, use_threads=True):
+                        if not put((name, normalize_download_date(batch), None)):
+                            return
+                except Exception as e:
+                    if not put((name, None, e)):
+                        return
+        finally:
+            put(done)
+    
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+
+
+def latest_rows(files, schema):
+    """
+    Primera pasada, solo la columna id de cada parte: para cada parte legible,
+    máscara de las filas que tienen la última versión de su id (equivale a
+    drop_duplicates(subset=['id'], keep='last') sobre todas las partes en orden).
+    Las partes que no se pueden leer quedan fuera y no ocultan versiones anteriores.
+    """
+    if not files:
+        return {}
+    dataset = ds.dataset([str(f) for f in files], schema=schema, format='parquet')
+    names = []
+    id_chunks = []
+    for fragment in dataset.get_fragments():
+        name = os.path.basename(fragment.path)
+        try:
+            read_schema = part_schema(schema, fragment.physical_schema)
+            ids = fragment.to_table(schema=read_schema, columns=['id'], use_threads=True).column('id')
+        except Exception as e:
+            print(f"  ❌ Error procesando {name}: {e}")
+            continue
+        names.append((name, len(ids)))
+        id_chunks.extend(ids.chunks)
+    
+    # Códigos enteros de los ids (Arrow, sin objetos Python); la primera aparición
+    # en el orden inverso es la última versión de cada id
+    all_ids = pa.chunked_array(id_chunks, type=schema.field('id').type).combine_chunks()
+    codes = pc.dictionary_encode(all_ids, null_encoding='encode').indices.to_numpy(zero_copy_only=False)
+    n = len(codes)
+    _, last_from_end = np.unique(codes[::-1], return_index=True)
+    keep = np.zeros(n, dtype=bool)
+    keep[n - 1 - last_from_end] = True
+    
+    masks = {}
+    offset = 0
+    for name, rows in names:
+        masks[name] = keep[offset:offset + rows]
+        offset += rows
+    return masks
+
+
+def use_jemalloc():
+    """
+    Usa jemalloc como pool de memoria de Arrow si pyarrow fue compilado con él:
+    fragmenta menos y devuelve al sistema la memoria liberada entre lotes.
+    """
+    try:
+        pa.set_memory_pool(pa.jemalloc_memory_pool())
+        return True
+    except NotImplementedError:
+        return False
+
+
+def write_consolidated(files, schema, masks):
+    """
+    Segunda pasada: escribe las partes en orden, cada bloque filtrado con su tramo
+    de la máscara de latest_rows, en row groups de ~ROW_GROUP_ROWS filas.
+    Devuelve (registros escritos, nombre de la parte que falló o None); si una parte
+    falla a mitad de lectura, se deja de escribir (el archivo se descarta).
+    """
+    # zstd + diccionario en strings: archivo más chico y lecturas de análisis más rápidas
+    writer = pq.ParquetWriter(
+        OUTPUT_FILE,
+        schema=schema,
+        compression='zstd',
+        compression_level=3,
+        use_dictionary=True,
+        data_page_size=1_048_576,
+        write_statistics=True,
+        write_batch_size=65536,
+    )
+    total_written = 0
+    
+    # Bloques ya deduplicados que esperan completar un row group
+    to_write = []
+    to_write_rows = 0
+    row_group_num = 0
+    
+    def flush():
+        nonlocal to_write, to_write_rows, total_written, row_group_num
+        if not to_write:
+            return
+        row_group_num += 1
+        print(f"  ⚡ Escribiendo row group {row_group_num}...", end=" ", flush=True)
+        # row groups grandes (~256MB para el ancho típico de works)
+        writer.write_table(pa.concat_tables(to_write), row_group_size=ROW_GROUP_ROWS)
+        total_written += to_write_rows
+        print(f"✓ Escritos {to_write_rows:,} registros.")
+        
+        # Limpieza agresiva de memoria
+        to_write = []
+        to_write_rows = 0
+        gc.collect()
+        pa.default_memory_pool().release_unused()
+    
+    try:
+        # Fila de cada parte por la que va la lectura (para ubicar el bloque en su máscara)
+        offsets = dict.fromkeys(masks, 0)
+        for name, batch, error in (prefetch_batches(files, schema) if files else []):
+            if error is not None:
+                print(f"  ❌ Error procesando {name}: {error}")
+                return total_written, name
+            
+            start = offsets[name]
+            offsets[name] = start + batch.num_rows
+            table = pa.Table.from_batches([batch]).filter(pa.array(masks[name][start:start + batch.num_rows]))
+            if table.num_rows:
+                to_write.append(table)
+                to_write_rows += table.num_rows
+            if to_write_rows >= ROW_GROUP_ROWS:
+                flush()
+        
+        flush()
+    finally:
+        writer.close()
+    return total_written, None
+
+
 def consolidate_stream():
     print("="*70)
     print("CONSOLIDACIÓN OPTIMIZADA (STREAMING - BAJA MEMORIA)")
@@ -21,92 +238,49 @@ def consolidate_stream():
         print("No se encontró directorio de partes.")
         return
 
-    # Listar y ordenar archivos
-    files = sorted(list(PARTS_DIR.glob('*.parquet')), key=lambda x: x.name)
-    if not files:
+    # Listar y ordenar archivos. Una sola pasada con scandir: las entradas
+    # traen la info del directorio y DirEntry.stat() queda cacheado
+    with os.scandir(PARTS_DIR) as it:
+        entries = sorted((e for e in it if e.name.endswith('.parquet') and e.is_file()), key=lambda e: e.name)
+    if not entries:
         print("No hay archivos para consolidar.")
         return
+    files = [Path(e.path) for e in entries]
         
     print(f"Total archivos parciales: {len(files)}")
-    total_size = sum(f.stat().st_size for f in files) / (1024**2)
+    total_size = sum(e.stat().st_size for e in entries) / (1024**2)
     print(f"Tamaño total en disco: {total_size:.2f} MB")
+    if use_jemalloc():
+        print("Pool de memoria Arrow: jemalloc")
     print("Iniciando proceso por lotes para proteger la memoria RAM...\n")
     
-    # Configuración de Lotes
-    BATCH_SIZE = 50  # Procesar 50 archivos por vez (aprox 300MB RAM)
     total_written = 0
-    writer = None
     start_time = time.time()
     
     try:
-        # Detectar Esquema del primer archivo
+        # Detectar Esquema del primer archivo (solo el footer, sin decodificar datos)
         # Esto es crucial para inicializar el escritor Parquet
         print("🔍 Detectando esquema base del primer archivo...")
-        first_table = pq.read_table(files[0])
-        schema = first_table.schema
-        
-        # Abrir Writer en modo overwrite
-        # row_group_size ajustado para eficiencia
-        writer = pq.ParquetWriter(OUTPUT_FILE, schema=schema, compression='snappy')
-        
-        current_batch = []
+        schema = base_schema(pq.read_schema(files[0]))
         
-        for i, f in enumerate(files):
-            try:
-                # Leer archivo con Pandas (maneja mejor tipos mixtos/nulos)
-                df = pd.read_parquet(f)
-                
-                # Alinear columnas con el esquema base
-                # Si faltan columnas, agregar como None para evitar error de PyArrow
-                for col in schema.names:
-                    if col not in df.columns:
-                        df[col] = None
-                        
-                # Reordenar columnas y descartar extras no presentes en esquema base
-                # (Asumiendo que el primer archivo dicta el esquema maestro)
-                df = df[schema.names]
-                
-                # Añadir al lote actual
-                current_batch.append(df)
-                
-                # Procesar lote si está lleno o es el último archivo
-                if len(current_batch) >= BATCH_SIZE or i == len(files) - 1:
-                    batch_num = (i // BATCH_SIZE) + 1
-                    print(f"  ⚡ Procesando Lote {batch_num} ({len(current_batch)} archivos)...", end=" ", flush=True)
-                    
-                    # Concatenar lote
-                    batch_df = pd.concat(current_batch, ignore_index=True)
-                    
-                    # Deduplicar dentro del lote
-                    batch_df.drop_duplicates(subset=['id'], keep='last', inplace=True)
-                    
-                    # Convertir a PyArrow Table forzando el esquema
-                    # Esto maneja conversiones de tipos compatibles
-                    table = pa.Table.from_pandas(batch_df, schema=schema, preserve_index=False)
-                    
-                    # Escribir al archivo final
-                    writer.write_table(table)
-                    
-                    rows_in_batch = len(batch_df)
-                    total_written += rows_in_batch
-                    print(f"✓ Escritos {rows_in_batch:,} registros.")
-                    
-                    # Limpieza agresiva de memoria
-                    del batch_df
-                    del table
-                    del current_batch
-                    current_batch = []
-                    gc.collect()
-                    
-            except Exception as e:
-                print(f"  ❌ Error procesando {f.name}: {e}")
-                # Continuar con el siguiente archivo
+        # Las partes se escriben en orden; de cada id se conserva su última versión
+        # (la de la parte más nueva), como drop_duplicates(keep='last'). Una parte
+        # que no se puede leer se omite completa: si falla a mitad de la escritura,
+        # se repite la consolidación sin ella para no dejar media parte ni ocultar
+        # las versiones anteriores de sus ids.
+        skipped = set()
+        while True:
+            readable = [f for f in files if f.name not in skipped]
+            masks = latest_rows(readable, schema)
+            readable = [f for f in readable if f.name in masks]
+            total_written, failed = write_consolidated(readable, schema, masks)
+            if failed is None:
+                break
+            skipped.add(failed)
+            print(f"  ↪️ Repitiendo la consolidación sin {failed}...")
                 
     except Exception as e:
         print(f"\n❌ Error Fatal durante consolidación: {e}")
-    finally:
-        if writer:
-            writer.close()
             
     elapsed = time.time() - start_time
     print(f"\n✅ PROCESO FINALIZADO en {elapsed:.2f} s")
@@ -2,10 +2,13 @@
 Script para enriquecer los datos de las revistas consultando la API de OpenAlex.
 Descarga la jerarquía de tópicos (Topics -> Fields -> Domains) para generar el gráfico Sunburst.
 
-Este script hace peticiones a la API (1 por revista).
+Este script hace peticiones a la API (1 por cada IDS_PER_REQUEST revistas, varias en paralelo).
 """
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+import aiohttp
+import asyncio
 import time
 import os
 import argparse
@@ -15,20 +18,160 @@ from pathlib import Path
 DATA_DIR = Path(__file__).parent.parent / 'data'
 JOURNALS_FILE = DATA_DIR / 'latin_american_journals.parquet'
 OUTPUT_FILE = DATA_DIR / 'journals_topics_sunburst.parquet'
+# Filas nuevas de cada tanda (guardado parcial), hasta integrarlas a OUTPUT_FILE
+PARTS_DIR = DATA_DIR / 'journals_topics_sunburst_parts'
 
-def save_partial(data_list, output_path=OUTPUT_FILE):
-    if not data_list:
+# Revistas por petición al endpoint de listado (/sources?filter=openalex:id1|id2|...)
+IDS_PER_REQUEST = 50
+# Peticiones simultáneas con email (Polite Pool de OpenAlex: ~10 req/s)
+MAX_CONCURRENCY = 10
+# Revistas por tanda de peticiones concurrentes (guardado parcial tras cada una)
+SAVE_EVERY = 500
+
+TOPICS_SCHEMA = pa.schema([
+    ('journal_id', pa.string()),
+    ('journal_name', pa.string()),
+    ('topic_name', pa.string()),
+    ('topic_id', pa.string()),
+    ('subfield', pa.string()),
+    ('field', pa.string()),
+    ('domain', pa.string()),
+    ('count', pa.int64()),
+    ('share', pa.float64()),
+])
+
+def save_partial(buffer, part_name):
+    """
+    Guarda las filas nuevas de una tanda como un parquet propio en PARTS_DIR y vacía
+    el buffer. Se escribe a un temporal y se renombra: cada parte queda completa
+    (con footer) aunque el proceso se corte después.
+    """
+    if not buffer:
         return
     try:
-        df = pd.DataFrame(data_list)
-        # Crear carpeta si no existe
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        df.to_parquet(output_path, index=False)
-        # print(f"  (Guardado parcial: {len(df)} registros)")
+        PARTS_DIR.mkdir(parents=True, exist_ok=True)
+        part_file = PARTS_DIR / f'part-{part_name}.parquet'
+        tmp_file = part_file.with_name(part_file.name + '.tmp')
+        pq.write_table(pa.Table.from_pylist(buffer, schema=TOPICS_SCHEMA), tmp_file, compression='snappy')
+        os.replace(tmp_file, part_file)
+        buffer.clear()
     except Exception as e:
         print(f"Error guardando parcial: {e}")
 
-def enrich_journals(email=None):
+def merge_parts():
+    """
+    Integra a OUTPUT_FILE las partes guardadas (también las de una ejecución cortada)
+    con un solo ParquetWriter: registros existentes y luego cada parte.
+    Las partes con revistas ya integradas (por ejemplo, antes de un corte que no
+    llegó a borrarlas) se descartan; si les faltaba alguna, se vuelve a descargar.
+    """
+    parts = sorted(PARTS_DIR.glob('part-*.parquet')) if PARTS_DIR.exists() else []
+    if not parts:
+        return
+
+    existing_table = None
+    if OUTPUT_FILE.exists():
+        existing_table = pq.read_table(OUTPUT_FILE).select(TOPICS_SCHEMA.names).cast(TOPICS_SCHEMA)
+    merged_ids = set(existing_table['journal_id'].unique().to_pylist()) if existing_table is not None else set()
+
+    merged_parts = 0
+    tmp_file = OUTPUT_FILE.with_name(OUTPUT_FILE.name + '.tmp')
+    with pq.ParquetWriter(tmp_file, TOPICS_SCHEMA, compression='snappy') as writer:
+        if existing_table is not None:
+            writer.write_table(existing_table)
+        for part in parts:
+            table = pq.read_table(part).select(TOPICS_SCHEMA.names).cast(TOPICS_SCHEMA)
+            part_ids = table['journal_id'].unique().to_pylist()
+            if merged_ids.isdisjoint(part_ids):
+                writer.write_table(table)
+                merged_ids.update(part_ids)
+                merged_parts += 1
+    os.replace(tmp_file, OUTPUT_FILE)
+
+    for part in parts:
+        part.unlink()
+    try:
+        PARTS_DIR.rmdir()
+    except OSError:
+        pass
+    print(f"✓ {merged_parts} guardados parciales integrados a {OUTPUT_FILE.name}"
+          f" ({len(parts) - merged_parts} ya integrados, descartados)")
+
+def flatten_topics(jid, data):
+    """Convierte los tópicos de una revista en filas jerárquicas para el Sunburst."""
+    rows = []
+    for topic in data.get('topics', []):
+        # Normalizar share/percentage
+        share = topic.get('share', 0)
+        if share == 0:
+            share = topic.get('percentage', 0) / 100.0 if 'percentage' in topic else 0
+        
+        count = topic.get('count', 0)
+        if count == 0 and 'works_count' in topic: # A veces viene como works_count
+             count = topic['works_count']
+
+        # Estructura jerárquica para Sunburst
+        rows.append({
+            'journal_id': jid,
+            'journal_name': data.get('display_name'),
+            'topic_name': topic['display_name'],
+            'topic_id': topic['id'],
+            'subfield': topic['subfield']['display_name'] if 'subfield' in topic else 'Unknown',
+            'field': topic['field']['display_name'] if 'field' in topic else 'Unknown',
+            'domain': topic['domain']['display_name'] if 'domain' in topic else 'Unknown',
+            'count': count,
+            'share': share
+        })
+    # Si no tiene tópicos no se guarda nada: no ensuciar el output con dummies.
+    # (`processed_ids` se basa en `journal_id` del output, así que se reintentará.)
+    return rows
+
+
+async def fetch_journals_topics(session, sem, backoff, jids, email, sleep_time):
+    """
+    Descarga los tópicos de hasta IDS_PER_REQUEST revistas en una sola petición;
+    devuelve sus filas (vacío si falla).
+    """
+    clean_ids = {jid.split('/')[-1]: jid for jid in jids}
+    label = f"{len(clean_ids)} revistas desde {next(iter(clean_ids))}"
+    url = "https://api.openalex.org/sources"
+    params = {
+        'filter': 'openalex:' + '|'.join(clean_ids),
+        'select': 'id,display_name,topics',
+        'per-page': IDS_PER_REQUEST,
+    }
+    if email:
+        params['mailto'] = email
+    
+    async with sem:
+        try:
+            # Pausa compartida: si alguna petición recibió 429, todas esperan
+            delay = backoff['until'] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            async with session.get(url, params=params) as resp:
+                if resp.status == 200:
+                    rows = []
+                    for data in (await resp.json()).get('results', []):
+                        jid = clean_ids.get(data.get('id', '').split('/')[-1])
+                        if jid is not None:
+                            rows.extend(flatten_topics(jid, data))
+                    return rows
+                elif resp.status == 429:
+                    print(f"  ⚠️ Rate limit. Esperando 5s...")
+                    backoff['until'] = max(backoff['until'], time.monotonic() + 5)
+                else:
+                    print(f"  ❌ Error {resp.status} para {label}")
+        except Exception as e:
+            print(f"  ❌ Excepción para {label}: {e}")
+        finally:
+            # Mantener el ritmo por conexión dentro del límite del Polite Pool
+            await asyncio.sleep(sleep_time)
+    return []
+
+
+async def enrich_journals(email=None):
     if not JOURNALS_FILE.exists():
         print(f"❌ No se encontró el archivo de revistas: {JOURNALS_FILE}")
         return
@@ -50,19 +193,25 @@ def enrich_journals(email=None):
         print(f"Error leyendo archivo de revistas: {e}")
         return
     
-    # Verificar progreso existente
-    existing_data = []
+    # Verificar progreso existente (incluye los guardados parciales de una ejecución cortada)
+    try:
+        merge_parts()
+    except Exception as e:
+        print(f"Advertencia integrando guardados parciales: {e}")
+
+    existing_table = None
     processed_ids = set()
     
     if OUTPUT_FILE.exists():
         try:
-            old_df = pd.read_parquet(OUTPUT_FILE)
-            if not old_df.empty:
-                existing_data = old_df.to_dict('records')
-                processed_ids = set(old_df['journal_id'].unique())
+            # Se mantiene como tabla Arrow (sin pasar a dicts): solo se re-escribe tal cual
+            existing_table = pq.read_table(OUTPUT_FILE).select(TOPICS_SCHEMA.names).cast(TOPICS_SCHEMA)
+            if existing_table.num_rows > 0:
+                processed_ids = set(existing_table['journal_id'].unique().to_pylist())
                 print(f"✓ Encontrados {len(processed_ids)} revistas ya procesadas.")
         except Exception as e:
             print(f"Advertencia leyendo archivo existente: {e}")
+            existing_table = None
 
     # Filtrar IDs pendientes
     ids_to_process = [jid for jid in journal_ids if jid not in processed_ids]
@@ -76,85 +225,51 @@ def enrich_journals(email=None):
     new_data = []
     total_new = 0
     
-    session = requests.Session()
-    session.headers.update({'User-Agent': 'RevistasLatam/1.0 (mailto:' + (email or 'test@example.com') + ')'})
+    # Cada tanda se guarda como una parte completa en PARTS_DIR (solo las filas
+    # nuevas); al terminar se integran al archivo final. Si el proceso muere, las
+    # partes ya escritas se integran al inicio de la siguiente ejecución.
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # Prefijo de esta ejecución: no pisa partes de una anterior que no se hayan integrado
+    run_id = time.strftime('%Y%m%d-%H%M%S')
     
-    start_time = time.time()
+    # Peticiones concurrentes acotadas (~10 req/s del Polite Pool con email)
+    concurrency = MAX_CONCURRENCY if email else 1
     sleep_time = 0.1 if email else 0.5 # Acelerado con email
+    sem = asyncio.Semaphore(concurrency)
+    backoff = {'until': 0.0}
+    headers = {'User-Agent': 'RevistasLatam/1.0 (mailto:' + (email or 'test@example.com') + ')'}
     
-    for i, jid in enumerate(ids_to_process):
-        try:
-            clean_id = jid.split('/')[-1]
-            url = f"https://api.openalex.org/sources/{clean_id}"
-            params = {'select': 'id,display_name,topics'}
-            if email:
-                params['mailto'] = email
-            
-            resp = session.get(url, params=params, timeout=15)
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                topics = data.get('topics', [])
-                
-                # Procesar cada tópico
-                for topic in topics:
-                    # Normalizar share/percentage
-                    share = topic.get('share', 0)
-                    if share == 0:
-                        share = topic.get('percentage', 0) / 100.0 if 'percentage' in topic else 0
-                    
-                    count = topic.get('count', 0)
-                    if count == 0 and 'works_count' in topic: # A veces viene como works_count
-                         count = topic['works_count']
-
-                    # Estructura jerárquica para Sunburst
-                    t_data = {
-                        'journal_id': jid,
-                        'journal_name': data.get('display_name'),
-                        'topic_name': topic['display_name'],
-                        'topic_id': topic['id'],
-                        'subfield': topic['subfield']['display_name'] if 'subfield' in topic else 'Unknown',
-                        'field': topic['field']['display_name'] if 'field' in topic else 'Unknown',
-                        'domain': topic['domain']['display_name'] if 'domain' in topic else 'Unknown',
-                        'count': count,
-                        'share': share
-                    }
-                    new_data.append(t_data)
-                    total_new += 1
+    start_time = time.time()
+    
+    try:
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=15),
+        ) as session:
+            # Por tandas, para que el guardado parcial siga siendo incremental
+            for start in range(0, len(ids_to_process), SAVE_EVERY):
+                chunk = ids_to_process[start:start + SAVE_EVERY]
+                results = await asyncio.gather(*(
+                    fetch_journals_topics(session, sem, backoff, chunk[k:k + IDS_PER_REQUEST], email, sleep_time)
+                    for k in range(0, len(chunk), IDS_PER_REQUEST)
+                ))
+                for rows in results:
+                    new_data.extend(rows)
+                    total_new += len(rows)
+                save_partial(new_data, f'{run_id}-{start // SAVE_EVERY:05d}')
                 
-                # Marcar como procesado aunque no tenga tópicos (para no reintentar infinitamente)
-                if not topics:
-                    # Agregar un registro dummy o simplemente confiar en `processed_ids` logic next time
-                    # Pero `processed_ids` se basa en `journal_id` unique en el output file.
-                    # Si no guardamos nada, se reintentará.
-                    # Guardamos un dummy con topic_name="Unknown" para marcarlo?
-                    # Mejor no ensuciar. Asumimos que si no está en output, no tiene tópicos.
-                    pass
-
-            elif resp.status_code == 429:
-                print(f"  ⚠️ Rate limit. Esperando 5s...")
-                time.sleep(5)
-            else:
-                print(f"  ❌ Error {resp.status_code} para {clean_id}")
-
-        except Exception as e:
-            print(f"  ❌ Excepción para {clean_id}: {e}")
-            
-        # Log progreso cada 20
-        if (i + 1) % 20 == 0:
-            elapsed = time.time() - start_time
-            rate = (i + 1) / elapsed
-            print(f"  [{i+1}/{len(ids_to_process)}] Procesados ({rate:.1f} req/s)")
-            
-            # Guardado parcial
-            save_partial(existing_data + new_data)
-        
-        time.sleep(sleep_time)
-        
-    # Guardado final
-    final_list = existing_data + new_data
-    save_partial(final_list)
-    print(f"\n✅ Enriquecimiento completado. Total registros topics: {len(final_list)}")
+                done = start + len(chunk)
+                elapsed = time.time() - start_time
+                rate = done / elapsed
+                print(f"  [{done}/{len(ids_to_process)}] Procesados ({rate:.1f} revistas/s)")
+    finally:
+        # Guardado final
+        save_partial(new_data, f'{run_id}-final')
+        merge_parts()
+    
+    total = total_new + (existing_table.num_rows if existing_table is not None else 0)
+    print(f"\n✅ Enriquecimiento completado. Total registros topics: {total}")
 
 if __name__ == "__main__":
     import argparse
@@ -164,7 +279,7 @@ if __name__ == "__main__":
     parser.add_argument('--email', help='Email for OpenAlex API politeness pool')
     args = parser.parse_args()
     
-    enrich_journals(email=args.email)
+    asyncio.run(enrich_journals(email=args.email))
     
     # También generar automáticamente el nivel país
     generate_country_sunburst()
@@ -4,6 +4,11 @@ This script queries the local PostgreSQL database instead of the OpenAlex API.
 """
 import psycopg2
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import itertools
 import json
 import os
 from pathlib import Path
@@ -23,6 +28,9 @@ DATA_DIR = Path(__file__).parent.parent / 'data'
 JOURNALS_FILE = DATA_DIR / 'latin_american_journals.parquet'
 WORKS_FILE = DATA_DIR / 'latin_american_works.parquet'
 
+# Clave de metadatos (footer parquet) con los journal_id de cada archivo parcial
+PART_JOURNALS_KEY = b'journal_ids'
+
 
 def get_db_connection():
     """Create and return a database connection."""
@@ -34,6 +42,15 @@ def get_db_connection():
         raise
 
 
+def fetch_dataframe(conn, query, params=None):
+    """
+    Run a query into a DataFrame through Arrow (server-side cursor, see
+    iter_arrow_batches) instead of pd.read_sql_query's per-row conversion.
+    """
+    tables = list(iter_arrow_batches(conn, query, params))
+    return pa.concat_tables(tables, promote_options='permissive').to_pandas()
+
+
 def fetch_latin_american_journals():
     """
     Fetch all journals from Latin American countries from PostgreSQL.
@@ -62,7 +79,10 @@ def fetch_latin_american_journals():
             updated_date,
             country_code,
             is_scopus,
-            summary_stats
+            -- Métricas extraídas de summary_stats en el servidor (sin viajar el JSON)
+            COALESCE((summary_stats->>'h_index')::int, 0) as h_index,
+            COALESCE((summary_stats->>'i10_index')::int, 0) as i10_index,
+            COALESCE((summary_stats->>'2yr_mean_citedness')::float8, 0.0) as "2yr_mean_citedness"
         FROM openalex.sources
         ORDER BY works_count DESC;
         """
@@ -70,9 +90,10 @@ def fetch_latin_american_journals():
         print(f"Querying all journals from openalex.sources table...")
         
         try:
-            df = pd.read_sql_query(query, conn)
+            df = fetch_dataframe(conn, query)
         except Exception as e:
             print(f"Warning: Could not query with all fields. Trying fallback: {e}")
+            conn.rollback()
             # Fallback if some columns don't exist
             query_fallback = """
             SELECT 
@@ -94,41 +115,40 @@ def fetch_latin_american_journals():
             FROM openalex.sources
             ORDER BY works_count DESC;
             """
-            df = pd.read_sql_query(query_fallback, conn)
+            df = fetch_dataframe(conn, query_fallback)
         
         # Add download metadata
-        df['download_date'] = datetime.datetime.now().isoformat()
+        # Timestamp tipado (8 bytes, un solo valor repetido) en vez de un string por fila
+        df['download_date'] = pd.Timestamp.now().floor('ms')
         
         print(f"Found {len(df)} Latin American journals.")
         
         # Procesar métricas adicionales desde summary_stats (si existen)
-        if 'summary_stats' in df.columns:
+        if 'h_index' in df.columns:
+            df = df.astype({'h_index': np.int32, 'i10_index': np.int32})
+            print(f"  ✅ Extraídos en PostgreSQL: h_index, i10_index, 2yr_mean_citedness")
+        elif 'summary_stats' in df.columns:
             print("Extrayendo métricas de summary_stats (h-index, i10, impacto)...")
             
-            def extract_metric(stats, metric, default=0):
-                """Extrae una métrica del JSON summary_stats"""
-                # Si es None o NaN, retornar default
-                if pd.isna(stats):
-                    return default
-                
-                # Si es string, parsear a dict
+            def parse_stats(stats):
+                """Parsea summary_stats (dict o string JSON) a dict; {} si no es válido"""
+                if isinstance(stats, dict):
+                    return stats
                 if isinstance(stats, str):
                     try:
                         stats = json.loads(stats)
-                    except:
-                        return default
-                
-                # Si es dict, extraer el valor
-                if isinstance(stats, dict):
-                    val = stats.get(metric, default)
-                    return val if val is not None else default
-                
-                return default
+                    except ValueError:
+                        return {}
+                    return stats if isinstance(stats, dict) else {}
+                return {}
 
-            # Aplicar extracción a cada métrica
-            df['h_index'] = df['summary_stats'].apply(lambda x: extract_metric(x, 'h_index', 0))
-            df['i10_index'] = df['summary_stats'].apply(lambda x: extract_metric(x, 'i10_index', 0))
-            df['2yr_mean_citedness'] = df['summary_stats'].apply(lambda x: extract_metric(x, '2yr_mean_citedness', 0.0))
+            # Una sola pasada parsea cada summary_stats; luego cada métrica es un acceso a dict
+            stats_list = [parse_stats(s) for s in df['summary_stats'].tolist()]
+            df['h_index'] = np.array([d.get('h_index') or 0 for d in stats_list], dtype=np.int32)
+            df['i10_index'] = np.array([d.get('i10_index') or 0 for d in stats_list], dtype=np.int32)
+            df['2yr_mean_citedness'] = np.array(
+                [d.get('2yr_mean_citedness') or 0.0 for d in stats_list], dtype=np.float64
+            )
             
             # Limpiar columna raw para ahorrar espacio
             df = df.drop(columns=['summary_stats'])
@@ -170,123 +190,42 @@ def fetch_latin_american_journals():
         conn.close()
 
 
-def fetch_works_for_journal(journal_id, journal_name, conn):
-    """
-    Fetch all works for a specific journal from PostgreSQL.
-    
-    Args:
-        journal_id: OpenAlex ID of the journal
-        journal_name: Display name of the journal
-        conn: Database connection
-    
-    Returns:
-        DataFrame with works data
-    """
-    print(f"  Fetching works for: {journal_name}...")
-    
-    # Main works query
-    query = """
-    SELECT 
-        w.id,
-        w.doi,
-        w.title,
-        w.display_name,
-        w.publication_year,
-        w.publication_date,
-        w.type,
-        w.cited_by_count,
-        w.is_retracted,
-        w.is_paratext,
-        w.cited_by_api_url,
-        w.abstract_inverted_index,
-        w.language,
-        w.fwci,
-        w.citation_normalized_percentile,
-        wpl.source_id as journal_id
-    FROM openalex.works w
-    INNER JOIN openalex.works_primary_location wpl ON wpl.work_id = w.id
-    WHERE wpl.source_id = %s;
-    """
-    
-    try:
-        works_df = pd.read_sql_query(query, conn, params=(journal_id,))
-    except Exception as e:
-        print(f"  ⚠️ Error querying columns (fwci/percentile missing?): {e}")
-        # Fallback query without new columns IF database schema is old
-        query_fallback = """
-        SELECT 
-            w.id,
-            w.doi,
-            w.title,
-            w.display_name,
-            w.publication_year,
-            w.publication_date,
-            w.type,
-            w.cited_by_count,
-            w.is_retracted,
-            w.is_paratext,
-            w.cited_by_api_url,
-            w.abstract_inverted_index,
-            w.language,
-            wpl.source_id as journal_id
-        FROM openalex.works w
-        INNER JOIN openalex.works_primary_location wpl ON wpl.work_id = w.id
-        WHERE wpl.source_id = %s;
-        """
-        works_df = pd.read_sql_query(query_fallback, conn, params=(journal_id,))
-        works_df['fwci'] = 0.0
-        works_df['citation_normalized_percentile'] = 0.0
-    
-    if len(works_df) == 0:
-        print(f"  No works found for {journal_name}")
-        return pd.DataFrame()
-    
-    # Add journal name
-    works_df['journal_name'] = journal_name
-    
-    # Compute derived metrics locally (since they might not be in DB explicit columns)
-    if 'citation_normalized_percentile' in works_df.columns:
-        # Check if it was extracted as decimal (0-100) or we need to handle it
-        # Ensure numeric type strictly as per guide
-        pct_col = pd.to_numeric(works_df['citation_normalized_percentile'], errors='coerce').fillna(0.0)
-        
-        # Calculate boolean flags
-        # Top 10%: Percentile >= 90.0
-        works_df['is_in_top_10_percent'] = pct_col >= 90.0
-        
-        # Top 1%: Percentile >= 99.0
-        works_df['is_in_top_1_percent'] = pct_col >= 99.0
-    
-    # Fetch additional data for each work
-    print(f"  Fetching additional data for {len(works_df)} works...")
-    
-    # Get authorships
-    authorships_query = """
-    SELECT 
-        wa.work_id,
-        json_agg(
-            json_build_object(
-                'author_position', wa.author_position,
-                'author_id', wa.author_id,
-                'institution_id', wa.institution_id,
-                'raw_affiliation_string', wa.raw_affiliation_string
-            )
-        ) as authorships
-    FROM openalex.works_authorships wa
-    WHERE wa.work_id = ANY(%s)
-    GROUP BY wa.work_id;
-    """
-    
-    work_ids = works_df['id'].tolist()
-    authorships_df = pd.read_sql_query(authorships_query, conn, params=(work_ids,))
-    
-    # Merge authorships
-    works_df = works_df.merge(authorships_df, left_on='id', right_on='work_id', how='left')
-    
-    # Get concepts (if table exists and has data)
-    try:
-        concepts_query = """
-        SELECT 
+# Rows fetched per round-trip from the server-side cursor
+FETCH_ROWS = 50_000
+# Approximate rows per partial works file
+PART_ROWS = 500_000
+
+# Arrow type per PostgreSQL type OID (cursor.description type_code), so every batch
+# of a column gets the same type; other types are inferred from the values
+NUMERIC_OID = 1700
+PG_ARROW_TYPES = {
+    16: pa.bool_(),                        # boolean
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),  # int8, int2, int4
+    700: pa.float64(), 701: pa.float64(),  # float4, float8
+    NUMERIC_OID: pa.float64(),             # numeric, as read_sql_query(coerce_float=True)
+    25: pa.string(), 1043: pa.string(),    # text, varchar
+    1082: pa.date32(), 1114: pa.timestamp('us'),  # date, timestamp
+}
+
+# Optional per-work tables: CTE name -> (table, aggregated SELECT, output columns)
+OPTIONAL_WORK_TABLES = {
+    'a': ('works_authorships', """
+        SELECT
+            wa.work_id,
+            json_agg(
+                json_build_object(
+                    'author_position', wa.author_position,
+                    'author_id', wa.author_id,
+                    'institution_id', wa.institution_id,
+                    'raw_affiliation_string', wa.raw_affiliation_string
+                )
+            ) as authorships
+        FROM openalex.works_authorships wa
+        WHERE wa.work_id IN (SELECT id FROM w)
+        GROUP BY wa.work_id
+    """, ['authorships']),
+    'c': ('works_concepts', """
+        SELECT
             wc.work_id,
             json_agg(
                 json_build_object(
@@ -295,19 +234,11 @@ def fetch_works_for_journal(journal_id, journal_name, conn):
                 )
             ) as concepts
         FROM openalex.works_concepts wc
-        WHERE wc.work_id = ANY(%s)
-        GROUP BY wc.work_id;
-        """
-        
-        concepts_df = pd.read_sql_query(concepts_query, conn, params=(work_ids,))
-        works_df = works_df.merge(concepts_df, left_on='id', right_on='work_id', how='left', suffixes=('', '_concepts'))
-    except:
-        print("  Note: works_concepts table empty or not found, skipping concepts")
-    
-    # Get topics (if exists)
-    try:
-        topics_query = """
-        SELECT 
+        WHERE wc.work_id IN (SELECT id FROM w)
+        GROUP BY wc.work_id
+    """, ['concepts']),
+    't': ('works_topics', """
+        SELECT
             wt.work_id,
             json_agg(
                 json_build_object(
@@ -316,41 +247,238 @@ def fetch_works_for_journal(journal_id, journal_name, conn):
                 )
             ) as topics
         FROM openalex.works_topics wt
-        WHERE wt.work_id = ANY(%s)
-        GROUP BY wt.work_id;
-        """
-        
-        topics_df = pd.read_sql_query(topics_query, conn, params=(work_ids,))
-        works_df = works_df.merge(topics_df, left_on='id', right_on='work_id', how='left', suffixes=('', '_topics'))
-    except:
-        print("  Note: works_topics table not found, skipping topics")
-    
-    # Get open access info (if exists)
-    try:
-        oa_query = """
-        SELECT 
+        WHERE wt.work_id IN (SELECT id FROM w)
+        GROUP BY wt.work_id
+    """, ['topics']),
+    'o': ('works_open_access', """
+        SELECT
             woa.work_id,
             woa.is_oa,
             woa.oa_status,
             woa.oa_url
         FROM openalex.works_open_access woa
-        WHERE woa.work_id = ANY(%s);
-        """
-        
-        oa_df = pd.read_sql_query(oa_query, conn, params=(work_ids,))
-        works_df = works_df.merge(oa_df, left_on='id', right_on='work_id', how='left', suffixes=('', '_oa'))
-    except:
-        print("  Note: works_open_access table not found, skipping OA info")
+        WHERE woa.work_id IN (SELECT id FROM w)
+    """, ['is_oa', 'oa_status', 'oa_url']),
+}
+
+WORKS_COLUMNS = [
+    'w.id', 'w.doi', 'w.title', 'w.display_name', 'w.publication_year',
+    'w.publication_date', 'w.type', 'w.cited_by_count', 'w.is_retracted',
+    'w.is_paratext', 'w.cited_by_api_url', 'w.abstract_inverted_index', 'w.language',
+]
+# Not present in older database schemas
+WORKS_METRIC_COLUMNS = ['w.fwci', 'w.citation_normalized_percentile']
+
+# Optional tables found in the database (checked once per run)
+_available_work_tables = None
+
+
+def get_available_work_tables(conn):
+    """Return the CTE names of OPTIONAL_WORK_TABLES whose table exists."""
+    global _available_work_tables
+    if _available_work_tables is None:
+        with conn.cursor() as cur:
+            _available_work_tables = []
+            for name, (table, _, _) in OPTIONAL_WORK_TABLES.items():
+                cur.execute("SELECT to_regclass(%s);", (f'openalex.{table}',))
+                if cur.fetchone()[0] is not None:
+                    _available_work_tables.append(name)
+                else:
+                    print(f"  Note: {table} table not found, skipping")
+    return _available_work_tables
+
+
+def build_works_query(conn, with_metrics=True):
+    """
+    Build a single query returning every work of the given journals (one
+    array parameter) with its authorships, concepts, topics and open access
+    info already joined (server side), ordered by journal.
+    """
+    columns = WORKS_COLUMNS + (WORKS_METRIC_COLUMNS if with_metrics else [])
+    ctes = [f"""w AS (
+        SELECT
+            {', '.join(columns)},
+            wpl.source_id as journal_id
+        FROM openalex.works w
+        INNER JOIN openalex.works_primary_location wpl ON wpl.work_id = w.id
+        WHERE wpl.source_id = ANY(%s)
+    )"""]
+    select = ['w.*']
+    joins = []
+    for name in get_available_work_tables(conn):
+        _, cte_query, out_columns = OPTIONAL_WORK_TABLES[name]
+        ctes.append(f"{name} AS ({cte_query})")
+        select += [f"{name}.{col}" for col in out_columns]
+        joins.append(f"LEFT JOIN {name} ON {name}.work_id = w.id")
+    return f"""
+    WITH {', '.join(ctes)}
+    SELECT {', '.join(select)}
+    FROM w
+    {' '.join(joins)}
+    ORDER BY w.journal_id;
+    """
+
+
+def arrow_column(values, type_code):
+    """
+    Build the Arrow array of one result column with the type of its PostgreSQL
+    type OID. NUMERIC values (Decimal) become float64: inferring them per batch
+    gives decimal128 types whose precision changes from batch to batch.
+    """
+    if type_code == NUMERIC_OID:
+        return pa.array([None if v is None else float(v) for v in values], pa.float64())
+    return pa.array(values, PG_ARROW_TYPES.get(type_code))
+
+
+def iter_arrow_batches(conn, query, params=None):
+    """
+    Run a query through a server-side cursor and yield the rows as Arrow
+    tables of up to FETCH_ROWS rows (no full list of tuples, no pandas).
+    Column types come from cursor.description, not from each batch's values.
+    """
+    with conn.cursor(name='fetch_arrow') as cur:
+        cur.itersize = FETCH_ROWS
+        cur.execute(query, params)
+        empty = True
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            empty = False
+            columns = zip(*rows)
+            yield pa.table({d[0]: arrow_column(col, d[1]) for d, col in zip(cur.description, columns)})
+            del rows, columns
+        if empty and cur.description:
+            # Sin filas: tabla vacía con los nombres y tipos de columna del resultado
+            yield pa.table({d[0]: pa.array([], PG_ARROW_TYPES.get(d[1], pa.null())) for d in cur.description})
+
+
+def to_numeric(column):
+    """
+    Arrow equivalent of pd.to_numeric(errors='coerce'): numeric columns are cast
+    to float64, any other type (text, json) goes through pandas so values that do
+    not parse become null instead of raising.
+    """
+    t = column.type
+    if pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_decimal(t) or pa.types.is_null(t):
+        return pc.cast(column, pa.float64(), safe=False)
+    return pa.array(pd.to_numeric(column.to_pandas(), errors='coerce'), pa.float64(), from_pandas=True)
+
+
+def iter_works_batches(journal_ids, journal_names, conn):
+    """
+    Fetch the works of all the given journals with one query, streamed from
+    the server and grouped by journal.
     
-    # Add download metadata
-    works_df['download_date'] = datetime.datetime.now().isoformat()
+    Args:
+        journal_ids: OpenAlex IDs of the journals
+        journal_names: Dict journal ID -> display name
+        conn: Database connection
     
-    # Clean up duplicate columns
-    works_df = works_df.loc[:, ~works_df.columns.duplicated()]
+    Yields:
+        Arrow tables of up to FETCH_ROWS works with the derived columns added
+    """
+    # One round-trip: works + authorships/concepts/topics/OA joined in PostgreSQL
+    with_metrics = True
+    try:
+        batches = iter_arrow_batches(conn, build_works_query(conn), (journal_ids,))
+        first = next(batches, None)
+    except Exception as e:
+        print(f"  ⚠️ Error querying columns (fwci/percentile missing?): {e}")
+        # Fallback query without new columns IF database schema is old
+        conn.rollback()
+        with_metrics = False
+        batches = iter_arrow_batches(conn, build_works_query(conn, with_metrics=False), (journal_ids,))
+        first = next(batches, None)
     
-    print(f"  Found {len(works_df)} works for {journal_name}")
+    if first is None or first.num_rows == 0:
+        return
     
-    return works_df
+    ids_array = pa.array(list(journal_names), pa.string())
+    names_array = pa.array(list(journal_names.values()), pa.string())
+    # Typed timestamp scalar repeated per row (8 bytes, one dictionary/RLE value)
+    # instead of an ISO string per row; kept per row because consolidation mixes
+    # parts downloaded at different times
+    download_date = pa.scalar(datetime.datetime.now(), pa.timestamp('ms'))
+    
+    for works in itertools.chain([first], batches):
+        if not with_metrics:
+            zeros = pa.array(np.zeros(works.num_rows))
+            works = works.append_column('fwci', zeros).append_column('citation_normalized_percentile', zeros)
+        
+        # Add journal name
+        works = works.append_column(
+            'journal_name', names_array.take(pc.index_in(works['journal_id'], value_set=ids_array))
+        )
+        
+        # Compute derived metrics locally (since they might not be in DB explicit columns)
+        if 'citation_normalized_percentile' in works.column_names:
+            # Check if it was extracted as decimal (0-100) or we need to handle it
+            # Ensure numeric type strictly as per guide (non-numeric and NULL -> 0.0)
+            pct_col = pc.coalesce(to_numeric(works['citation_normalized_percentile']), pa.scalar(0.0))
+            
+            # Calculate boolean flags
+            # Top 10%: Percentile >= 90.0
+            works = works.append_column('is_in_top_10_percent', pc.greater_equal(pct_col, 90.0))
+            
+            # Top 1%: Percentile >= 99.0
+            works = works.append_column('is_in_top_1_percent', pc.greater_equal(pct_col, 99.0))
+        
+        # Add download metadata
+        works = works.append_column('download_date', pa.repeat(download_date, works.num_rows))
+        
+        yield works
+
+
+# Rename columns to match dashboard expectations
+PART_COLUMN_MAPPING = {
+    'citation_normalized_percentile': 'percentile',
+    'is_in_top_1_percent': 'is_top_1',
+    'is_in_top_10_percent': 'is_top_10'
+}
+
+
+def write_works_part(tables, batch_path):
+    """
+    Save a partial works file from the fetched Arrow tables, recording its
+    journal ids in the parquet footer so later runs can skip it without
+    decoding any column. Returns the number of rows written.
+    """
+    table = pa.concat_tables(tables, promote_options='permissive')
+    table = table.rename_columns([PART_COLUMN_MAPPING.get(c, c) for c in table.column_names])
+    journal_ids = sorted(str(j) for j in table['journal_id'].unique().to_pylist() if j is not None)
+    metadata = dict(table.schema.metadata or {})
+    metadata[PART_JOURNALS_KEY] = json.dumps(journal_ids).encode('utf-8')
+    metadata[b'download_date'] = datetime.datetime.now().isoformat().encode('utf-8')
+    pq.write_table(table.replace_schema_metadata(metadata), batch_path)
+    return table.num_rows
+
+
+def read_part_journal_ids(path):
+    """
+    Return the journal ids present in a partial works file using only its footer:
+    the ids stored by write_works_part, or row-group min/max statistics when every
+    row group holds a single journal. Falls back to reading the journal_id column.
+    """
+    pf = pq.ParquetFile(path)
+    md = pf.metadata
+    kv = md.metadata or {}
+    if PART_JOURNALS_KEY in kv:
+        return set(json.loads(kv[PART_JOURNALS_KEY]))
+    
+    col_idx = pf.schema_arrow.get_field_index('journal_id')
+    if col_idx < 0:
+        return set()
+    ids = set()
+    for i in range(md.num_row_groups):
+        stats = md.row_group(i).column(col_idx).statistics
+        if stats is None or not stats.has_min_max or stats.min != stats.max:
+            break
+        ids.add(stats.min)
+    else:
+        return ids
+    
+    return set(pf.read(columns=['journal_id'], use_threads=True).column('journal_id').unique().to_pylist())
 
 
 def update_data_from_postgres(update_journals=True, update_works=True):
@@ -415,9 +543,8 @@ def update_data_from_postgres(update_journals=True, update_works=True):
         part_files = list(PARTS_DIR.glob('*.parquet'))
         for f in part_files:
             try:
-                # Read only necessary column, very fast
-                ids_part = pd.read_parquet(f, columns=['journal_id'])['journal_id'].unique()
-                downloaded_journal_ids.update(ids_part)
+                # Footer only (metadata/statistics); decodes the column only as last resort
+                downloaded_journal_ids.update(read_part_journal_ids(f))
             except Exception:
                 continue
                 
@@ -437,68 +564,44 @@ def update_data_from_postgres(update_journals=True, update_works=True):
         conn = get_db_connection()
         
         try:
-            all_works = []
+            journal_names = dict(zip(journals_to_process['id'], journals_to_process['display_name']))
+            pending = []
+            pending_rows = 0
+            fetched_rows = 0
             batch_count = 0
             
-            for idx, journal in journals_to_process.iterrows():
-                print(f"[{idx+1}/{len(journals_to_process)}] {journal['display_name']} ({journal.get('country_code', 'UNKNOWN')})")
-                
+            def save_batch(tables, suffix):
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                batch_filename = f"batch_{timestamp}_{suffix}.parquet"
+                print(f"\n  → Saving batch {suffix} to {batch_filename}...")
                 try:
-                    works_df = fetch_works_for_journal(journal['id'], journal['display_name'], conn)
-                    
-                    if len(works_df) > 0:
-                        all_works.append(works_df)
+                    saved = write_works_part(tables, PARTS_DIR / batch_filename)
+                    print(f"  ✓ Saved {saved} works")
                 except Exception as e:
-                    print(f"  ❌ Error fetching works for {journal['display_name']}: {e}")
-                    # Continue to next journal
-                
-                # Save incrementally every 50 journals (larger batch is fine now since we don't read huge file)
-                # Or if list gets too big in memory
-                if len(all_works) >= 20:
-                    batch_count += 1
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    batch_filename = f"batch_{timestamp}_{batch_count}.parquet"
-                    batch_path = PARTS_DIR / batch_filename
-                    
-                    print(f"\n  → Saving batch {batch_count} to {batch_filename}...")
-                    try:
-                        batch_df = pd.concat(all_works, ignore_index=True)
-                        
-                        # Rename columns to match dashboard expectations
-                        column_mapping = {
-                            'citation_normalized_percentile': 'percentile',
-                            'is_in_top_1_percent': 'is_top_1',
-                            'is_in_top_10_percent': 'is_top_10'
-                        }
-                        batch_df = batch_df.rename(columns=column_mapping)
-                        
-                        batch_df.to_parquet(batch_path, index=False)
-                        print(f"  ✓ Saved {len(batch_df)} works")
-                        all_works = [] # Clear memory
-                    except Exception as e:
-                        print(f"  ❌ Error saving batch: {e}")
+                    print(f"  ❌ Error saving batch: {e}")
+            
+            # A single query for all pending journals, streamed in FETCH_ROWS batches
+            for works in iter_works_batches(list(journal_names), journal_names, conn):
+                pending.append(works)
+                pending_rows += works.num_rows
+                fetched_rows += works.num_rows
+                print(f"  Fetched {fetched_rows:,} works...")
                 
-                print()
+                if pending_rows >= PART_ROWS:
+                    # Rows arrive ordered by journal: the last journal may continue in the
+                    # next batch, so it stays pending (a part never holds half a journal)
+                    table = pa.concat_tables(pending, promote_options='permissive')
+                    is_last = pc.equal(table['journal_id'], table['journal_id'][-1])
+                    complete = table.filter(pc.invert(is_last))
+                    pending = [table.filter(is_last)]
+                    pending_rows = pending[0].num_rows
+                    if complete.num_rows > 0:
+                        batch_count += 1
+                        save_batch([complete], batch_count)
             
             # Save remaining works
-            if len(all_works) > 0:
-                print("\n→ Saving final batch...")
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                batch_filename = f"batch_{timestamp}_final.parquet"
-                batch_path = PARTS_DIR / batch_filename
-                
-                batch_df = pd.concat(all_works, ignore_index=True)
-                
-                # Rename columns to match dashboard expectations
-                column_mapping = {
-                    'citation_normalized_percentile': 'percentile',
-                    'is_in_top_1_percent': 'is_top_1',
-                    'is_in_top_10_percent': 'is_top_10'
-                }
-                batch_df = batch_df.rename(columns=column_mapping)
-                
-                batch_df.to_parquet(batch_path, index=False)
-                print(f"✓ Saved {len(batch_df)} works")
+            if pending_rows > 0:
+                save_batch(pending, 'final')
             
             print("\n" + "="*70)
             print("DATA UPDATE COMPLETE")
@@ -11,12 +11,31 @@ Trajectory Analysis Pipeline v2.0 (Multi-Map)
 """
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+import hashlib
 from pathlib import Path
 import logging
-from sklearn.preprocessing import StandardScaler
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import warnings
 
+# numba is optional (umap-learn already depends on it): native smoothing kernel
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:
+    numba = None
+    njit = None
+
+# threadpoolctl comes with scikit-learn: caps BLAS/OpenMP threads inside UMAP workers
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -45,83 +64,321 @@ DISPLAY_EXTRA_COLS = [
 
 MAP_COUNTRIES_FILE = CACHE_DIR / 'trajectory_countries_coords.parquet'
 MAP_JOURNALS_FILE = CACHE_DIR / 'trajectory_journals_coords.parquet'
+# Metadata kept next to the x/y coordinates in the map files
+COORDS_META_COLS = ['id', 'name', 'type', 'year', 'country_code']
+
+# UMAP embeddings keyed by a hash of their input rows + parameters
+EMBEDDING_CACHE_DIR = CACHE_DIR / 'trajectory_embeddings'
+EMBEDDING_CACHE_VERSION = 1
+
+# Rows per batch when streaming metrics_journal_annual.parquet
+JOURNAL_BATCH_ROWS = 200_000
+# Output files: one row group up to this size
+OUTPUT_ROW_GROUP_ROWS = 1_000_000
+# Minimum samples for a country context map
+MIN_COUNTRY_SAMPLES = 10
+# Parallel processes for the per-country UMAP fits
+UMAP_WORKERS = os.cpu_count() or 1
+
+def exponential_window(window_size, tau=1.0):
+    """
+    Returns (offsets, weights) of a centered exponential window, matching
+    pandas rolling(window_size, center=True, win_type='exponential').mean(tau=tau).
+    """
+    positions = np.arange(window_size)
+    weights = np.exp(-np.abs(positions - (window_size - 1) / 2) / tau)
+    # pandas centers the window so it ends (window_size - 1) // 2 rows after the label
+    offsets = positions - window_size // 2
+    return offsets, weights
+
+def window_table(window_sizes, tau=1.0):
+    """
+    Common offsets of several centered windows and a (n_windows, n_offsets)
+    weight table, zero where an offset is outside that window.
+    """
+    windows = [exponential_window(w, tau) for w in window_sizes]
+    offsets = np.arange(min(o[0] for o, _ in windows), max(o[-1] for o, _ in windows) + 1)
+    weights = np.zeros((len(windows), len(offsets)))
+    for wi, (o, w) in enumerate(windows):
+        weights[wi, o - offsets[0]] = w
+    return offsets, weights
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _smooth_groups(values, starts, ends, offsets, weights, out):
+        """
+        Native kernel: one prange task per group, centered windows clamped to the group.
+        Every window in the weight table is filled from the same neighbour reads.
+        """
+        n_windows = weights.shape[0]
+        n_cols = values.shape[1]
+        for g in prange(len(starts)):
+            start, end = starts[g], ends[g]
+            num = np.empty(n_windows)
+            den = np.empty(n_windows)
+            for i in range(start, end):
+                for c in range(n_cols):
+                    num[:] = 0.0
+                    den[:] = 0.0
+                    for k in range(len(offsets)):
+                        j = i + offsets[k]
+                        if j < start or j >= end:
+                            continue
+                        x = values[j, c]
+                        if x != x:  # skip NaN
+                            continue
+                        for wi in range(n_windows):
+                            w = weights[wi, k]
+                            if w > 0:
+                                num[wi] += w * x
+                                den[wi] += w
+                    for wi in range(n_windows):
+                        out[wi, i, c] = num[wi] / den[wi] if den[wi] > 0 else np.nan
+else:
+    _smooth_groups = None
+
+def smooth_sorted_values(values, starts, ends, window_sizes, tau=1.0):
+    """
+    Centered exponential weighted means over a (rows, cols) matrix sorted by group,
+    one (rows, cols) result per window size. Group g spans rows [starts[g], ends[g]).
+
+    All windows come out of a single pass: the numba kernel when available,
+    otherwise one shifted, masked multiply-add over the whole matrix per
+    offset, shared by every window that contains it.
+    Neighbours from another group and NaN values get no weight, and every
+    position is normalized by the weight it can actually see (min_periods=1).
+    """
+    n = len(values)
+    offsets, weights = window_table(window_sizes, tau)
+    if _smooth_groups is not None:
+        out = np.empty((len(window_sizes),) + values.shape)
+        _smooth_groups(values, starts, ends, offsets, weights, out)
+        return list(out)
+
+    group_codes = np.repeat(np.arange(len(starts)), ends - starts)
+    num = np.zeros((len(window_sizes),) + values.shape)
+    den = np.zeros((len(window_sizes),) + values.shape)
+    for ki, k in enumerate(offsets):
+        if abs(k) >= n:
+            continue
+        if k >= 0:
+            dst, src = slice(0, n - k), slice(k, n)
+        else:
+            dst, src = slice(-k, n), slice(0, n + k)
+        x = values[src]
+        visible = (group_codes[src] == group_codes[dst])[:, None] & ~np.isnan(x)
+        x = np.where(visible, x, 0.0)
+        for wi, w in enumerate(weights[:, ki]):
+            if w > 0:
+                num[wi, dst] += w * x
+                den[wi, dst] += w * visible
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return list(np.where(den > 0, num / den, np.nan))
+
+def prepare_smoothing(df, group_col, value_cols):
+    """Sorts by (group, year) and returns (sorted_df, starts, ends, values)."""
+    sorted_df = df.sort_values(by=[group_col, 'year'])
+    groups, _ = pd.factorize(sorted_df[group_col])
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], len(groups)]
+    values = np.ascontiguousarray(sorted_df[value_cols].to_numpy(dtype=np.float64))
+    return sorted_df, starts, ends, values
+
+def apply_smoothing_windows(df, group_col, value_cols, window_sizes):
+    """Smoothed copies of df for several window sizes, sharing one sort and one pass."""
+    if df.empty: return [df for _ in window_sizes]
+    sorted_df, starts, ends, values = prepare_smoothing(df, group_col, value_cols)
+    # Only the untouched columns are copied; each smoothed matrix becomes one block as-is
+    meta = sorted_df.drop(columns=value_cols)
+    results = []
+    for smoothed in smooth_sorted_values(values, starts, ends, window_sizes):
+        smoothed_df = pd.concat([meta, pd.DataFrame(smoothed, columns=value_cols, index=sorted_df.index)], axis=1)
+        if list(smoothed_df.columns) != list(sorted_df.columns):
+            smoothed_df = smoothed_df[sorted_df.columns]
+        results.append(smoothed_df)
+    return results
 
 def apply_smoothing(df, group_col, value_cols, window_size=3):
-    if df.empty: return df
-    df = df.sort_values(by=[group_col, 'year'])
-    smoothed_df = df.copy()
-    for col in value_cols:
-        try:
-            # win_type='exponential' requires scipy
-            smoothed_df[col] = df.groupby(group_col)[col].transform(
-                lambda x: x.rolling(window_size, min_periods=1, win_type='exponential', center=True).mean(tau=1)
-            )
-        except:
-            smoothed_df[col] = df.groupby(group_col)[col].transform(
-                lambda x: x.rolling(window_size, min_periods=1, center=True).mean()
-            )
-    return smoothed_df
-
-def run_umap_projection(df, metrics_cols, n_neighbors=15, min_dist=0.1):
+    return apply_smoothing_windows(df, group_col, value_cols, [window_size])[0]
+
+def embedding_cache_path(df, metrics_cols, **params):
+    """Cache file for an embedding: hash of (id, year, metrics) rows in order + the UMAP parameters."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((EMBEDDING_CACHE_VERSION, list(metrics_cols), sorted(params.items()))).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df[['id', 'year'] + list(metrics_cols)], index=False).to_numpy().tobytes())
+    return EMBEDDING_CACHE_DIR / f"{h.hexdigest()}.npy"
+
+def read_embedding_cache(cache_path, n_rows):
+    """Cached embedding, or None if missing, damaged or of the wrong shape."""
+    if cache_path is None or not cache_path.exists():
+        return None
     try:
-        import umap
-    except ImportError:
-        logger.error("❌ 'umap-learn' library not installed.")
+        embedding = np.load(cache_path)
+    except (OSError, ValueError):
         return None
+    return embedding if embedding.shape == (n_rows, 2) else None
 
-    # Filter data and fill NaN
-    data = df[metrics_cols].fillna(0)
+def write_embedding_cache(cache_path, embedding):
+    """Saves an embedding atomically (temp file + os.replace)."""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, embedding)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write embedding cache {cache_path}: {e}")
+
+def fit_umap_embedding(df, metrics_cols, n_neighbors=15, min_dist=0.1, use_gpu=False, use_cache=True):
+    """2-D UMAP embedding (float32 array, one row per df row), or None if it can't be computed."""
+    cache_path = None
+    if use_cache:
+        cache_path = embedding_cache_path(df, metrics_cols, n_neighbors=n_neighbors, min_dist=min_dist, use_gpu=use_gpu)
+        embedding = read_embedding_cache(cache_path, len(df))
+        if embedding is not None:
+            return embedding
+
+    umap_cls = None
+    umap_kwargs = {}
+    if use_gpu:
+        # RAPIDS cuML: k-NN graph and embedding optimization on the GPU
+        try:
+            from cuml.manifold import UMAP as umap_cls
+            umap_kwargs['output_type'] = 'numpy'
+        except ImportError:
+            logger.warning("⚠️ 'cuml' not installed, using umap-learn on CPU.")
+
+    if umap_cls is None:
+        try:
+            from umap import UMAP as umap_cls
+        except ImportError:
+            logger.error("❌ 'umap-learn' library not installed.")
+            return None
+
+    # Filter data and fill NaN, in a private writable array (no intermediate frame)
+    data = np.array(df[metrics_cols], dtype=np.float64)
+    data[np.isnan(data)] = 0.0
     
-    # Standardize
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(data)
+    # Standardize in place (z-score, constant columns left unscaled like StandardScaler)
+    std = data.std(axis=0)
+    std[np.ptp(data, axis=0) == 0] = 1.0
+    data -= data.mean(axis=0)
+    data /= std
+    # float32 is what the k-NN and layout work in: cast once here instead of inside UMAP
+    scaled_data = data.astype(np.float32)
     
     # UMAP
-    reducer = umap.UMAP(
+    reducer = umap_cls(
         n_neighbors=n_neighbors,
         min_dist=min_dist,
         n_components=2,
         metric='euclidean',
-        random_state=42
+        random_state=42,
+        **umap_kwargs
     )
     
     try:
-        embedding = reducer.fit_transform(scaled_data)
-        result_df = df.copy()
-        result_df['x'] = embedding[:, 0]
-        result_df['y'] = embedding[:, 1]
-        return result_df[['id', 'name', 'type', 'year', 'country_code', 'x', 'y']] # Keep metadata
+        embedding = reducer.fit_transform(scaled_data).astype(np.float32, copy=False)
+        if cache_path is not None:
+            write_embedding_cache(cache_path, embedding)
+        return embedding
     except Exception as e:
         logger.warning(f"UMAP failed: {e}")
         return None
 
+def run_umap_projection(df, metrics_cols, n_neighbors=15, min_dist=0.1, use_gpu=False, use_cache=True):
+    embedding = fit_umap_embedding(df, metrics_cols, n_neighbors=n_neighbors, min_dist=min_dist,
+                                   use_gpu=use_gpu, use_cache=use_cache)
+    if embedding is None:
+        return None
+    return df[COORDS_META_COLS].assign(x=embedding[:, 0], y=embedding[:, 1])
+
+_thread_limits = None
+
+def _init_umap_worker():
+    """Pins each worker to a single native thread so the processes don't oversubscribe the cores."""
+    global _thread_limits
+    if threadpool_limits is not None:
+        _thread_limits = threadpool_limits(limits=1)
+    if numba is not None:
+        numba.set_num_threads(1)
+
+def project_country(country, subset, use_gpu=False, use_cache=True):
+    """Country context map: its journals + the country itself. Returns only the embedding array."""
+    # The k-NN graph is built per country on purpose: each subset is standardized
+    # on its own, so neighbours from a global graph (other scaling, and mostly
+    # other countries' rows) would not be this map's neighbours. Subsets under
+    # 4096 rows get exact brute-force k-NN inside UMAP, which is cheap next to
+    # the layout epochs; with --shared-embedding there is a single graph anyway.
+    # Dynamic neighbors for local contexts
+    # If we have 100 journals * 10 years = 1000 points, n_neighbors=15 is fine.
+    # If we have 2 journals * 10 years = 20 points, n_neighbors=15 is fine.
+    n_neighbors = min(15, len(subset) - 1)
+    if n_neighbors < 2: n_neighbors = 2
+
+    return fit_umap_embedding(subset, METRICS_COLS_JOURNAL, n_neighbors=n_neighbors,
+                              use_gpu=use_gpu, use_cache=use_cache)
+
+def read_parquet_columns(path, columns):
+    """Reads only the requested columns that exist in the file (the rest are never decoded)."""
+    available = set(pq.read_schema(path).names)
+    return pq.read_table(path, columns=[c for c in columns if c in available]).to_pandas()
+
+def write_parquet(df, path):
+    """Writes an output table as contiguous zstd row groups with dictionaries and page index."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Categorical columns are written as plain strings for the dashboard readers
+    # (the parquet pages are dictionary-encoded either way)
+    fields = [f.with_type(f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    table = table.cast(pa.schema(fields, metadata=table.schema.metadata)).combine_chunks()
+    pq.write_table(
+        table, path,
+        compression='zstd',
+        compression_level=3,
+        use_dictionary=True,
+        write_page_index=True,
+        row_group_size=OUTPUT_ROW_GROUP_ROWS
+    )
+
 def load_and_prep_data():
+    data_cols = ALL_METRICS_COLS + DISPLAY_EXTRA_COLS
+
     # 1. Journals
     j_path = CACHE_DIR / 'metrics_journal_annual.parquet'
     if not j_path.exists(): return None
     
-    df_j = pd.read_parquet(j_path)
-    # Load metadata with country_code
+    # Load metadata with country_code (small, read once)
     j_meta_path = CACHE_DIR.parent / 'latin_american_journals.parquet'
+    journals_meta = None
     if j_meta_path.exists():
-        meta = pd.read_parquet(j_meta_path)
+        meta = read_parquet_columns(j_meta_path, ['id', 'display_name', 'country_code'])
         # Check if country_code exists
         cols_to_use = ['id', 'display_name']
         if 'country_code' in meta.columns:
             cols_to_use.append('country_code')
             
-        journals_meta = meta[cols_to_use]
-        
-        # Merge
-        df_j = df_j.merge(journals_meta, left_on='journal_id', right_on='id', how='left', suffixes=('', '_meta'))
-        
-        # Cleanup ID column collision
-        if 'id_meta' in df_j.columns:
-            df_j = df_j.drop(columns=['id_meta'])
-        if 'id' in df_j.columns and 'journal_id' in df_j.columns:
-             # If 'id' came from somewhere else and conflicts
-             df_j = df_j.drop(columns=['id'])
-             
+        # Unique ids: each journal-year row takes at most one metadata row
+        journals_meta = meta[cols_to_use].drop_duplicates('id')
+        meta_index = pd.Index(journals_meta['id'])
+
+    # Stream the journal metrics in batches and join the metadata per batch,
+    # so the joined copies never cover the whole file at once
+    pf = pq.ParquetFile(j_path)
+    j_cols = [c for c in ['journal_id', 'year'] + data_cols if c in pf.schema_arrow.names]
+    pieces = []
+    for batch in pf.iter_batches(batch_size=JOURNAL_BATCH_ROWS, columns=j_cols):
+        piece = batch.to_pandas()
+        if journals_meta is not None:
+            # Left join by position in the metadata index (hashed once); -1 = no metadata
+            pos = meta_index.get_indexer(piece['journal_id'])
+            for c in cols_to_use[1:]:
+                piece[c] = journals_meta[c].array.take(pos, allow_fill=True)
+        pieces.append(piece)
+    if not pieces:
+        pieces.append(pf.schema_arrow.empty_table().select(j_cols).to_pandas())
+    df_j = pd.concat(pieces, ignore_index=True)
+    del pieces
+
+    if journals_meta is not None:
         df_j['type'] = 'journal'
         df_j = df_j.rename(columns={'journal_id': 'id', 'display_name': 'name'})
         
@@ -137,7 +394,7 @@ def load_and_prep_data():
     # 2. Countries
     c_path = CACHE_DIR / 'metrics_country_annual.parquet'
     if c_path.exists():
-        df_c = pd.read_parquet(c_path)
+        df_c = read_parquet_columns(c_path, ['country_code', 'year'] + data_cols)
         df_c['type'] = 'country'
         df_c['name'] = df_c['country_code']
         df_c = df_c.rename(columns={'country_code': 'id'})
@@ -148,7 +405,7 @@ def load_and_prep_data():
     # 3. LATAM
     l_path = CACHE_DIR / 'metrics_latam_annual.parquet'
     if l_path.exists():
-        df_l = pd.read_parquet(l_path)
+        df_l = read_parquet_columns(l_path, ['year'] + data_cols)
         df_l['type'] = 'region'
         df_l['id'] = 'LATAM'
         df_l['name'] = 'Iberoamérica'
@@ -161,17 +418,20 @@ def load_and_prep_data():
     if combined.empty: return None
 
     # Keep necessary cols: metadata + UMAP metrics + display-only indicators
-    all_data_cols = ALL_METRICS_COLS + DISPLAY_EXTRA_COLS
-    keep_cols = ['id', 'name', 'type', 'year', 'country_code'] + all_data_cols
+    keep_cols = ['id', 'name', 'type', 'year', 'country_code'] + data_cols
     
     # Fill missing cols with 0 for numerics, '' for strings
     for c in keep_cols:
         if c not in combined.columns:
-            combined[c] = 0 if c in all_data_cols else ''
-            
-    return combined[keep_cols]
+            combined[c] = 0 if c in data_cols else ''
+
+    combined = combined[keep_cols]
+    # Integer codes instead of strings for the sorts and groupbys that follow
+    for c in ['id', 'name', 'type', 'country_code']:
+        combined[c] = combined[c].astype('category')
+    return combined
 
-def main():
+def main(workers=UMAP_WORKERS, use_gpu=False, use_cache=True, shared_embedding=False):
     if not CACHE_DIR.exists(): return
     logger.info("Loading metrics data...")
     raw_data = load_and_prep_data()
@@ -179,69 +439,121 @@ def main():
         logger.error("No data found.")
         return
 
-    # Apply Smoothing (Window 3) — smooth all UMAP + display metrics
-    logger.info("Applying Smoothing (Window=3)...")
-    smoothed = apply_smoothing(raw_data, 'id', ALL_METRICS_COLS + DISPLAY_EXTRA_COLS, window_size=3)
-    
-    # Apply Smoothing (Window 5) - For heavy smoothing tab
-    logger.info("Applying Smoothing (Window=5)...")
-    smoothed_w5 = apply_smoothing(raw_data, 'id', ALL_METRICS_COLS + DISPLAY_EXTRA_COLS, window_size=5)
+    # Apply Smoothing (Window 3 + Window 5 for the heavy smoothing tab) — smooth
+    # all UMAP + display metrics; both windows share the sort and a single pass
+    logger.info("Applying Smoothing (Window=3, Window=5)...")
+    smoothed, smoothed_w5 = apply_smoothing_windows(raw_data, 'id', ALL_METRICS_COLS + DISPLAY_EXTRA_COLS, [3, 5])
     
     # Save base data tables for Dashboard
-    raw_data.to_parquet(CACHE_DIR / 'trajectory_data_raw.parquet', index=False)
-    smoothed.to_parquet(CACHE_DIR / 'trajectory_data_smoothed.parquet', index=False)
-    smoothed_w5.to_parquet(CACHE_DIR / 'trajectory_data_smoothed_w5.parquet', index=False)
+    write_parquet(raw_data, CACHE_DIR / 'trajectory_data_raw.parquet')
+    write_parquet(smoothed, CACHE_DIR / 'trajectory_data_smoothed.parquet')
+    write_parquet(smoothed_w5, CACHE_DIR / 'trajectory_data_smoothed_w5.parquet')
     
     # Remove rows with NaN metrics for UMAP
-    valid_data = smoothed.dropna(subset=ALL_METRICS_COLS).copy()
+    # (read-only from here on: subsets are taken by position, no copy needed)
+    valid_data = smoothed.dropna(subset=ALL_METRICS_COLS)
+    # Row positions per type, from a single pass over the column
+    type_rows = valid_data.groupby('type', sort=False, observed=True).indices
+    no_rows = np.empty(0, dtype=np.intp)
+    country_rows = type_rows.get('country', no_rows)
+    region_rows = type_rows.get('region', no_rows)
     
     # --- Map 1: Global Countries ---
     logger.info("Generating Global Countries Map (Countries + LATAM)...")
-    countries_data = valid_data[valid_data['type'].isin(['country', 'region'])].copy()
+    # Sorted positions keep the original row order (it determines the UMAP layout)
+    countries_data = valid_data.iloc[np.sort(np.concatenate([country_rows, region_rows]))]
     
     if len(countries_data) > 10:
         # Lower neighbors since we have fewer points (~35 countries * ~15 years = ~500 points)
         # Actually each year is a point.
         n_neighbors = min(30, len(countries_data) - 1)
-        coords_countries = run_umap_projection(countries_data, METRICS_COLS_COUNTRY, n_neighbors=n_neighbors)
+        coords_countries = run_umap_projection(countries_data, METRICS_COLS_COUNTRY, n_neighbors=n_neighbors,
+                                               use_gpu=use_gpu, use_cache=use_cache)
         if coords_countries is not None:
-            coords_countries.to_parquet(MAP_COUNTRIES_FILE, index=False)
+            write_parquet(coords_countries, MAP_COUNTRIES_FILE)
             logger.info(f"Saved Global Countries Map to {MAP_COUNTRIES_FILE}")
 
     # --- Map 2: Journals by Country ---
     logger.info("Generating Maps by Country...")
-    all_journal_coords = []
-    
+
     # Iterate over each country
-    countries = valid_data[valid_data['type'] == 'country']['id'].unique()
-    
+    countries = valid_data['id'].iloc[country_rows].unique()
+
+    # Subset: Journals of this country + The Country itself
+    # Note: 'country_code' for the country row is equal to its ID (e.g. 'BR')
+    # 'country_code' for journals is e.g. 'BR'.
+    # One grouping pass over country_code gives the row positions of every subset
+    positions = valid_data.groupby('country_code', sort=False, observed=True).indices
+    subset_rows = {}
+    subsets = {}
     for country in countries:
-        # Subset: Journals of this country + The Country itself
-        # Note: 'country_code' for the country row is equal to its ID (e.g. 'BR')
-        # 'country_code' for journals is e.g. 'BR'.
-        mask = (valid_data['country_code'] == country)
-        subset = valid_data[mask].copy()
-        
-        if len(subset) < 10:
+        rows = positions.get(country)
+        if rows is None or len(rows) < MIN_COUNTRY_SAMPLES:
             continue # Skip countries with not enough data
-            
-        # Dynamic neighbors for local contexts
-        # If we have 100 journals * 10 years = 1000 points, n_neighbors=15 is fine.
-        # If we have 2 journals * 10 years = 20 points, n_neighbors=15 is fine.
-        n_neighbors = min(15, len(subset) - 1)
-        if n_neighbors < 2: n_neighbors = 2
-        
-        logger.info(f"Projecting {country} ({len(subset)} samples)...")
-        coords = run_umap_projection(subset, METRICS_COLS_JOURNAL, n_neighbors=n_neighbors)
-        
-        if coords is not None:
-            coords['map_context'] = country
-            all_journal_coords.append(coords)
+        subset_rows[country] = rows
+        # Workers only need what the embedding (and its cache key) reads
+        subsets[country] = valid_data[['id', 'year'] + METRICS_COLS_JOURNAL].iloc[rows]
+
+    # Each fit is independent: one process per country, largest first so the
+    # long fits don't end up at the tail. On GPU they run in this process
+    # (a single device; each worker would open its own CUDA context).
+    results = {}
+    if shared_embedding and subsets:
+        # One fit over the journals of every country: all maps share the same
+        # space, and each country's map is its rows of that embedding
+        all_rows = np.sort(np.concatenate(list(subset_rows.values())))
+        logger.info(f"Projecting {len(subsets)} countries in a shared embedding ({len(all_rows)} samples)...")
+        embedding = fit_umap_embedding(valid_data[['id', 'year'] + METRICS_COLS_JOURNAL].iloc[all_rows],
+                                       METRICS_COLS_JOURNAL, n_neighbors=min(15, len(all_rows) - 1),
+                                       use_gpu=use_gpu, use_cache=use_cache)
+        for country, rows in subset_rows.items():
+            results[country] = None if embedding is None else embedding[np.searchsorted(all_rows, rows)]
+    elif use_gpu or workers <= 1 or len(subsets) <= 1:
+        for country, subset in subsets.items():
+            logger.info(f"Projecting {country} ({len(subset)} samples)...")
+            results[country] = project_country(country, subset, use_gpu=use_gpu, use_cache=use_cache)
+    else:
+        logger.info(f"Projecting {len(subsets)} countries with {workers} workers...")
+        # spawn, not fork: the parent already started numba/OpenMP thread pools
+        # and forking them leaves the process hanging at exit
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(subsets)), mp_context=ctx,
+                                 initializer=_init_umap_worker) as executor:
+            futures = {
+                executor.submit(project_country, country, subsets[country], use_cache=use_cache): country
+                for country in sorted(subsets, key=lambda c: len(subsets[c]), reverse=True)
+            }
+            for future in as_completed(futures):
+                country = futures[future]
+                results[country] = future.result()
+                logger.info(f"Projected {country} ({len(subsets[country])} samples)")
+
+    # Same order as the sequential loop; the frame is built once from the
+    # collected row positions and embedding arrays
+    projected = [c for c in subsets if results[c] is not None]
     
-    if all_journal_coords:
-        final_df = pd.concat(all_journal_coords)
-        final_df.to_parquet(MAP_JOURNALS_FILE, index=False)
+    if projected:
+        embedding = np.concatenate([results[c] for c in projected])
+        final_df = valid_data[COORDS_META_COLS].iloc[np.concatenate([subset_rows[c] for c in projected])]
+        final_df = final_df.reset_index(drop=True).assign(
+            x=embedding[:, 0],
+            y=embedding[:, 1],
+            map_context=np.repeat(projected, [len(subset_rows[c]) for c in projected])
+        )
+        write_parquet(final_df, MAP_JOURNALS_FILE)
         logger.info(f"Saved Journal Context Maps to {MAP_JOURNALS_FILE}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Trajectory smoothing and UMAP maps')
+    parser.add_argument('--workers', type=int, default=UMAP_WORKERS,
+                        help=f'Parallel processes for the per-country maps (default: {UMAP_WORKERS})')
+    parser.add_argument('--gpu', action='store_true',
+                        help='Fit UMAP on the GPU with RAPIDS cuML (falls back to umap-learn if missing)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Refit every UMAP instead of reusing embeddings from {EMBEDDING_CACHE_DIR}')
+    parser.add_argument('--shared-embedding', action='store_true',
+                        help='Fit one UMAP over all countries\' journals and cut each country map from it '
+                             '(default: an independent fit per country)')
+    args = parser.parse_args()
+    main(workers=args.workers, use_gpu=args.gpu, use_cache=not args.no_cache,
+         shared_embedding=args.shared_embedding)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
-Optimized parallelized metrics precalculation script.
-Uses chunked processing to avoid memory exhaustion.
+Optimized metrics precalculation script.
+All levels (LATAM, country, journal) are rolled up from a single pass of
+per-journal, per-year sums over the works.
 Supports incremental processing to skip already computed metrics.
 """
 import sys
@@ -9,303 +10,467 @@ import os
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from multiprocessing import Pool, cpu_count
+import pyarrow as pa
+import pyarrow.parquet as pq
+from multiprocessing import cpu_count
 import time
 import argparse
 
+# numba is optional (umap-learn already depends on it): native metrics kernel
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:
+    numba = None
+    njit = None
+
+# DuckDB is optional: multithreaded GROUP BY streamed straight from the parquet file
+# (without it the works are loaded into pandas and aggregated by the kernel)
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
 # Add src to path
 sys.path.append(str(Path(__file__).parent.parent / 'src'))
 
 from performance_metrics import (
     get_cache_dir,
-    get_year_range,
-    safe_get
+    get_year_range
 )
 
-# Global variables for worker processes (loaded once per process)
-_works_df = None
-_journals_df = None
-_start_year = None
-_end_year = None
+# Journal indexing flags: output name -> candidate columns in the journals file
+INDEXING_COLUMNS = {
+    'scopus': ('is_indexed_in_scopus', 'is_scopus'),
+    'core': ('is_core',),
+    'doaj': ('is_in_doaj',),
+}
 
-def init_worker(works_file, journals_file, start_year, end_year):
-    """Initialize worker process with data (loaded once per worker)."""
-    global _works_df, _journals_df, _start_year, _end_year
-    _works_df = pd.read_parquet(works_file)
-    _journals_df = pd.read_parquet(journals_file)
-    _start_year = start_year
-    _end_year = end_year
+# Only these columns are read from the input files (missing ones are skipped)
+WORKS_COLS = [
+    'journal_id', 'publication_year', 'fwci', 'citation_normalized_percentile',
+    'is_in_top_10_percent', 'is_in_top_1_percent', 'oa_status', 'language'
+]
+JOURNAL_COLS = ['id', 'country_code'] + [col for cols in INDEXING_COLUMNS.values() for col in cols]
 
-def calculate_performance_metrics_from_df(works_df):
+# OA types reported as pct_oa_<type> (any other status only counts in the denominator)
+OA_TYPES = ['gold', 'diamond', 'green', 'hybrid', 'bronze', 'closed']
+# Languages reported as pct_lang_<code>; everything else (missing included) is pct_lang_other
+LANGUAGES = ['en', 'fr', 'de', 'it', 'la', 'nd', 'pt', 'ru', 'es']
+
+# Journals per batch (and parquet row group) of the streamed journal annual metrics
+JOURNAL_BATCH = 1000
+
+def read_parquet(path, columns=None):
     """
-    Calculate performance metrics from a DataFrame (in-memory version).
-    Matches the logic from performance_metrics.py MetricsAccumulator.
+    Reads a parquet file with pyarrow, decoding column chunks in parallel with coalesced reads.
+    With `columns`, only those present in the file are decoded.
     """
-    if len(works_df) == 0:
-        return {
-            'num_documents': 0,
-            'fwci_avg': 0.0,
-            'pct_top_10': 0.0,
-            'pct_top_1': 0.0,
-            'avg_percentile': 0.0,
-            'pct_oa_gold': 0.0,
-            'pct_oa_diamond': 0.0,
-            'pct_oa_green': 0.0,
-            'pct_oa_hybrid': 0.0,
-            'pct_oa_bronze': 0.0,
-            'pct_oa_closed': 0.0
-        }
-    
-    num_documents = len(works_df)
-    
-    # FWCI average - convert to numeric, fillna(0), then calculate mean
-    # This matches MetricsAccumulator logic: sum(fillna(0)) / count
-    if 'fwci' in works_df.columns:
-        fwci_values = pd.to_numeric(works_df['fwci'], errors='coerce').fillna(0)
-        fwci_avg = fwci_values.sum() / num_documents
-    else:
-        fwci_avg = 0.0
-    
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [c for c in columns if c in available]
+    return pd.read_parquet(path, engine='pyarrow', columns=columns, use_threads=True, pre_buffer=True)
+
+def group_by_journal(works_df):
+    """
+    Sorts works by journal_id (stable) so each journal's works are one contiguous block.
+    Returns the sorted frame, the journal id of each block (NaN for works without journal)
+    and the block bounds: rows starts[g]:ends[g] belong to journal_ids[g].
+    """
+    works_df = works_df.sort_values('journal_id', kind='stable', na_position='last', ignore_index=True)
+    # Codes follow the sorted order, so each journal's code range is found by binary search
+    codes, journal_ids = pd.factorize(works_df['journal_id'], use_na_sentinel=False)
+    blocks = np.arange(len(journal_ids))
+    starts = np.searchsorted(codes, blocks, side='left')
+    ends = np.searchsorted(codes, blocks, side='right')
+    return works_df, pd.Index(journal_ids), starts, ends
+
+def prepare_works(works_df):
+    """
+    Coerce the metric columns once at load time, so the metric functions can sum them directly:
+    fwci / citation_normalized_percentile -> float64 (NaN = 0), top-10/top-1 flags -> uint8,
+    oa_status / language -> category.
+    The percentiles stay float64: in float32 a stored 0.9 becomes 0.89999998 and would
+    miss the >= 0.90 top-10% cut-off.
+    """
+    for col in ('fwci', 'citation_normalized_percentile'):
+        if col in works_df.columns:
+            works_df[col] = pd.to_numeric(works_df[col], errors='coerce').fillna(0).astype(np.float64)
+    for col in ('is_in_top_10_percent', 'is_in_top_1_percent'):
+        if col in works_df.columns:
+            works_df[col] = works_df[col].fillna(False).astype(bool).astype(np.uint8)
+    for col in ('oa_status', 'language'):
+        if col in works_df.columns:
+            works_df[col] = works_df[col].astype('category')
+    return works_df
+
+def label_index(values, labels):
+    """
+    Position of each value in `labels` (e.g. OA_TYPES), from the categorical codes
+    (len(labels) for missing or unlisted values).
+    """
+    values = values.astype('category')
+    categories = values.cat.categories
+    lookup = np.full(len(categories) + 1, len(labels), dtype=np.intp)
+    for i, label in enumerate(labels):
+        if label in categories:
+            lookup[categories.get_loc(label)] = i
+    # Missing values have code -1, which picks the last lookup slot
+    return lookup[values.cat.codes.to_numpy()]
+
+def flag_values(df, columns):
+    """Boolean array from the first of `columns` present in df (missing column or NaN = False)."""
+    for col in columns:
+        if col in df.columns:
+            return df[col].fillna(False).astype(bool).to_numpy()
+    return np.zeros(len(df), dtype=bool)
+
+def journal_indexing_metrics(journals_df):
+    """Number of journals and % indexed in Scopus / core / DOAJ, vectorized over the columns."""
+    num_journals = len(journals_df)
+    metrics = {'num_journals': num_journals}
+    for name, columns in INDEXING_COLUMNS.items():
+        pct = (flag_values(journals_df, columns).sum() / num_journals) * 100 if num_journals else 0.0
+        metrics[f'pct_{name}'] = round(pct, 6)
+    return metrics
+
+def metric_columns(works_df):
+    """
+    Arrays fed to the sums kernels: fwci, percentiles, top-10 / top-1 flags, OA bin and
+    language bin (missing columns contribute zeros; works without a listed OA type or
+    language go to the last bin).
+    """
+    n = len(works_df)
+
+    def column(col, dtype):
+        return works_df[col].to_numpy() if col in works_df.columns else np.zeros(n, dtype=dtype)
+
+    def bins(col, labels):
+        if col in works_df.columns:
+            return label_index(works_df[col], labels)
+        return np.full(n, len(labels), dtype=np.intp)
+
+    return (
+        column('fwci', np.float64),
+        column('citation_normalized_percentile', np.float64),
+        column('is_in_top_10_percent', np.uint8),
+        column('is_in_top_1_percent', np.uint8),
+        bins('oa_status', OA_TYPES),
+        bins('language', LANGUAGES),
+    )
+
+# Per-year accumulator columns of the sums kernels, followed by one column per OA bin
+# and one per language bin (the last bin of each holds missing / unlisted values)
+ANNUAL_N, ANNUAL_FWCI, ANNUAL_PCT = 0, 1, 2
+ANNUAL_N_090, ANNUAL_N_099, ANNUAL_N_90, ANNUAL_N_99 = 3, 4, 5, 6
+ANNUAL_TOP_10, ANNUAL_TOP_1 = 7, 8
+ANNUAL_OA = 9
+ANNUAL_LANG = ANNUAL_OA + len(OA_TYPES) + 1
+ANNUAL_FIELDS = ANNUAL_LANG + len(LANGUAGES) + 1
+
+def _group_year_sums_numpy(starts, ends, year_idx, n_years, fwci, percentiles, top_10, top_1, oa_idx, lang_idx):
+    """NumPy version of _group_year_sums_kernel, built from bincounts over (group, year) cells."""
+    n_groups = len(starts)
+    n_cells = n_groups * n_years
+    # The blocks cover every row in order, so each row's group is a plain repeat
+    group = np.repeat(np.arange(n_groups), ends - starts)
+    valid = (year_idx >= 0) & (year_idx < n_years)
+    cell = (group * n_years + year_idx)[valid]
+    pct = percentiles[valid]
+
+    def cell_sum(values):
+        return np.bincount(cell, weights=values, minlength=n_cells)
+
+    def cell_bins(idx, n_bins):
+        return np.bincount(cell * n_bins + idx[valid], minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+
+    sums = np.zeros((n_cells, ANNUAL_FIELDS))
+    sums[:, ANNUAL_N] = np.bincount(cell, minlength=n_cells)
+    sums[:, ANNUAL_FWCI] = cell_sum(fwci[valid])
+    sums[:, ANNUAL_PCT] = cell_sum(pct)
+    sums[:, ANNUAL_N_090] = cell_sum(pct >= 0.90)
+    sums[:, ANNUAL_N_099] = cell_sum(pct >= 0.99)
+    sums[:, ANNUAL_N_90] = cell_sum(pct >= 90.0)
+    sums[:, ANNUAL_N_99] = cell_sum(pct >= 99.0)
+    sums[:, ANNUAL_TOP_10] = cell_sum(top_10[valid])
+    sums[:, ANNUAL_TOP_1] = cell_sum(top_1[valid])
+    sums[:, ANNUAL_OA:ANNUAL_LANG] = cell_bins(oa_idx, ANNUAL_LANG - ANNUAL_OA)
+    sums[:, ANNUAL_LANG:] = cell_bins(lang_idx, ANNUAL_FIELDS - ANNUAL_LANG)
+
+    year_max = np.full(n_cells, -np.inf)
+    np.maximum.at(year_max, cell, pct)
+    return sums.reshape(n_groups, n_years, ANNUAL_FIELDS), year_max.reshape(n_groups, n_years)
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _group_year_sums_kernel(starts, ends, year_idx, n_years, fwci, percentiles, top_10, top_1, oa_idx, lang_idx):
+        """
+        Native kernel: (n_groups, n_years, ANNUAL_FIELDS) sums and per-year percentile max
+        of each group of rows starts[g]:ends[g]. Groups are prange tasks that only write
+        their own slab (no shared writes). year_idx < 0 = out of range.
+        Percentile thresholds are counted on both scales, the max decides which one applies.
+        """
+        n_groups = len(starts)
+        sums = np.zeros((n_groups, n_years, ANNUAL_FIELDS))
+        year_max = np.full((n_groups, n_years), -np.inf)
+        for g in prange(n_groups):
+            for i in range(starts[g], ends[g]):
+                y = year_idx[i]
+                if y < 0 or y >= n_years:
+                    continue
+                row = sums[g, y]
+                p = percentiles[i]
+                row[ANNUAL_N] += 1
+                row[ANNUAL_FWCI] += fwci[i]
+                row[ANNUAL_PCT] += p
+                if p > year_max[g, y]:
+                    year_max[g, y] = p
+                if p >= 0.90:
+                    row[ANNUAL_N_090] += 1
+                if p >= 0.99:
+                    row[ANNUAL_N_099] += 1
+                if p >= 90.0:
+                    row[ANNUAL_N_90] += 1
+                if p >= 99.0:
+                    row[ANNUAL_N_99] += 1
+                row[ANNUAL_TOP_10] += top_10[i]
+                row[ANNUAL_TOP_1] += top_1[i]
+                row[ANNUAL_OA + oa_idx[i]] += 1
+                row[ANNUAL_LANG + lang_idx[i]] += 1
+        return sums, year_max
+else:
+    _group_year_sums_kernel = _group_year_sums_numpy
+
+def year_index(works_df, start_year):
+    """Offset of each work's publication year from start_year (-1 for works without year)."""
+    years = works_df['publication_year'].to_numpy(dtype=np.float64)
+    return np.where(np.isnan(years), -1, years - start_year).astype(np.int64)
+
+def group_year_sums(works_df, starts, ends, year_idx, n_years):
+    """
+    Per-(group, year) sums (see ANNUAL_*) and percentile max in a single pass over the works.
+    Group g is the block of rows starts[g]:ends[g]; the blocks must cover every row, in order.
+    """
+    return _group_year_sums_kernel(starts, ends, year_idx, n_years, *metric_columns(works_df))
+
+def rollup(sums, year_max, target, n_targets):
+    """
+    Adds up group sums into n_targets groups (group g goes to target[g], -1 = dropped);
+    the percentile max of the merged groups is their max.
+    """
+    keep = target >= 0
+    out = np.zeros((n_targets,) + sums.shape[1:])
+    out_max = np.full((n_targets,) + year_max.shape[1:], -np.inf)
+    np.add.at(out, target[keep], sums[keep])
+    np.maximum.at(out_max, target[keep], year_max[keep])
+    return out, out_max
+
+# Metric columns derived from the sums (after num_documents), in output order
+RATIO_COLUMNS = (
+    ['fwci_avg', 'pct_top_10', 'pct_top_1', 'avg_percentile']
+    + [f'pct_oa_{oa_type}' for oa_type in OA_TYPES]
+    + [f'pct_lang_{lang}' for lang in LANGUAGES + ['other']]
+)
+RATIO_OA = 4
+RATIO_LANG = RATIO_OA + len(OA_TYPES)
+# Metrics are kept at full precision and rounded once, when written (save_metrics)
+OUTPUT_DECIMALS = 6
+
+def metrics_from_sums(columns, sums, pct_max):
+    """
+    Metrics DataFrame (same definitions as calculate_performance_metrics_from_df) with one
+    row per row of accumulated sums; `columns` are the works columns, to apply the same
+    fallbacks. Rows without works get zeros.
+    The ratios are written into one preallocated float block, wrapped without copying.
+    """
+    n = sums[:, ANNUAL_N]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_n = np.where(n > 0, 1.0 / n, 0.0)
+    pct_n = (inv_n * 100)[:, None]
+
+    block = np.zeros((len(n), len(RATIO_COLUMNS)))
+
+    # FWCI average: sum(fillna(0)) / count
+    np.multiply(sums[:, ANNUAL_FWCI], inv_n, out=block[:, 0])
+
     # % Metrics based on Citation Percentiles (Top 10%, Top 1%, Avg)
     # We prioritize 'citation_normalized_percentile' because 'is_in_top_10_percent' boolean cols are often all False.
-    pct_top_10 = 0.0
-    pct_top_1 = 0.0
-    avg_percentile = 0.0
+    if 'citation_normalized_percentile' in columns:
+        # Detect scale per row: if max value > 1.0, assume 0-100 scale. Otherwise 0-1.
+        is_scale_100 = pct_max > 1.0
+        count_10 = np.where(is_scale_100, sums[:, ANNUAL_N_90], sums[:, ANNUAL_N_090])
+        count_1 = np.where(is_scale_100, sums[:, ANNUAL_N_99], sums[:, ANNUAL_N_099])
+
+        block[:, 1] = count_10 * inv_n * 100
+        block[:, 2] = count_1 * inv_n * 100
 
-    if 'citation_normalized_percentile' in works_df.columns:
-        # Convert to numeric, handle errors
-        percentiles = pd.to_numeric(works_df['citation_normalized_percentile'], errors='coerce').fillna(0)
-        
-        # Detect scale (0-1 vs 0-100)
-        # If max value > 1.0, assume 0-100 scale. Otherwise 0-1.
-        is_scale_100 = percentiles.max() > 1.0
-        
-        # Thresholds
-        thresh_10 = 90.0 if is_scale_100 else 0.90
-        thresh_1 = 99.0 if is_scale_100 else 0.99
-        
-        pct_top_10 = ((percentiles >= thresh_10).sum() / num_documents) * 100
-        pct_top_1 = ((percentiles >= thresh_1).sum() / num_documents) * 100
-        
         # Average Percentile (Force 0-100 scale for consistency)
-        avg_val = percentiles.mean()
-        avg_percentile = avg_val if is_scale_100 else (avg_val * 100)
-        
-    elif 'is_in_top_10_percent' in works_df.columns:
+        block[:, 3] = sums[:, ANNUAL_PCT] * inv_n * np.where(is_scale_100, 1.0, 100.0)
+
+    elif 'is_in_top_10_percent' in columns:
         # Fallback to boolean columns
-        top_10_values = works_df['is_in_top_10_percent'].fillna(False).astype(bool)
-        pct_top_10 = (top_10_values.sum() / num_documents) * 100
-        
-        if 'is_in_top_1_percent' in works_df.columns:
-            top_1_values = works_df['is_in_top_1_percent'].fillna(False).astype(bool)
-            pct_top_1 = (top_1_values.sum() / num_documents) * 100
-    
-    # OA percentages by type
-    if 'oa_status' in works_df.columns and num_documents > 0:
-        oa_counts = works_df['oa_status'].value_counts()
-        
-        oa_types = {
-            'pct_oa_gold': (oa_counts.get('gold', 0) / num_documents) * 100,
-            'pct_oa_diamond': (oa_counts.get('diamond', 0) / num_documents) * 100,
-            'pct_oa_green': (oa_counts.get('green', 0) / num_documents) * 100,
-            'pct_oa_hybrid': (oa_counts.get('hybrid', 0) / num_documents) * 100,
-            'pct_oa_bronze': (oa_counts.get('bronze', 0) / num_documents) * 100,
-            'pct_oa_closed': (oa_counts.get('closed', 0) / num_documents) * 100
-        }
-    else:
-        oa_types = {
-            'pct_oa_gold': 0.0,
-            'pct_oa_diamond': 0.0,
-            'pct_oa_green': 0.0,
-            'pct_oa_hybrid': 0.0,
-            'pct_oa_bronze': 0.0,
-            'pct_oa_closed': 0.0
-        }
+        block[:, 1] = sums[:, ANNUAL_TOP_10] * inv_n * 100
+        block[:, 2] = sums[:, ANNUAL_TOP_1] * inv_n * 100
 
-    # Language percentages
-    target_langs = ['en', 'fr', 'de', 'it', 'la', 'nd', 'pt', 'ru', 'es']
-    lang_pcts = {f'pct_lang_{l}': 0.0 for l in target_langs + ['other']}
-    
-    if 'language' in works_df.columns and num_documents > 0:
-        lang_counts = works_df['language'].fillna('unknown').value_counts()
-        for lang in target_langs:
-            lang_pcts[f'pct_lang_{lang}'] = (lang_counts.get(lang, 0) / num_documents) * 100
-            
-        other_count = lang_counts[~lang_counts.index.isin(target_langs)].sum()
-        lang_pcts['pct_lang_other'] = (other_count / num_documents) * 100
-    
-    metrics = {
-        'num_documents': num_documents,
-        'fwci_avg': round(fwci_avg, 6),
-        'pct_top_10': round(pct_top_10, 6),
-        'pct_top_1': round(pct_top_1, 6),
-        'avg_percentile': round(avg_percentile, 6)
-    }
-    
-    metrics.update({k: round(v, 6) for k, v in oa_types.items()})
-    metrics.update({k: round(v, 6) for k, v in lang_pcts.items()})
-    
+    # OA percentages by type (the last OA bin holds missing / other statuses)
+    np.multiply(sums[:, ANNUAL_OA:ANNUAL_OA + len(OA_TYPES)], pct_n, out=block[:, RATIO_OA:RATIO_LANG])
+
+    # Language percentages (everything outside LANGUAGES, missing included, is 'other';
+    # without the language column 'other' stays 0)
+    n_lang = len(LANGUAGES) + 1 if 'language' in columns else len(LANGUAGES)
+    np.multiply(sums[:, ANNUAL_LANG:ANNUAL_LANG + n_lang], pct_n, out=block[:, RATIO_LANG:RATIO_LANG + n_lang])
+
+    metrics = pd.DataFrame(block, columns=RATIO_COLUMNS, copy=False)
+    metrics.insert(0, 'num_documents', n.astype(np.int64))
     return metrics
 
-def process_country_worker(country_code):
-    """Worker function to process a single country (uses global data)."""
-    global _works_df, _journals_df, _start_year, _end_year
-    
-    # Get journals for this country
-    country_journals = _journals_df[_journals_df['country_code'] == country_code]
-    num_journals = len(country_journals)
-    journal_ids = country_journals['id'].tolist()
-    
-    # Filter works for this country
-    country_works = _works_df[_works_df['journal_id'].isin(journal_ids)].copy()
-    
-    if len(country_works) == 0:
-        return None, None, None, None
-    
-    # Journal indexing metrics
-    pct_scopus = (country_journals.apply(lambda x: safe_get(x, 'is_indexed_in_scopus', default=False), axis=1).sum() / num_journals) * 100
-    pct_core = (country_journals.apply(lambda x: safe_get(x, 'is_core', default=False), axis=1).sum() / num_journals) * 100
-    pct_doaj = (country_journals.apply(lambda x: safe_get(x, 'is_in_doaj', default=False), axis=1).sum() / num_journals) * 100
-    
-    journal_metrics = {
-        'num_journals': num_journals,
-        'pct_scopus': round(pct_scopus, 6),
-        'pct_core': round(pct_core, 6),
-        'pct_doaj': round(pct_doaj, 6)
-    }
-    
-    # Annual metrics
-    annual_data = []
-    for year in range(_start_year, _end_year + 1):
-        year_works = country_works[country_works['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        metrics['country_code'] = country_code
-        annual_data.append(metrics)
-    
-    annual_metrics_df = pd.DataFrame(annual_data)
-    
-    # Period metrics
-    period_works = country_works[
-        (country_works['publication_year'] >= _start_year) & 
-        (country_works['publication_year'] <= _end_year)
-    ]
-    period_metrics = calculate_performance_metrics_from_df(period_works)
-    period_metrics.update(journal_metrics)
-    period_metrics['country_code'] = country_code
-    period_metrics['period'] = f'{_start_year}-{_end_year}'
-    
-    period_metrics['period'] = f'{_start_year}-{_end_year}'
-    
-    # Recent Period metrics (2021-2025)
-    period_recent_works = country_works[
-        (country_works['publication_year'] >= 2021) & 
-        (country_works['publication_year'] <= 2025)
-    ]
-    period_recent_metrics = calculate_performance_metrics_from_df(period_recent_works)
-    period_recent_metrics.update(journal_metrics)
-    period_recent_metrics['country_code'] = country_code
-    period_recent_metrics['period'] = '2021-2025'
-    
-    return country_code, annual_metrics_df, period_metrics, period_recent_metrics
+def calculate_performance_metrics_from_df(works_df):
+    """
+    Calculate performance metrics from a DataFrame (in-memory version).
+    Matches the logic from performance_metrics.py MetricsAccumulator.
+    Expects works already coerced by prepare_works.
+    """
+    # The whole frame is a single group with a single "year"
+    n = len(works_df)
+    sums, pct_max = group_year_sums(works_df, np.array([0]), np.array([n]), np.zeros(n, dtype=np.int64), 1)
+    metrics = metrics_from_sums(works_df.columns, sums.reshape(1, -1), pct_max.reshape(1))
+    return {name: values.iloc[0].item() for name, values in metrics.items()}
 
-def process_journal_worker(journal_id):
-    """Worker function to process a single journal (uses global data)."""
-    global _works_df, _journals_df, _start_year, _end_year
-    
-    # Get journal metadata
-    journal_info = _journals_df[_journals_df['id'] == journal_id]
-    
-    if len(journal_info) == 0:
-        return None, None, None, None
-    
-    journal_info = journal_info.iloc[0]
-    
-    # Extract indexing information
-    is_scopus = safe_get(journal_info, 'is_indexed_in_scopus', default=False)
-    is_core = safe_get(journal_info, 'is_core', default=False)
-    is_doaj = safe_get(journal_info, 'is_in_doaj', default=False)
-    
-    journal_indexing = {
-        'is_scopus': bool(is_scopus),
-        'is_core': bool(is_core),
-        'is_doaj': bool(is_doaj)
-    }
-    
-    # Filter works for this journal
-    journal_works = _works_df[_works_df['journal_id'] == journal_id].copy()
-    
-    if len(journal_works) == 0:
-        return None, None, None, None
-    
-    # Annual metrics
-    annual_data = []
-    for year in range(_start_year, _end_year + 1):
-        year_works = journal_works[journal_works['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        metrics['journal_id'] = journal_id
-        # Add indexing info to annual metrics
-        metrics.update(journal_indexing)
-        annual_data.append(metrics)
-    
-    annual_metrics_df = pd.DataFrame(annual_data)
-    
-    # Period metrics
-    period_works = journal_works[
-        (journal_works['publication_year'] >= _start_year) & 
-        (journal_works['publication_year'] <= _end_year)
-    ]
-    period_metrics = calculate_performance_metrics_from_df(period_works)
-    period_metrics['journal_id'] = journal_id
-    period_metrics['period'] = f'{_start_year}-{_end_year}'
-    # Add indexing info to period metrics
-    period_metrics.update(journal_indexing)
-    
-    # Add indexing info to period metrics
-    period_metrics.update(journal_indexing)
-    
-    # Recent Period metrics (2021-2025)
-    period_recent_works = journal_works[
-        (journal_works['publication_year'] >= 2021) & 
-        (journal_works['publication_year'] <= 2025)
+def annual_metrics(columns, sums, year_max, years):
+    """Annual metrics of each group, one row per (group, year) in group-major order."""
+    n_groups, n_years, _ = sums.shape
+    annual = metrics_from_sums(columns, sums.reshape(-1, ANNUAL_FIELDS), year_max.reshape(-1))
+    annual['year'] = np.tile(years, n_groups)
+    return annual
+
+def period_metrics(columns, sums, year_max, years, first_year, last_year):
+    """
+    Metrics of each group over [first_year, last_year]: the period adds up its years'
+    sums and takes the max of their percentile max.
+    `years` is sorted, so the period is a contiguous slice (a view, no copy of the sums).
+    """
+    first = np.searchsorted(years, first_year, side='left')
+    last = np.searchsorted(years, last_year, side='right')
+    return metrics_from_sums(
+        columns,
+        sums[:, first:last].sum(axis=1),
+        year_max[:, first:last].max(axis=1, initial=-np.inf),
+    )
+
+def works_columns(works_file):
+    """Columns of WORKS_COLS present in the works file (they decide the metric fallbacks)."""
+    available = set(pq.read_schema(works_file).names)
+    return pd.Index([c for c in WORKS_COLS if c in available])
+
+def kernel_journal_year_sums(works_file):
+    """
+    Per-(journal, year) sums with pandas and the numba / NumPy kernel (loads the works).
+    Returns the journal ids, the years and the (journals, years, ANNUAL_FIELDS) sums and max.
+    """
+    works_df, group_ids, starts, ends = group_by_journal(prepare_works(read_parquet(works_file, WORKS_COLS)))
+    works_memory_mb = works_df.memory_usage(deep=True).sum() / 1024 / 1024
+    print(f"    ✓ {len(works_df):,} works ({works_memory_mb:.1f} MB)")
+
+    years = np.arange(int(works_df['publication_year'].min()), int(works_df['publication_year'].max()) + 1)
+    sums, year_max = group_year_sums(works_df, starts, ends, year_index(works_df, years[0]), len(years))
+    return group_ids, years, sums, year_max
+
+def duckdb_journal_year_sums(works_file):
+    """
+    Same sums as kernel_journal_year_sums from a single DuckDB GROUP BY that streams the
+    parquet file with all cores, without loading the works into pandas. Values follow
+    prepare_works: DOUBLE (NULL / NaN = 0), flags NULL = False.
+    """
+    columns = works_columns(works_file)
+
+    def number(col):
+        if col not in columns:
+            return '0.0'
+        return f"coalesce(nullif(TRY_CAST({col} AS DOUBLE), 'NaN'::DOUBLE), 0)"
+
+    def flag(col):
+        if col not in columns:
+            return '0'
+        return f"coalesce(TRY_CAST({col} AS BOOLEAN), false)::INTEGER"
+
+    def label(col):
+        return f"CAST({col} AS VARCHAR)" if col in columns else 'NULL::VARCHAR'
+
+    # One aggregate per accumulator column, in ANNUAL_* order (the 'other' bins are
+    # completed below from the document count)
+    aggregates = [
+        'count(*)', 'sum(fwci)', 'sum(pct)',
+        'count(*) FILTER (pct >= 0.90)', 'count(*) FILTER (pct >= 0.99)',
+        'count(*) FILTER (pct >= 90.0)', 'count(*) FILTER (pct >= 99.0)',
+        'sum(top_10)', 'sum(top_1)',
     ]
-    period_recent_metrics = calculate_performance_metrics_from_df(period_recent_works)
-    period_recent_metrics['journal_id'] = journal_id
-    period_recent_metrics['period'] = '2021-2025'
-    # Add indexing info to recent period metrics
-    period_recent_metrics.update(journal_indexing)
-    
-    return journal_id, annual_metrics_df, period_metrics, period_recent_metrics
-    
+    # FILTER counts give 0 (not NULL) when no row matches
+    aggregates += [f"count(*) FILTER (oa_status = '{oa_type}')" for oa_type in OA_TYPES]
+    aggregates += [f"count(*) FILTER (language = '{lang}')" for lang in LANGUAGES]
 
+    source = works_file.as_posix().replace("'", "''")
+    query = f"""
+        WITH works AS (
+            SELECT journal_id, publication_year AS year,
+                   {number('fwci')} AS fwci, {number('citation_normalized_percentile')} AS pct,
+                   {flag('is_in_top_10_percent')} AS top_10, {flag('is_in_top_1_percent')} AS top_1,
+                   {label('oa_status')} AS oa_status, {label('language')} AS language
+            FROM read_parquet('{source}')
+        )
+        SELECT journal_id, year, max(pct) AS pct_max,
+               {', '.join(f'{agg} AS s{i}' for i, agg in enumerate(aggregates))}
+        FROM works
+        GROUP BY journal_id, year
+    """
 
-def process_in_chunks(items, worker_func, num_cores, chunk_size, desc="items"):
-    """Process items in chunks to control memory usage."""
-    all_results = []
-    total_items = len(items)
-    num_chunks = (total_items + chunk_size - 1) // chunk_size
-    
-    print(f"  Processing {total_items} {desc} in {num_chunks} chunks of {chunk_size}...")
-    
-    for i in range(0, total_items, chunk_size):
-        chunk = items[i:i + chunk_size]
-        chunk_num = i // chunk_size + 1
-        print(f"    Chunk {chunk_num}/{num_chunks}: processing {len(chunk)} {desc}...", end=' ')
-        
-        chunk_start = time.time()
-        with Pool(processes=num_cores, initializer=init_worker, 
-                  initargs=(works_file, journals_file, start_year, end_year)) as pool:
-            results = pool.map(worker_func, chunk)
-        
-        all_results.extend(results)
-        chunk_time = time.time() - chunk_start
-        print(f"✓ ({chunk_time:.1f}s)")
-    
-    return all_results
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads={os.cpu_count() or 1}")
+        result = con.execute(query).df()
+    finally:
+        con.close()
+
+    # Scatter the (journal, year) rows into the dense tables; works without year
+    # only register their journal
+    codes, group_ids = pd.factorize(result['journal_id'], use_na_sentinel=False)
+    result_years = result['year'].to_numpy(dtype=np.float64)
+    has_year = ~np.isnan(result_years)
+    years = np.arange(int(result_years[has_year].min()), int(result_years[has_year].max()) + 1)
+    year_idx = result_years[has_year].astype(np.int64) - years[0]
+
+    values = result[[f's{i}' for i in range(len(aggregates))]].to_numpy(dtype=np.float64)
+    sums = np.zeros((len(group_ids), len(years), ANNUAL_FIELDS))
+    year_max = np.full((len(group_ids), len(years)), -np.inf)
+
+    listed_oa = slice(ANNUAL_OA, ANNUAL_OA + len(OA_TYPES))
+    listed_lang = slice(ANNUAL_LANG, ANNUAL_LANG + len(LANGUAGES))
+    cells = np.zeros((len(values), ANNUAL_FIELDS))
+    cells[:, :ANNUAL_OA] = values[:, :ANNUAL_OA]
+    cells[:, listed_oa] = values[:, ANNUAL_OA:ANNUAL_OA + len(OA_TYPES)]
+    cells[:, listed_lang] = values[:, ANNUAL_OA + len(OA_TYPES):]
+    cells[:, ANNUAL_LANG - 1] = cells[:, ANNUAL_N] - cells[:, listed_oa].sum(axis=1)
+    cells[:, ANNUAL_FIELDS - 1] = cells[:, ANNUAL_N] - cells[:, listed_lang].sum(axis=1)
+
+    sums[codes[has_year], year_idx] = cells[has_year]
+    year_max[codes[has_year], year_idx] = result['pct_max'].to_numpy(dtype=np.float64)[has_year]
+    print(f"    ✓ {int(sums[:, :, ANNUAL_N].sum()):,} works (DuckDB)")
+    return pd.Index(group_ids), years, sums, year_max
+
+def journal_year_sums(works_file):
+    """Per-(journal, year) sums with DuckDB when installed, otherwise with the kernel."""
+    if duckdb is not None:
+        try:
+            return duckdb_journal_year_sums(works_file)
+        except Exception as e:
+            print(f"    ❌ DuckDB aggregation failed: {e}")
+            print("    ↪️ Retrying with the pandas kernel...")
+    return kernel_journal_year_sums(works_file)
 
 def load_existing_metrics(cache_dir, metric_type):
-    """Load existing metrics if they exist."""
+    """
+    Load existing metrics if they exist, as an Arrow table: they are only checked for ids
+    and written back by save_metrics, so they never go through pandas.
+    """
     file_map = {
         'country_annual': 'metrics_country_annual.parquet',
         'country_period': 'metrics_country_period.parquet',
@@ -317,33 +482,105 @@ def load_existing_metrics(cache_dir, metric_type):
     
     file_path = cache_dir / file_map.get(metric_type)
     if file_path.exists():
-        return pd.read_parquet(file_path)
+        return pq.read_table(file_path, use_threads=True, pre_buffer=True)
     return None
 
-def get_items_to_process(all_items, existing_df, id_column, force=False):
+def get_items_to_process(all_items, existing_table, id_column, force=False):
     """
     Determine which items need to be processed.
     
     Args:
         all_items: List of all item IDs (countries or journals)
-        existing_df: DataFrame with existing metrics (or None)
+        existing_table: Arrow table with existing metrics (or None)
         id_column: Column name containing the ID ('country_code' or 'journal_id')
         force: If True, process all items regardless of existing metrics
     
     Returns:
-        Tuple of (items_to_process, existing_df)
+        Tuple of (items_to_process, existing_table)
     """
-    if force or existing_df is None:
-        return all_items, existing_df
+    if force or existing_table is None:
+        return all_items, existing_table
     
-    existing_ids = set(existing_df[id_column].unique())
+    existing_ids = set(existing_table.column(id_column).unique().to_pylist())
     items_to_process = [item for item in all_items if item not in existing_ids]
     
-    return items_to_process, existing_df
+    return items_to_process, existing_table
+
+
+def align_table(table, schema):
+    """
+    Reorders `table` to the columns of `schema` by name (a cast alone matches them by
+    position), filling the columns it lacks with nulls and casting to the schema types.
+    """
+    arrays = []
+    for field in schema:
+        if field.name in table.column_names:
+            arrays.append(table.column(field.name).cast(field.type))
+        else:
+            arrays.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def save_metrics(batches, existing_table, path, force, desc):
+    """
+    Streams the new metrics rows (an iterable of DataFrames) into `path` with a single
+    ParquetWriter, after the existing rows in incremental mode, so the batches are never
+    concatenated in memory. Nothing is written when there are no new rows.
+    Columns are matched by name: in incremental mode the file keeps the existing column
+    order, with new columns appended and left null for the rows that lack them.
+    The writer targets a temporary file that replaces `path` once it is closed.
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    writer = None
+    new_rows = 0
+    try:
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            table = pa.Table.from_pandas(batch.round(OUTPUT_DECIMALS), preserve_index=False)
+            if writer is None:
+                if not force and existing_table is not None:
+                    # Existing columns first, then the ones older files do not have
+                    schema = existing_table.schema.remove_metadata()
+                    for field in table.schema.remove_metadata():
+                        if schema.get_field_index(field.name) == -1:
+                            schema = schema.append(field)
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                    writer.write_table(align_table(existing_table, schema))
+                else:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(align_table(table, writer.schema))
+            new_rows += len(batch)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            tmp_path.unlink(missing_ok=True)
+        raise
+    
+    if writer is None:
+        return
+    writer.close()
+    os.replace(tmp_path, path)
+    
+    total_rows = new_rows
+    if not force and existing_table is not None:
+        total_rows += existing_table.num_rows
+        print(f"  ✓ Combined {new_rows} new rows with {existing_table.num_rows} existing rows")
+    print(f"  ✓ Saved {desc}: {total_rows} total rows")
+
+def journal_annual_batches(columns, sums, year_max, years, journal_ids, journal_indexing):
+    """
+    Annual metrics of the journals, JOURNAL_BATCH journals at a time (each batch is one
+    parquet row group), with their journal_id and indexing flags.
+    """
+    for i in range(0, len(journal_ids), JOURNAL_BATCH):
+        batch = slice(i, i + JOURNAL_BATCH)
+        annual = annual_metrics(columns, sums[batch], year_max[batch], years)
+        annual['journal_id'] = np.repeat(journal_ids[batch], len(years))
+        for name, flags in journal_indexing.items():
+            annual[name] = np.repeat(flags[batch], len(years))
+        yield annual
 
 def main():
-    global works_file, journals_file, start_year, end_year
-    
     # Parse command-line arguments
     parser = argparse.ArgumentParser(
         description='Precompute metrics for Latin American journals (optimized with incremental processing)'
@@ -364,7 +601,7 @@ def main():
         return 1
     
     print("=" * 70)
-    print("OPTIMIZED PARALLELIZED METRICS PRECALCULATION")
+    print("OPTIMIZED METRICS PRECALCULATION")
     if args.force:
         print("MODE: FORCE (recalculating all metrics)")
     else:
@@ -372,100 +609,63 @@ def main():
     print("=" * 70)
     print()
     
-    # Detect number of cores - use fewer cores to reduce memory pressure
+    # Per-journal, per-year sums: DuckDB (all cores) or the kernel split over journals with numba threads
     total_cores = cpu_count()
-    # Use 25% of cores (more conservative) or max 8 cores
-    num_cores = min(4, max(1, int(total_cores * 0.10)))
     print(f"🖥️  Detected {total_cores} CPU cores")
-    print(f"📊 Using {num_cores} cores (conservative to manage memory)")
+    if duckdb is not None:
+        print("📊 Aggregation engine: DuckDB")
+    elif numba is not None:
+        print(f"📊 Aggregation engine: numba kernel ({numba.get_num_threads()} threads)")
+    else:
+        print("📊 Aggregation engine: NumPy kernel (single thread)")
     
-    # Load data to detect year range (main process only)
     print("\n⚙️  Loading metadata...")
     start_time = time.time()
     
     print("  → Loading journals metadata...")
-    journals_df = pd.read_parquet(journals_file)
+    journals_df = read_parquet(journals_file, JOURNAL_COLS)
     print(f"    ✓ {len(journals_df):,} journals")
     
-    print("  → Loading works metadata...")
-    works_df = pd.read_parquet(works_file)
-    print(f"    ✓ {len(works_df):,} works")
+    cache_dir = get_cache_dir()
     
-    # Estimate memory usage
-    works_memory_mb = works_df.memory_usage(deep=True).sum() / 1024 / 1024
-    journals_memory_mb = journals_df.memory_usage(deep=True).sum() / 1024 / 1024
-    total_memory_mb = works_memory_mb + journals_memory_mb
-    estimated_total_mb = total_memory_mb * (num_cores + 1)  # Each worker + main
-    
-    print(f"\n💾 Memory usage estimate:")
-    print(f"  - Works DataFrame: {works_memory_mb:.1f} MB")
-    print(f"  - Journals DataFrame: {journals_memory_mb:.1f} MB")
-    print(f"  - Per process: {total_memory_mb:.1f} MB")
-    print(f"  - Estimated total ({num_cores} workers): {estimated_total_mb:.1f} MB ({estimated_total_mb/1024:.1f} GB)")
-    
-    # Detect year range
-    print("\n⚙️  Detecting year range...")
-    start_year = int(works_df['publication_year'].min())
-    end_year = int(works_df['publication_year'].max())
+    # 1. Per-journal, per-year sums: the only pass over the works.
+    # Country and LATAM sums are rolled up from these, every metric is a ratio of sums.
+    print("  → Accumulating per-journal, per-year sums over the works...")
+    sums_start = time.time()
+    group_ids, years, sums, year_max = journal_year_sums(works_file)
+    columns = works_columns(works_file)
+    sums_time = time.time() - sums_start
+    print(f"    ✓ {len(group_ids):,} journals x {len(years)} years in {sums_time:.1f}s")
+    
+    start_year, end_year = int(years[0]), int(years[-1])
     print(f"  ✓ Year range: {start_year}-{end_year}")
     
-    cache_dir = get_cache_dir()
+    # (first_year, last_year, output file suffix) of the period metrics
+    periods = [(start_year, end_year, ''), (2021, 2025, '_2021_2025')]
     
-    # 1. LATAM metrics (single-threaded, fast)
+    # 2. LATAM metrics (every journal group, works without journal included)
     print("\n📊 LATAM metrics...")
     latam_start = time.time()
     
-    num_journals = len(journals_df)
-    pct_scopus = (journals_df.apply(lambda x: safe_get(x, 'is_indexed_in_scopus', default=False), axis=1).sum() / num_journals) * 100
-    pct_core = (journals_df.apply(lambda x: safe_get(x, 'is_core', default=False), axis=1).sum() / num_journals) * 100
-    pct_doaj = (journals_df.apply(lambda x: safe_get(x, 'is_in_doaj', default=False), axis=1).sum() / num_journals) * 100
-    
-    journal_metrics = {
-        'num_journals': num_journals,
-        'pct_scopus': round(pct_scopus, 6),
-        'pct_core': round(pct_core, 6),
-        'pct_doaj': round(pct_doaj, 6)
-    }
+    latam_sums, latam_max = rollup(sums, year_max, np.zeros(len(group_ids), dtype=np.intp), 1)
+    save_metrics([annual_metrics(columns, latam_sums, latam_max, years)], None,
+                 cache_dir / 'metrics_latam_annual.parquet', args.force, 'LATAM annual metrics')
     
-    # Annual
-    latam_annual_data = []
-    for year in range(start_year, end_year + 1):
-        year_works = works_df[works_df['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        latam_annual_data.append(metrics)
-    
-    latam_annual = pd.DataFrame(latam_annual_data)
-    latam_annual.to_parquet(cache_dir / 'metrics_latam_annual.parquet', index=False)
-    
-    # Period
-    period_works = works_df[(works_df['publication_year'] >= start_year) & (works_df['publication_year'] <= end_year)]
-    latam_period = calculate_performance_metrics_from_df(period_works)
-    latam_period.update(journal_metrics)
-    latam_period['period'] = f'{start_year}-{end_year}'
-    pd.DataFrame([latam_period]).to_parquet(cache_dir / 'metrics_latam_period.parquet', index=False)
-    
-    # Recent Period (2021-2025)
-    period_recent_works = works_df[(works_df['publication_year'] >= 2021) & (works_df['publication_year'] <= 2025)]
-    latam_period_recent = calculate_performance_metrics_from_df(period_recent_works)
-    latam_period_recent.update(journal_metrics)
-    latam_period_recent['period'] = '2021-2025'
-    pd.DataFrame([latam_period_recent]).to_parquet(cache_dir / 'metrics_latam_period_2021_2025.parquet', index=False)
+    journal_metrics = journal_indexing_metrics(journals_df)
+    for first_year, last_year, suffix in periods:
+        latam_period = period_metrics(columns, latam_sums, latam_max, years, first_year, last_year)
+        latam_period = latam_period.assign(**journal_metrics, period=f'{first_year}-{last_year}')
+        save_metrics([latam_period], None, cache_dir / f'metrics_latam_period{suffix}.parquet',
+                     args.force, f'LATAM {first_year}-{last_year} metrics')
     
     latam_time = time.time() - latam_start
     print(f"  ✓ LATAM metrics completed in {latam_time:.1f}s")
     
-    # Free memory from main process
-    del works_df, journals_df
-    
-    # 2. Country metrics (CHUNKED PARALLEL)
-    print(f"\n📊 Country metrics (chunked processing)...")
+    # 3. Country metrics (journal sums rolled up by the journal's country)
+    print(f"\n📊 Country metrics...")
     country_start = time.time()
     
-    # Load just to get country list
-    temp_journals = pd.read_parquet(journals_file)
-    countries = sorted(temp_journals['country_code'].unique())
-    del temp_journals
+    countries = sorted(journals_df['country_code'].unique())
     
     # Load existing metrics and determine what to process
     existing_country_annual = load_existing_metrics(cache_dir, 'country_annual')
@@ -486,67 +686,47 @@ def main():
         else:
             print(f"  📝 Processing all {len(countries_to_process)} countries...")
         
-        # Process in chunks (smaller chunks = less memory per batch)
-        chunk_size = max(1, len(countries_to_process) // 4)  # Process ~4 batches
-        results = process_in_chunks(countries_to_process, process_country_worker, num_cores, 
-                                    chunk_size, desc="countries")
+        # Each journal group goes to its country (-1 = not processed now, or unknown journal)
+        journal_country = journals_df.drop_duplicates('id').set_index('id')['country_code']
+        target = pd.Index(countries_to_process).get_indexer(journal_country.reindex(group_ids))
+        country_sums, country_max = rollup(sums, year_max, target, len(countries_to_process))
         
-        # Collect results
-        country_annual_list = []
-        country_period_list = []
-        country_period_recent_list = []
+        # Countries without works are left out
+        has_works = country_sums[:, :, ANNUAL_N].sum(axis=1) > 0
+        country_codes = np.array(countries_to_process, dtype=object)[has_works]
+        country_sums, country_max = country_sums[has_works], country_max[has_works]
         
-        for country_code, annual, period, period_recent in results:
-            if annual is not None:
-                country_annual_list.append(annual)
-            if period is not None:
-                country_period_list.append(period)
-            if period_recent is not None:
-                country_period_recent_list.append(period_recent)
+        country_annual = annual_metrics(columns, country_sums, country_max, years)
+        country_annual['country_code'] = np.repeat(country_codes, len(years))
+        save_metrics([country_annual], existing_country_annual,
+                     cache_dir / 'metrics_country_annual.parquet', args.force, 'country annual metrics')
         
-        # Combine with existing metrics if in incremental mode
-        if country_annual_list:
-            new_country_annual = pd.concat(country_annual_list, ignore_index=True)
-            if not args.force and existing_country_annual is not None:
-                country_annual_df = pd.concat([existing_country_annual, new_country_annual], ignore_index=True)
-                print(f"  ✓ Combined {len(new_country_annual)} new rows with {len(existing_country_annual)} existing rows")
-            else:
-                country_annual_df = new_country_annual
-            country_annual_df.to_parquet(cache_dir / 'metrics_country_annual.parquet', index=False)
-            print(f"  ✓ Saved country annual metrics: {len(country_annual_df)} total rows")
+        # Journal indexing metrics of each country
+        country_journal_rows = journals_df.groupby('country_code').indices
+        country_journals = pd.DataFrame([
+            journal_indexing_metrics(journals_df.iloc[country_journal_rows[country_code]])
+            for country_code in country_codes
+        ])
         
-        if country_period_list:
-            new_country_period = pd.DataFrame(country_period_list)
-            if not args.force and existing_country_period is not None:
-                country_period_df = pd.concat([existing_country_period, new_country_period], ignore_index=True)
-                print(f"  ✓ Combined {len(new_country_period)} new countries with {len(existing_country_period)} existing")
-            else:
-                country_period_df = new_country_period
-            country_period_df.to_parquet(cache_dir / 'metrics_country_period.parquet', index=False)
-            print(f"  ✓ Saved country period metrics: {len(country_period_df)} total countries")
-        
-        if country_period_recent_list:
-            new_country_period_recent = pd.DataFrame(country_period_recent_list)
-            if not args.force and existing_country_period_recent is not None:
-                country_period_recent_df = pd.concat([existing_country_period_recent, new_country_period_recent], ignore_index=True)
-                print(f"  ✓ Combined {len(new_country_period_recent)} new countries (recent) with {len(existing_country_period_recent)} existing")
-            else:
-                country_period_recent_df = new_country_period_recent
-            country_period_recent_df.to_parquet(cache_dir / 'metrics_country_period_2021_2025.parquet', index=False)
-            print(f"  ✓ Saved country recent period metrics: {len(country_period_recent_df)} total countries")
+        existing_periods = [existing_country_period, existing_country_period_recent]
+        for (first_year, last_year, suffix), existing in zip(periods, existing_periods):
+            country_period = pd.concat(
+                [period_metrics(columns, country_sums, country_max, years, first_year, last_year), country_journals],
+                axis=1
+            )
+            country_period['country_code'] = country_codes
+            country_period['period'] = f'{first_year}-{last_year}'
+            save_metrics([country_period], existing, cache_dir / f'metrics_country_period{suffix}.parquet',
+                         args.force, f'country {first_year}-{last_year} metrics')
         
         country_time = time.time() - country_start
         print(f"  ✓ Country metrics completed in {country_time:.1f}s")
-
     
-    # 3. Journal metrics (CHUNKED PARALLEL)
-    print(f"\n📊 Journal metrics (chunked processing)...")
+    # 4. Journal metrics (the journal groups themselves)
+    print(f"\n📊 Journal metrics...")
     journal_start = time.time()
     
-    # Load just to get journal IDs
-    temp_journals = pd.read_parquet(journals_file)
-    journal_ids = temp_journals['id'].unique().tolist()
-    del temp_journals
+    journal_ids = journals_df['id'].unique().tolist()
     
     # Load existing metrics and determine what to process
     existing_journal_annual = load_existing_metrics(cache_dir, 'journal_annual')
@@ -567,58 +747,36 @@ def main():
         else:
             print(f"  📝 Processing all {len(journals_to_process)} journals...")
         
-        # Process in chunks (smaller chunks for journals since there are more)
-        chunk_size = max(10, len(journals_to_process) // 20)  # Process ~20 batches
-        results = process_in_chunks(journals_to_process, process_journal_worker, num_cores, 
-                                    chunk_size, desc="journals")
+        # Group of each journal (journals without works are left out)
+        positions = group_ids.get_indexer(journals_to_process)
+        has_works = positions >= 0
+        journal_codes = np.array(journals_to_process, dtype=object)[has_works]
+        journal_sums, journal_max = sums[positions[has_works]], year_max[positions[has_works]]
         
-        # Collect results
-        journal_annual_list = []
-        journal_period_list = []
-        journal_period_recent_list = []
-        
-        for _, annual, period, period_recent in results:
-            if annual is not None and len(annual) > 0:
-                journal_annual_list.append(annual)
-            if period is not None:
-                journal_period_list.append(period)
-            if period_recent is not None:
-                journal_period_recent_list.append(period_recent)
-        
-        # Combine with existing metrics if in incremental mode
-        if journal_annual_list:
-            new_journal_annual = pd.concat(journal_annual_list, ignore_index=True)
-            if not args.force and existing_journal_annual is not None:
-                journal_annual_df = pd.concat([existing_journal_annual, new_journal_annual], ignore_index=True)
-                print(f"  ✓ Combined {len(new_journal_annual)} new rows with {len(existing_journal_annual)} existing rows")
-            else:
-                journal_annual_df = new_journal_annual
-            journal_annual_df.to_parquet(cache_dir / 'metrics_journal_annual.parquet', index=False)
-            print(f"  ✓ Saved journal annual metrics: {len(journal_annual_df)} total rows")
+        # Extract indexing information (first matching row of each journal)
+        journal_info = journals_df.drop_duplicates('id').set_index('id').reindex(journal_codes)
+        journal_indexing = {
+            f'is_{name}': flag_values(journal_info, candidates)
+            for name, candidates in INDEXING_COLUMNS.items()
+        }
         
-        if journal_period_list:
-            new_journal_period = pd.DataFrame(journal_period_list)
-            if not args.force and existing_journal_period is not None:
-                journal_period_df = pd.concat([existing_journal_period, new_journal_period], ignore_index=True)
-                print(f"  ✓ Combined {len(new_journal_period)} new journals with {len(existing_journal_period)} existing")
-            else:
-                journal_period_df = new_journal_period
-            journal_period_df.to_parquet(cache_dir / 'metrics_journal_period.parquet', index=False)
-            print(f"  ✓ Saved journal period metrics: {len(journal_period_df)} total journals")
+        save_metrics(
+            journal_annual_batches(columns, journal_sums, journal_max, years, journal_codes, journal_indexing),
+            existing_journal_annual, cache_dir / 'metrics_journal_annual.parquet',
+            args.force, 'journal annual metrics'
+        )
         
-        if journal_period_recent_list:
-            new_journal_period_recent = pd.DataFrame(journal_period_recent_list)
-            if not args.force and existing_journal_period_recent is not None:
-                journal_period_recent_df = pd.concat([existing_journal_period_recent, new_journal_period_recent], ignore_index=True)
-                print(f"  ✓ Combined {len(new_journal_period_recent)} new journals (recent) with {len(existing_journal_period_recent)} existing")
-            else:
-                journal_period_recent_df = new_journal_period_recent
-            journal_period_recent_df.to_parquet(cache_dir / 'metrics_journal_period_2021_2025.parquet', index=False)
-            print(f"  ✓ Saved journal recent period metrics: {len(journal_period_recent_df)} total journals")
+        existing_periods = [existing_journal_period, existing_journal_period_recent]
+        for (first_year, last_year, suffix), existing in zip(periods, existing_periods):
+            journal_period = period_metrics(columns, journal_sums, journal_max, years, first_year, last_year)
+            journal_period['journal_id'] = journal_codes
+            journal_period['period'] = f'{first_year}-{last_year}'
+            journal_period = journal_period.assign(**journal_indexing)
+            save_metrics([journal_period], existing, cache_dir / f'metrics_journal_period{suffix}.parquet',
+                         args.force, f'journal {first_year}-{last_year} metrics')
         
         journal_time = time.time() - journal_start
         print(f"  ✓ Journal metrics completed in {journal_time:.1f}s")
-
     
     # Summary
     total_time = time.time() - start_time
@@ -628,11 +786,12 @@ def main():
     print("=" * 70)
     print()
     print(f"Total time: {total_time:.1f}s ({total_time/60:.1f} minutes)")
+    print(f"  - Sums: {sums_time:.1f}s")
     print(f"  - LATAM: {latam_time:.1f}s")
     print(f"  - Countries: {country_time:.1f}s")
     print(f"  - Journals: {journal_time:.1f}s")
     print()
-    print(f"Memory-optimized: chunked processing with {num_cores} cores")
+    print(f"Single pass over the works: {len(group_ids):,} journal groups x {len(years)} years")
     
     return 0
 
@@ -1,373 +1,449 @@
 #!/usr/bin/env python3
 """
-Parallelized metrics precalculation script.
-Optimized for servers with large RAM (loads data once, processes in parallel).
+Metrics precalculation script.
+Optimized for servers with large RAM (loads data once, aggregates every level
+from a single groupby over the works).
 """
 import sys
 import os
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from multiprocessing import Pool, cpu_count
 import time
+import pyarrow.parquet as pq
+
+# numba is optional: native kernel for the (journal, year) sums of the pandas path
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# DuckDB is optional: the (journal, year) aggregation then streams the parquet file
+# with all cores instead of loading the works into pandas
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
 # Add src to path
 sys.path.append(str(Path(__file__).parent / 'src'))
 
 from performance_metrics import (
     get_cache_dir,
-    get_year_range,
-    safe_get
+    get_year_range
+)
+
+# OA types reported as pct_oa_<type>
+OA_TYPES = ['gold', 'green', 'hybrid', 'bronze', 'closed']
+
+# Summed columns of the (journal, year) aggregation, in order
+SUM_COLUMNS = (
+    ['num_documents', 'fwci_sum', 'fwci_count', 'percentile_sum', 'percentile_count', 'top_10', 'top_1']
+    + [f'oa_{oa_type}' for oa_type in OA_TYPES]
 )
 
-def calculate_performance_metrics_from_df(works_df):
+# Works columns used by the aggregation (the rest of the file is never decoded)
+WORKS_COLUMNS = [
+    'journal_id', 'publication_year', 'fwci', 'citation_normalized_percentile',
+    'is_in_top_10_percent', 'is_in_top_1_percent', 'oa_status'
+]
+
+def read_parquet(path, columns, **kwargs):
+    """Reads only the requested columns that exist in the file."""
+    available = set(pq.read_schema(path).names)
+    return pd.read_parquet(path, columns=[c for c in columns if c in available], **kwargs)
+
+def prepare_works(works_df):
     """
-    Calculate performance metrics from a DataFrame (in-memory version).
+    Casts the metric columns once, so the aggregation works on plain NumPy arrays:
+    fwci / citation_normalized_percentile -> float (NaN for missing or non-numeric),
+    top-10 / top-1 flags -> bool, oa_status -> oa_code (int8 position in OA_TYPES,
+    -1 for other statuses or missing). Missing columns are created empty.
     """
-    if len(works_df) == 0:
-        return {
-            'num_documents': 0,
-            'fwci_avg': 0.0,
-            'pct_top_10': 0.0,
-            'pct_top_1': 0.0,
-            'avg_percentile': 0.0,
-            'pct_oa_gold': 0.0,
-            'pct_oa_green': 0.0,
-            'pct_oa_hybrid': 0.0,
-            'pct_oa_bronze': 0.0,
-            'pct_oa_closed': 0.0
-        }
-    
-    num_documents = len(works_df)
-    
-    # FWCI average - convert to numeric first
-    if 'fwci' in works_df.columns:
-        fwci_values = pd.to_numeric(works_df['fwci'], errors='coerce')
-        fwci_avg = fwci_values.mean()
-    else:
-        fwci_avg = 0.0
-    
-    # % Top 10% - convert to boolean
-    if 'is_in_top_10_percent' in works_df.columns:
-        top_10_values = pd.to_numeric(works_df['is_in_top_10_percent'], errors='coerce').fillna(0).astype(bool)
-        pct_top_10 = (top_10_values.sum() / num_documents) * 100
-    else:
-        pct_top_10 = 0.0
-    
-    # % Top 1% - convert to boolean
-    if 'is_in_top_1_percent' in works_df.columns:
-        top_1_values = pd.to_numeric(works_df['is_in_top_1_percent'], errors='coerce').fillna(0).astype(bool)
-        pct_top_1 = (top_1_values.sum() / num_documents) * 100
-    else:
-        pct_top_1 = 0.0
-    
-    # Average Percentile - convert to numeric first
-    if 'citation_normalized_percentile' in works_df.columns:
-        percentile_values = pd.to_numeric(works_df['citation_normalized_percentile'], errors='coerce')
-        avg_percentile = percentile_values.mean()
-    else:
-        avg_percentile = 0.0
-    
-    # OA percentages by type
+    for col in ('fwci', 'citation_normalized_percentile'):
+        if col in works_df.columns:
+            works_df[col] = pd.to_numeric(works_df[col], errors='coerce').astype(np.float64)
+        else:
+            works_df[col] = np.nan
+    for col in ('is_in_top_10_percent', 'is_in_top_1_percent'):
+        if col in works_df.columns:
+            works_df[col] = pd.to_numeric(works_df[col], errors='coerce').fillna(0).astype(bool)
+        else:
+            works_df[col] = False
     if 'oa_status' in works_df.columns:
-        total = len(works_df)
-        oa_counts = works_df['oa_status'].value_counts()
-        
-        oa_types = {
-            'pct_oa_gold': (oa_counts.get('gold', 0) / total) * 100,
-            'pct_oa_green': (oa_counts.get('green', 0) / total) * 100,
-            'pct_oa_hybrid': (oa_counts.get('hybrid', 0) / total) * 100,
-            'pct_oa_bronze': (oa_counts.get('bronze', 0) / total) * 100,
-            'pct_oa_closed': (oa_counts.get('closed', 0) / total) * 100
-        }
+        # Only the categories are looked up, each work just indexes the table by its code
+        oa_status = works_df['oa_status'].astype('category')
+        categories = oa_status.cat.categories
+        lookup = np.full(len(categories) + 1, -1, dtype=np.int8)
+        for i, oa_type in enumerate(OA_TYPES):
+            if oa_type in categories:
+                lookup[categories.get_loc(oa_type)] = i
+        # Missing values have code -1, which picks the last lookup slot
+        works_df['oa_code'] = lookup[oa_status.cat.codes.to_numpy()]
     else:
-        oa_types = {
-            'pct_oa_gold': 0.0,
-            'pct_oa_green': 0.0,
-            'pct_oa_hybrid': 0.0,
-            'pct_oa_bronze': 0.0,
-            'pct_oa_closed': 0.0
-        }
-    
-    metrics = {
-        'num_documents': num_documents,
-        'fwci_avg': round(fwci_avg, 2) if pd.notna(fwci_avg) else 0.0,
-        'pct_top_10': round(pct_top_10, 2),
-        'pct_top_1': round(pct_top_1, 2),
-        'avg_percentile': round(avg_percentile, 2) if pd.notna(avg_percentile) else 0.0
-    }
-    
-    metrics.update({k: round(v, 2) for k, v in oa_types.items()})
-    
+        works_df['oa_code'] = np.int8(-1)
+    return works_df
+
+# Position of the first oa_<type> column in SUM_COLUMNS, and number of columns
+SUM_OA = SUM_COLUMNS.index(f'oa_{OA_TYPES[0]}')
+SUM_FIELDS = len(SUM_COLUMNS)
+
+def _group_sums_numpy(group, n_groups, fwci, percentile, top_10, top_1, oa_code):
+    """NumPy version of _group_sums_kernel, one bincount per column over the group codes."""
+    def group_sum(values):
+        return np.bincount(group, weights=values, minlength=n_groups)
+
+    sums = np.zeros((n_groups, SUM_FIELDS))
+    sums[:, 0] = np.bincount(group, minlength=n_groups)
+    sums[:, 1] = group_sum(np.nan_to_num(fwci))
+    sums[:, 2] = group_sum(~np.isnan(fwci))
+    sums[:, 3] = group_sum(np.nan_to_num(percentile))
+    sums[:, 4] = group_sum(~np.isnan(percentile))
+    sums[:, 5] = group_sum(top_10)
+    sums[:, 6] = group_sum(top_1)
+    # Documents per OA type in one bincount (bin 0 = other / missing, only in num_documents)
+    n_bins = len(OA_TYPES) + 1
+    oa_bins = oa_code.astype(np.int64) + 1
+    oa_counts = np.bincount(group * n_bins + oa_bins, minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+    sums[:, SUM_OA:] = oa_counts[:, 1:]
+    return sums
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _sorted_group_sums(starts, ends, rows, fwci, percentile, top_10, top_1, oa_code):
+        """
+        (n_groups, SUM_COLUMNS) sums of each group, whose rows are rows[starts[g]:ends[g]].
+        Groups are prange tasks that only write their own row of the result.
+        """
+        n_groups = len(starts)
+        sums = np.zeros((n_groups, SUM_FIELDS))
+        for g in prange(n_groups):
+            row = sums[g]
+            for k in range(starts[g], ends[g]):
+                i = rows[k]
+                row[0] += 1
+                if not np.isnan(fwci[i]):
+                    row[1] += fwci[i]
+                    row[2] += 1
+                if not np.isnan(percentile[i]):
+                    row[3] += percentile[i]
+                    row[4] += 1
+                if top_10[i]:
+                    row[5] += 1
+                if top_1[i]:
+                    row[6] += 1
+                if oa_code[i] >= 0:
+                    row[SUM_OA + oa_code[i]] += 1
+        return sums
+
+    @njit(cache=True)
+    def _rows_by_group(group, bounds):
+        """Counting sort: row numbers ordered by group, rows of a group in their original order."""
+        next_row = bounds[:-1].copy()
+        rows = np.empty(len(group), dtype=np.int64)
+        for i in range(len(group)):
+            rows[next_row[group[i]]] = i
+            next_row[group[i]] += 1
+        return rows
+
+    def _group_sums_kernel(group, n_groups, fwci, percentile, top_10, top_1, oa_code):
+        """
+        Native version of _group_sums_numpy: rows ordered by group with a counting sort
+        (each group keeps the summation order of the works), then one parallel pass over the blocks.
+        """
+        bounds = np.zeros(n_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group, minlength=n_groups), out=bounds[1:])
+        rows = _rows_by_group(group, bounds)
+        return _sorted_group_sums(bounds[:-1], bounds[1:], rows, fwci, percentile, top_10, top_1, oa_code)
+else:
+    _group_sums_kernel = _group_sums_numpy
+
+def aggregate_journal_years(works_df):
+    """
+    Sums per (journal_id, publication_year) over the works prepared by prepare_works:
+    documents, FWCI / percentile sums and non-null counts (means skip NaN, like mean()),
+    top-10 / top-1 counts and documents per OA type.
+    Missing journal_id / publication_year are kept as their own NaN groups.
+    """
+    # Group code of each work, from the codes of both keys (a categorical journal_id
+    # is factorized from its codes)
+    journal_codes, journal_ids = pd.factorize(works_df['journal_id'], use_na_sentinel=False)
+    year_codes, pub_years = pd.factorize(works_df['publication_year'], use_na_sentinel=False)
+    group, pairs = pd.factorize(journal_codes.astype(np.int64) * len(pub_years) + year_codes)
+
+    values = _group_sums_kernel(
+        group, len(pairs),
+        works_df['fwci'].to_numpy(),
+        works_df['citation_normalized_percentile'].to_numpy(),
+        works_df['is_in_top_10_percent'].to_numpy(),
+        works_df['is_in_top_1_percent'].to_numpy(),
+        works_df['oa_code'].to_numpy()
+    )
+    sums = pd.DataFrame(values, columns=SUM_COLUMNS)
+    sums.insert(0, 'journal_id', np.asarray(journal_ids, dtype=object)[pairs // len(pub_years)])
+    sums.insert(1, 'publication_year', np.asarray(pub_years)[pairs % len(pub_years)])
+    return sums
+
+def duckdb_aggregate_journal_years(works_file):
+    """
+    Same sums as aggregate_journal_years from a single DuckDB GROUP BY over the parquet
+    file (multithreaded, the works are never loaded into pandas).
+    """
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads={os.cpu_count() or 1}")
+        source = "read_parquet('" + works_file.as_posix().replace("'", "''") + "')"
+        columns = {row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+
+        def numeric(col):
+            # NaN -> NULL, so sum / count skip it like pandas
+            if col not in columns:
+                return 'NULL::DOUBLE'
+            return f"nullif(TRY_CAST({col} AS DOUBLE), 'NaN'::DOUBLE)"
+
+        def flag(col):
+            if col not in columns:
+                return '0'
+            return f"(coalesce(TRY_CAST({col} AS DOUBLE), 0) <> 0)::INTEGER"
+
+        oa_status = 'CAST(oa_status AS VARCHAR)' if 'oa_status' in columns else 'NULL::VARCHAR'
+        # FILTER counts give 0 (not NULL) when no row matches
+        oa_counts = ', '.join(
+            f"count(*) FILTER (oa_status = '{oa_type}') AS oa_{oa_type}" for oa_type in OA_TYPES
+        )
+        query = f"""
+            WITH works AS (
+                SELECT journal_id, publication_year,
+                       {numeric('fwci')} AS fwci, {numeric('citation_normalized_percentile')} AS percentile,
+                       {flag('is_in_top_10_percent')} AS top_10, {flag('is_in_top_1_percent')} AS top_1,
+                       {oa_status} AS oa_status
+                FROM {source}
+            )
+            SELECT journal_id, publication_year,
+                   count(*) AS num_documents,
+                   coalesce(sum(fwci), 0) AS fwci_sum, count(fwci) AS fwci_count,
+                   coalesce(sum(percentile), 0) AS percentile_sum, count(percentile) AS percentile_count,
+                   sum(top_10) AS top_10, sum(top_1) AS top_1,
+                   {oa_counts}
+            FROM works
+            GROUP BY journal_id, publication_year
+        """
+        return con.execute(query).df()
+    finally:
+        con.close()
+
+def load_journal_years(works_file):
+    """(journal, year) sums with DuckDB when installed, otherwise with a pandas groupby."""
+    if duckdb is not None:
+        try:
+            journal_year = duckdb_aggregate_journal_years(works_file)
+            print(f"    ✓ {int(journal_year['num_documents'].sum()):,} works aggregated (DuckDB)")
+            return journal_year
+        except Exception as e:
+            print(f"    ❌ DuckDB aggregation failed: {e}")
+            print("    ↪️ Retrying with pandas...")
+
+    # journal_id / oa_status dictionary-encoded (categorical): both are coded from their
+    # integer codes instead of hashing one string per work
+    works_df = prepare_works(read_parquet(works_file, WORKS_COLUMNS, read_dictionary=['journal_id', 'oa_status']))
+    print(f"    ✓ {len(works_df):,} works loaded")
+    return aggregate_journal_years(works_df)
+
+def metrics_from_sums(sums):
+    """
+    Performance metrics (rounded to 2 decimals) for each row of summed columns.
+    Rows without documents get zeros.
+    """
+    n = sums['num_documents'].to_numpy(dtype=np.float64)
+
+    def ratio(numerator, denominator, scale=1.0):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(denominator > 0, numerator / denominator * scale, 0.0)
+        return np.round(values, 2)
+
+    metrics = pd.DataFrame({
+        'num_documents': sums['num_documents'].to_numpy(dtype=np.int64),
+        'fwci_avg': ratio(sums['fwci_sum'].to_numpy(), sums['fwci_count'].to_numpy()),
+        'pct_top_10': ratio(sums['top_10'].to_numpy(), n, 100),
+        'pct_top_1': ratio(sums['top_1'].to_numpy(), n, 100),
+        'avg_percentile': ratio(sums['percentile_sum'].to_numpy(), sums['percentile_count'].to_numpy()),
+    })
+    for oa_type in OA_TYPES:
+        metrics[f'pct_oa_{oa_type}'] = ratio(sums[f'oa_{oa_type}'].to_numpy(), n, 100)
     return metrics
 
-def process_country_parallel(args):
-    """Worker function to process a single country."""
-    country_code, works_df, journals_df, start_year, end_year = args
-    
-    # Get journals for this country
-    country_journals = journals_df[journals_df['country_code'] == country_code]
-    num_journals = len(country_journals)
-    journal_ids = country_journals['id'].tolist()
-    
-    # Filter works for this country
-    country_works = works_df[works_df['journal_id'].isin(journal_ids)].copy()
-    
-    if len(country_works) == 0:
-        return None, None, None
-    
-    # Journal indexing metrics
-    pct_scopus = (country_journals.apply(lambda x: safe_get(x, 'is_indexed_in_scopus', default=False), axis=1).sum() / num_journals) * 100
-    pct_core = (country_journals.apply(lambda x: safe_get(x, 'is_core', default=False), axis=1).sum() / num_journals) * 100
-    pct_doaj = (country_journals.apply(lambda x: safe_get(x, 'is_in_doaj', default=False), axis=1).sum() / num_journals) * 100
-    
-    journal_metrics = {
+def annual_sums(sums, key, items, years):
+    """
+    Sums of every (item, year) pair, items in the given order and years ascending
+    (pairs without works get zeros).
+    """
+    grid = pd.MultiIndex.from_product([items, years], names=[key, 'publication_year'])
+    return sums.groupby([key, 'publication_year'])[SUM_COLUMNS].sum().reindex(grid, fill_value=0)
+
+def period_sums(sums, key, items, start_year, end_year):
+    """Sums of each item over the works published in [start_year, end_year]."""
+    in_period = sums['publication_year'].between(start_year, end_year)
+    return sums[in_period].groupby(key)[SUM_COLUMNS].sum().reindex(items, fill_value=0)
+
+INDEXING_FLAGS = ['is_indexed_in_scopus', 'is_core', 'is_in_doaj']
+
+def prepare_journals(journals_df):
+    """Casts the indexing flags once to bool (missing column or value -> False)."""
+    for col in INDEXING_FLAGS:
+        if col in journals_df.columns:
+            journals_df[col] = journals_df[col].fillna(False).astype(bool)
+        else:
+            journals_df[col] = False
+    return journals_df
+
+def indexing_metrics(num_journals, pct_flags):
+    """Number of journals and % indexed in Scopus / core / DOAJ, from the mean of each flag x 100."""
+    return {
         'num_journals': num_journals,
-        'pct_scopus': round(pct_scopus, 2),
-        'pct_core': round(pct_core, 2),
-        'pct_doaj': round(pct_doaj, 2)
-    }
-    
-    # Annual metrics
-    annual_data = []
-    for year in range(start_year, end_year + 1):
-        year_works = country_works[country_works['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        metrics['country_code'] = country_code
-        annual_data.append(metrics)
-    
-    annual_metrics_df = pd.DataFrame(annual_data)
-    
-    # Period metrics
-    period_works = country_works[
-        (country_works['publication_year'] >= start_year) & 
-        (country_works['publication_year'] <= end_year)
-    ]
-    period_metrics = calculate_performance_metrics_from_df(period_works)
-    period_metrics.update(journal_metrics)
-    period_metrics['country_code'] = country_code
-    period_metrics['period'] = f'{start_year}-{end_year}'
-    
-    return country_code, annual_metrics_df, period_metrics
-
-def process_journal_parallel(args):
-    """Worker function to process a single journal."""
-    journal_id, works_df, journals_df, start_year, end_year = args
-    
-    # Get journal metadata
-    journal_info = journals_df[journals_df['id'] == journal_id]
-    
-    if len(journal_info) == 0:
-        return None, None
-    
-    journal_info = journal_info.iloc[0]
-    
-    # Extract indexing information
-    is_scopus = safe_get(journal_info, 'is_indexed_in_scopus', default=False)
-    is_core = safe_get(journal_info, 'is_core', default=False)
-    is_doaj = safe_get(journal_info, 'is_in_doaj', default=False)
-    
-    journal_indexing = {
-        'is_scopus': bool(is_scopus),
-        'is_core': bool(is_core),
-        'is_doaj': bool(is_doaj)
+        'pct_scopus': np.round(pct_flags['is_indexed_in_scopus'], 2),
+        'pct_core': np.round(pct_flags['is_core'], 2),
+        'pct_doaj': np.round(pct_flags['is_in_doaj'], 2)
     }
-    
-    # Filter works for this journal
-    journal_works = works_df[works_df['journal_id'] == journal_id].copy()
-    
-    if len(journal_works) == 0:
-        return None, None
-    
-    # Annual metrics
-    annual_data = []
-    for year in range(start_year, end_year + 1):
-        year_works = journal_works[journal_works['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        metrics['journal_id'] = journal_id
-        # Add indexing info to annual metrics
-        metrics.update(journal_indexing)
-        annual_data.append(metrics)
-    
-    annual_metrics_df = pd.DataFrame(annual_data)
-    
-    # Period metrics
-    period_works = journal_works[
-        (journal_works['publication_year'] >= start_year) & 
-        (journal_works['publication_year'] <= end_year)
-    ]
-    period_metrics = calculate_performance_metrics_from_df(period_works)
-    period_metrics['journal_id'] = journal_id
-    period_metrics['period'] = f'{start_year}-{end_year}'
-    # Add indexing info to period metrics
-    period_metrics.update(journal_indexing)
-    
-    return annual_metrics_df, period_metrics
 
 def main():
     data_dir = Path(__file__).parent / 'data'
     works_file = data_dir / 'latin_american_works.parquet'
     journals_file = data_dir / 'latin_american_journals.parquet'
-    
+
     if not works_file.exists() or not journals_file.exists():
         print("❌ Data files not found!")
         return 1
-    
+
     print("=" * 70)
-    print("PARALLELIZED METRICS PRECALCULATION")
+    print("METRICS PRECALCULATION (SINGLE GROUPBY)")
     print("=" * 70)
     print()
-    
-    # Detect number of cores - use 50% to leave resources for system
-    total_cores = cpu_count()
-    num_cores = max(1, int(total_cores * 0.5))  # Use 50% of cores (conservative)
-    print(f"🖥️  Detected {total_cores} CPU cores")
-    print(f"📊 Using {num_cores} cores (50% - leaving {total_cores - num_cores} for system)")
-    
+
     # Load data to RAM
     print("\n⚙️  Loading data to RAM...")
     start_time = time.time()
-    
+
     print("  → Loading journals...")
-    journals_df = pd.read_parquet(journals_file)
+    journals_df = prepare_journals(read_parquet(journals_file, ['id', 'country_code'] + INDEXING_FLAGS))
     print(f"    ✓ {len(journals_df):,} journals loaded")
-    
-    print("  → Loading works (this may take a minute)...")
-    works_df = pd.read_parquet(works_file)
-    print(f"    ✓ {len(works_df):,} works loaded")
-    
+
+    # Sums per (journal, year): the only pass over the works.
+    # Country and LATAM sums are added up from these.
+    if duckdb is not None:
+        engine = "DuckDB"
+    else:
+        engine = "pandas + numba kernel" if njit is not None else "pandas"
+    print(f"  → Aggregating works by journal and year ({engine})...")
+    journal_year = load_journal_years(works_file)
+    print(f"    ✓ {len(journal_year):,} (journal, year) groups")
+
     load_time = time.time() - start_time
     print(f"  ✓ Data loaded in {load_time:.1f} seconds")
-    
+
     # Detect year range
     print("\n⚙️  Detecting year range...")
-    start_year = int(works_df['publication_year'].min())
-    end_year = int(works_df['publication_year'].max())
+    start_year = int(journal_year['publication_year'].min())
+    end_year = int(journal_year['publication_year'].max())
+    years = list(range(start_year, end_year + 1))
     print(f"  ✓ Year range: {start_year}-{end_year}")
-    
+
     cache_dir = get_cache_dir()
-    
-    # 1. LATAM metrics (single-threaded, fast)
+
+    # 1. LATAM metrics (every work, with or without journal)
     print("\n📊 LATAM metrics...")
     latam_start = time.time()
-    
-    num_journals = len(journals_df)
-    pct_scopus = (journals_df.apply(lambda x: safe_get(x, 'is_indexed_in_scopus', default=False), axis=1).sum() / num_journals) * 100
-    pct_core = (journals_df.apply(lambda x: safe_get(x, 'is_core', default=False), axis=1).sum() / num_journals) * 100
-    pct_doaj = (journals_df.apply(lambda x: safe_get(x, 'is_in_doaj', default=False), axis=1).sum() / num_journals) * 100
-    
-    journal_metrics = {
-        'num_journals': num_journals,
-        'pct_scopus': round(pct_scopus, 2),
-        'pct_core': round(pct_core, 2),
-        'pct_doaj': round(pct_doaj, 2)
-    }
-    
+
+    journal_metrics = indexing_metrics(len(journals_df), journals_df[INDEXING_FLAGS].mean() * 100)
+
     # Annual
-    latam_annual_data = []
-    for year in range(start_year, end_year + 1):
-        year_works = works_df[works_df['publication_year'] == year]
-        metrics = calculate_performance_metrics_from_df(year_works)
-        metrics['year'] = year
-        latam_annual_data.append(metrics)
-    
-    latam_annual = pd.DataFrame(latam_annual_data)
+    latam_year = journal_year.assign(latam='LATAM')
+    latam_annual = metrics_from_sums(annual_sums(latam_year, 'latam', ['LATAM'], years))
+    latam_annual['year'] = years
     latam_annual.to_parquet(cache_dir / 'metrics_latam_annual.parquet', index=False)
-    
+
     # Period
-    period_works = works_df[(works_df['publication_year'] >= start_year) & (works_df['publication_year'] <= end_year)]
-    latam_period = calculate_performance_metrics_from_df(period_works)
-    latam_period.update(journal_metrics)
-    latam_period['period'] = f'{start_year}-{end_year}'
-    pd.DataFrame([latam_period]).to_parquet(cache_dir / 'metrics_latam_period.parquet', index=False)
-    
+    latam_period = metrics_from_sums(period_sums(latam_year, 'latam', ['LATAM'], start_year, end_year))
+    latam_period = latam_period.assign(**journal_metrics, period=f'{start_year}-{end_year}')
+    latam_period.to_parquet(cache_dir / 'metrics_latam_period.parquet', index=False)
+
     latam_time = time.time() - latam_start
     print(f"  ✓ LATAM metrics completed in {latam_time:.1f}s")
-    
-    # 2. Country metrics (PARALLELIZED)
-    print(f"\n📊 Country metrics (using {num_cores} cores)...")
+
+    # 2. Country metrics (journal sums added up by country)
+    print(f"\n📊 Country metrics...")
     country_start = time.time()
-    
+
     countries = sorted(journals_df['country_code'].unique())
-    print(f"  Processing {len(countries)} countries in parallel...")
-    
-    # Prepare arguments for parallel processing
-    country_args = [
-        (country_code, works_df, journals_df, start_year, end_year)
-        for country_code in countries
-    ]
-    
-    # Process in parallel
-    with Pool(processes=num_cores) as pool:
-        results = pool.map(process_country_parallel, country_args)
-    
-    # Collect results
-    country_annual_list = []
-    country_period_list = []
-    
-    for country_code, annual, period in results:
-        if annual is not None:
-            country_annual_list.append(annual)
-        if period is not None:
-            country_period_list.append(period)
-    
-    # Save
-    if country_annual_list:
-        country_annual_df = pd.concat(country_annual_list, ignore_index=True)
+    print(f"  Processing {len(countries)} countries...")
+
+    # A journal listed under several countries counts for each of them
+    journal_countries = journals_df[['id', 'country_code']].drop_duplicates()
+    country_year = journal_year.merge(journal_countries, left_on='journal_id', right_on='id')
+
+    # Countries without works are left out
+    country_docs = country_year.groupby('country_code')['num_documents'].sum()
+    countries = [c for c in countries if country_docs.get(c, 0) > 0]
+
+    if countries:
+        country_annual_df = metrics_from_sums(annual_sums(country_year, 'country_code', countries, years))
+        country_annual_df['year'] = np.tile(years, len(countries))
+        country_annual_df['country_code'] = np.repeat(countries, len(years))
         country_annual_df.to_parquet(cache_dir / 'metrics_country_annual.parquet', index=False)
         print(f"  ✓ Saved country annual metrics: {len(country_annual_df)} rows")
-    
-    if country_period_list:
-        country_period_df = pd.DataFrame(country_period_list)
+
+        country_period_df = metrics_from_sums(period_sums(country_year, 'country_code', countries, start_year, end_year))
+        country_flags = journals_df.groupby('country_code')[INDEXING_FLAGS]
+        country_journals = pd.DataFrame(indexing_metrics(
+            country_flags.size().reindex(countries).to_numpy(),
+            (country_flags.mean() * 100).reindex(countries).to_dict('series')
+        )).reset_index(drop=True)
+        country_period_df = pd.concat([country_period_df, country_journals], axis=1)
+        country_period_df['country_code'] = countries
+        country_period_df['period'] = f'{start_year}-{end_year}'
         country_period_df.to_parquet(cache_dir / 'metrics_country_period.parquet', index=False)
         print(f"  ✓ Saved country period metrics: {len(country_period_df)} countries")
-    
+
     country_time = time.time() - country_start
     print(f"  ✓ Country metrics completed in {country_time:.1f}s")
-    
-    # 3. Journal metrics (PARALLELIZED)
-    print(f"\n📊 Journal metrics (using {num_cores} cores)...")
+
+    # 3. Journal metrics (the (journal, year) sums themselves)
+    print(f"\n📊 Journal metrics...")
     journal_start = time.time()
-    
-    journal_ids = journals_df['id'].unique()
-    print(f"  Processing {len(journal_ids)} journals in parallel...")
-    
-    # Prepare arguments
-    journal_args = [
-        (journal_id, works_df, journals_df, start_year, end_year)
-        for journal_id in journal_ids
-    ]
-    
-    # Process in parallel with progress
-    with Pool(processes=num_cores) as pool:
-        results = pool.map(process_journal_parallel, journal_args)
-    
-    # Collect results
-    journal_annual_list = []
-    journal_period_list = []
-    
-    for annual, period in results:
-        if annual is not None and len(annual) > 0:
-            journal_annual_list.append(annual)
-        if period is not None:
-            journal_period_list.append(period)
-    
-    # Save
-    if journal_annual_list:
-        journal_annual_df = pd.concat(journal_annual_list, ignore_index=True)
+
+    # Journals without works are left out
+    journals_with_works = set(journal_year['journal_id'])
+    journal_ids = [j for j in journals_df['id'].unique() if j in journals_with_works]
+    print(f"  Processing {len(journal_ids)} journals...")
+
+    if journal_ids:
+        # Indexing information (first metadata row of each journal)
+        journal_info = journals_df.drop_duplicates('id').set_index('id').loc[journal_ids]
+        journal_indexing = {
+            'is_scopus': journal_info['is_indexed_in_scopus'].to_numpy(dtype=bool),
+            'is_core': journal_info['is_core'].to_numpy(dtype=bool),
+            'is_doaj': journal_info['is_in_doaj'].to_numpy(dtype=bool),
+        }
+
+        journal_annual_df = metrics_from_sums(annual_sums(journal_year, 'journal_id', journal_ids, years))
+        journal_annual_df['year'] = np.tile(years, len(journal_ids))
+        journal_annual_df['journal_id'] = np.repeat(journal_ids, len(years))
+        # Add indexing info to annual metrics
+        for name, flags in journal_indexing.items():
+            journal_annual_df[name] = np.repeat(flags, len(years))
         journal_annual_df.to_parquet(cache_dir / 'metrics_journal_annual.parquet', index=False)
         print(f"  ✓ Saved journal annual metrics: {len(journal_annual_df)} rows")
-    
-    if journal_period_list:
-        journal_period_df = pd.DataFrame(journal_period_list)
+
+        journal_period_df = metrics_from_sums(period_sums(journal_year, 'journal_id', journal_ids, start_year, end_year))
+        journal_period_df['journal_id'] = journal_ids
+        journal_period_df['period'] = f'{start_year}-{end_year}'
+        # Add indexing info to period metrics
+        journal_period_df = journal_period_df.assign(**journal_indexing)
         journal_period_df.to_parquet(cache_dir / 'metrics_journal_period.parquet', index=False)
         print(f"  ✓ Saved journal period metrics: {len(journal_period_df)} journals")
-    
+
     journal_time = time.time() - journal_start
     print(f"  ✓ Journal metrics completed in {journal_time:.1f}s")
-    
+
     # Summary
     total_time = time.time() - start_time
     print()
@@ -380,9 +456,7 @@ def main():
     print(f"  - LATAM: {latam_time:.1f}s")
     print(f"  - Countries: {country_time:.1f}s")
     print(f"  - Journals: {journal_time:.1f}s")
-    print()
-    print(f"Speedup: ~{num_cores}x faster than sequential processing")
-    
+
     return 0
 
 if __name__ == "__main__":
@@ -3,10 +3,59 @@ Script para completar la base de datos OpenAlex con las tablas faltantes.
 Complementa load2.py cargando: sources, institutions, works_primary_location, etc.
 """
 import gzip
+import hashlib
+import io
 import json
+import multiprocessing
 import os
+import pickle
+import re
+import threading
 import psycopg2
-from io import StringIO
+from collections import deque
+from contextlib import contextmanager
+
+# Construcción/codificación de filas por registro (compilable con mypyc, ver copy_rows.py)
+from copy_rows import (
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    ROW_ENCODERS,
+    build_institution_row,
+    build_source_row,
+    build_works_oa_row,
+    build_works_primary_row,
+)
+
+# orjson es opcional: parsea líneas en bytes 2-5x más rápido que json estándar
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# hyperscan es opcional: compila muchos patrones a un DFA vectorizado (SIMD)
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# rapidgzip es opcional: descomprime un solo .gz grande con varios hilos
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+# isal es opcional: descompresión gzip con ISA-L (SIMD), 2-3x más rápida que zlib
+try:
+    from isal import igzip as gzip_reader
+except ImportError:
+    gzip_reader = gzip
+
+# zstandard es opcional: comprime la caché de archivos procesados (si no, gzip nivel 1)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # --- CONFIGURACIÓN ---
 DB_PARAMS = {
@@ -19,30 +68,599 @@ DB_PARAMS = {
 
 SNAPSHOT_DIR = "./openalex-snapshot/data"
 
+# Procesos que descomprimen y parsean archivos .gz en paralelo
+NUM_WORKERS = os.cpu_count() or 1
+
+# Formato del COPY: "binary" evita formatear/parsear cada valor como texto.
+# "text" (TSV) es más tolerante si la tabla ya existe con tipos distintos.
+COPY_FORMAT = "binary"
+
+# Buffer de lectura sobre el stream descomprimido (el default de gzip es 8 KB)
+GZIP_BUFFER_SIZE = 128 * 1024
+
+# Archivos de works más grandes que esto (comprimidos) se reparten por bloques
+# entre los workers, para que un solo .gz de varios GB no ocupe un único núcleo
+SPLIT_SHARD_BYTES = 512 * 1024 * 1024
+# Tamaño de cada bloque (descomprimido, cortado en fin de línea)
+CHUNK_BYTES = 4 * 1024 * 1024
+
+# Caché local (idealmente en NVMe) con el resultado ya filtrado y codificado de
+# cada .gz: en una re-ejecución se envía directo al COPY sin descomprimir ni
+# parsear el snapshot. None la desactiva (ver --no-cache).
+CACHE_DIR = "./.cache/load_initial_data"
+# Subir al cambiar el filtrado o la construcción de filas (invalida la caché)
+CACHE_VERSION = 1
+
+# Filas de works acumuladas (de varios archivos) antes de cada COPY + commit
+WORKS_BATCH_ROWS = 50000
+
 LATAM_CODES = {
     'MX', 'GT', 'SV', 'HN', 'NI', 'CR', 'PA', 'CU', 'DO', 'HT', 
     'PR', 'CO', 'VE', 'EC', 'PE', 'BO', 'CL', 'AR', 'PY', 'UY', 
     'BR', 'BZ', 'JM', 'TT', 'BB', 'BS', 'GY', 'SR', 'GF'
 }
 
-def clean(val):
-    """Limpia valores para el formato TSV de Postgres."""
-    if val is None:
-        return '\\N'
-    return str(val).replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
-
-def clean_json(val):
-    """Convierte JSON a string limpio sin corromper Unicode."""
-    if val is None:
-        return '\\N'
-    # ensure_ascii=False preserva caracteres Unicode correctamente
-    # separators sin espacios para formato compacto
-    json_str = json.dumps(val, ensure_ascii=False, separators=(',', ':'))
-    # Escapar comillas dobles para PostgreSQL COPY (\" → \")
-    # Solo reemplazar caracteres problemáticos para TSV
-    json_str = json_str.replace('\\', '\\\\')  # Escapar backslashes primero
-    json_str = json_str.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
-    return json_str
+# Columnas del COPY, en el mismo orden en que se construyen las filas
+SOURCES_COLUMNS = (
+    'id', 'issn_l', 'issn', 'display_name', 'publisher', 
+    'works_count', 'cited_by_count', 'is_oa', 'is_in_doaj', 
+    'homepage_url', 'works_api_url', 'updated_date', 'country_code', 'is_scopus', 'summary_stats'
+)
+SOURCES_TYPES = (
+    'text', 'text', 'json', 'text', 'text',
+    'integer', 'integer', 'boolean', 'boolean',
+    'text', 'text', 'timestamp', 'text', 'boolean', 'json'
+)
+
+INSTITUTIONS_COLUMNS = (
+    'id', 'ror', 'display_name', 'country_code', 'type',
+    'homepage_url', 'image_url', 'image_thumbnail_url',
+    'display_name_acronyms', 'display_name_alternatives',
+    'works_count', 'cited_by_count', 'works_api_url', 'updated_date'
+)
+INSTITUTIONS_TYPES = (
+    'text', 'text', 'text', 'text', 'text',
+    'text', 'text', 'text',
+    'json', 'json',
+    'integer', 'integer', 'text', 'timestamp'
+)
+
+WORKS_PRIMARY_COLUMNS = (
+    'work_id', 'source_id', 'is_oa', 'landing_page_url', 'pdf_url', 'license', 'version'
+)
+WORKS_PRIMARY_TYPES = ('text', 'text', 'boolean', 'text', 'text', 'text', 'text')
+
+WORKS_OA_COLUMNS = ('work_id', 'is_oa', 'oa_status', 'oa_url', 'any_repository_has_fulltext')
+WORKS_OA_TYPES = ('text', 'boolean', 'text', 'text', 'boolean')
+
+# IDs de sources tal como aparecen en el JSON crudo de works
+SOURCE_ID_RE = re.compile(rb'https://openalex\.org/S\d+')
+
+# country_code LATAM en el JSON crudo (con o sin espacio tras ':'). Puede coincidir
+# con objetos anidados, así que solo descarta líneas: el filtro real sigue siendo el JSON
+LATAM_COUNTRY_RE = re.compile(
+    rb'"country_code":\s*"(?:' + b'|'.join(sorted(c.encode('ascii') for c in LATAM_CODES)) + rb')"'
+)
+
+def copy_sql(table, columns, copy_format):
+    """Sentencia COPY ... FROM STDIN para el formato indicado."""
+    if copy_format == 'binary':
+        options = "FORMAT binary"
+    else:
+        options = "FORMAT text, DELIMITER E'\\t', NULL '\\N'"
+    return f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH ({options})"
+
+
+def copy_rows(cur, table, columns, payload, copy_format):
+    """Ejecuta un COPY con un bloque de filas ya codificadas."""
+    if copy_format == 'binary':
+        payload = PGCOPY_HEADER + payload + PGCOPY_TRAILER
+    cur.copy_expert(copy_sql(table, columns, copy_format), io.BytesIO(payload))
+
+
+def build_hyperscan_matcher(patterns):
+    """
+    Compila los patrones (regex en bytes) en una base de datos Hyperscan y devuelve
+    una función line -> bool que indica si alguno aparece en la línea.
+    """
+    db = hyperscan.Database()
+    db.compile(
+        expressions=patterns,
+        ids=list(range(len(patterns))),
+        flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns),
+    )
+    
+    def on_match(pattern_id, start, end, flags, context):
+        return True  # Detener el escaneo en la primera coincidencia
+    
+    def matches(line):
+        try:
+            db.scan(line, match_event_handler=on_match)
+        except hyperscan.ScanTerminated:
+            return True
+        return False
+    
+    return matches
+
+
+def build_country_prefilter():
+    """
+    Devuelve un filtro rápido sobre la línea cruda (bytes) de un source/institution:
+    True si contiene un country_code LATAM (Hyperscan si está instalado, si no regex).
+    """
+    if hyperscan is not None:
+        return build_hyperscan_matcher([
+            rb'"country_code":\s*"' + code.encode('ascii') + b'"' for code in sorted(LATAM_CODES)
+        ])
+    return LATAM_COUNTRY_RE.search
+
+
+def build_source_prefilter(latam_source_ids):
+    """
+    Devuelve un filtro rápido sobre la línea cruda (bytes) de un work.
+    Si ningún ID de source presente en la línea es LATAM, el work se puede
+    descartar sin parsear el JSON completo.
+    """
+    if hyperscan is not None:
+        # Con la comilla final, S123 no coincide dentro de S1234
+        return build_hyperscan_matcher([
+            re.escape(sid).encode('utf-8') + b'"' for sid in sorted(latam_source_ids)
+        ])
+    
+    wanted = frozenset(sid.encode('utf-8') for sid in latam_source_ids)
+    find_ids = SOURCE_ID_RE.findall
+    
+    def may_match(line):
+        return not wanted.isdisjoint(find_ids(line))
+    
+    return may_match
+
+
+@contextmanager
+def copy_stream(cur, table, columns, copy_format):
+    """
+    Abre un COPY ... FROM STDIN alimentado por un pipe del sistema operativo.
+    Las filas (bytes ya codificados) escritas en el archivo devuelto se envían a
+    Postgres mientras se producen (un hilo ejecuta copy_expert), con memoria
+    acotada al buffer del pipe.
+    """
+    read_fd, write_fd = os.pipe()
+    sql = copy_sql(table, columns, copy_format)
+    errors = []
+    
+    def consume():
+        with os.fdopen(read_fd, 'rb') as reader:
+            try:
+                cur.copy_expert(sql, reader)
+            except Exception as e:
+                errors.append(e)
+    
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    out = os.fdopen(write_fd, 'wb')
+    broken = False
+    try:
+        if copy_format == 'binary':
+            out.write(PGCOPY_HEADER)
+        yield out
+        if copy_format == 'binary':
+            out.write(PGCOPY_TRAILER)
+    except BrokenPipeError:
+        # El COPY terminó antes de tiempo; el error real lo reporta el hilo
+        broken = True
+    finally:
+        try:
+            out.close()
+        except BrokenPipeError:
+            broken = True
+        thread.join()
+    if errors:
+        raise errors[0]
+    if broken:
+        raise RuntimeError(f"El COPY a {table} se interrumpió")
+
+
+def drop_table_indexes(conn, cur, table):
+    """
+    Elimina la PRIMARY KEY y los índices secundarios de una tabla antes del COPY,
+    para no mantener el btree fila por fila durante la carga.
+    Devuelve las definiciones (CREATE INDEX ...) de los índices secundarios, o None
+    si la tabla ya tiene filas: en ese caso los índices se mantienen, para que la
+    PRIMARY KEY siga rechazando duplicados en el COPY que agrega filas.
+    """
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM openalex.{table})")
+    if cur.fetchone()[0]:
+        conn.commit()
+        print(f"⚠️ {table} ya tiene datos: se carga con sus índices (más lento)")
+        return None
+    cur.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = 'openalex' AND tablename = %s AND indexname <> %s
+    """, (table, f"{table}_pkey"))
+    indexes = cur.fetchall()
+    for indexname, _ in indexes:
+        cur.execute(f'DROP INDEX IF EXISTS openalex."{indexname}"')
+    cur.execute(f"ALTER TABLE openalex.{table} DROP CONSTRAINT IF EXISTS {table}_pkey")
+    conn.commit()
+    return [indexdef for _, indexdef in indexes]
+
+
+def rebuild_table_indexes(conn, cur, table, pk_column, index_defs):
+    """
+    Vuelve a crear la PRIMARY KEY y los índices secundarios después del COPY
+    (nada si drop_table_indexes los mantuvo). Si la PRIMARY KEY no se puede crear
+    (duplicados), lanza RuntimeError: la tabla no debe quedar sin clave.
+    """
+    if index_defs is None:
+        return
+    # Más memoria para que el ordenamiento del índice se haga en RAM
+    cur.execute("SET maintenance_work_mem TO '2GB';")
+    try:
+        cur.execute(f"ALTER TABLE openalex.{table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pk_column})")
+        conn.commit()
+        print(f"✓ PRIMARY KEY de {table} reconstruida")
+    except Exception as e:
+        conn.rollback()
+        raise RuntimeError(
+            f"No se pudo reconstruir la PRIMARY KEY de {table} (¿duplicados?): {e}\n"
+            f"  Revisa los duplicados y ejecuta setup/db_setup_keys.py"
+        ) from e
+    for indexdef in index_defs:
+        try:
+            cur.execute(indexdef)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"✗ Error al reconstruir índice de {table}: {e}")
+
+
+def set_tables_logged(tables):
+    """
+    Las tablas se crean UNLOGGED (el COPY no escribe WAL); al terminar la carga
+    se vuelven LOGGED para que sean durables ante una caída del servidor.
+    """
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+    except Exception as e:
+        print(f"✗ Error de conexión: {e}")
+        return
+    for table in tables:
+        try:
+            cur.execute(f"ALTER TABLE openalex.{table} SET LOGGED;")
+            conn.commit()
+            print(f"✓ {table}: SET LOGGED")
+        except Exception as e:
+            conn.rollback()
+            print(f"✗ No se pudo marcar {table} como LOGGED: {e}")
+    cur.close()
+    conn.close()
+
+
+# Estado de los procesos worker (ver _init_worker)
+_worker = {}
+
+
+def open_shard(file_path):
+    """Abre un .gz del snapshot en modo binario con un buffer de lectura grande."""
+    return io.BufferedReader(gzip_reader.open(file_path, 'rb'), buffer_size=GZIP_BUFFER_SIZE)
+
+
+def iter_shard_chunks(file_path, index_dir=None):
+    """
+    Lee un .gz en bloques de ~CHUNK_BYTES descomprimidos, cortados en el último
+    salto de línea para que cada bloque contenga solo registros completos.
+    Con rapidgzip e index_dir, guarda/reutiliza el índice de puntos de acceso
+    del .gz para no tener que re-descubrirlos en la siguiente lectura.
+    """
+    index_path = None
+    if rapidgzip is not None:
+        f = rapidgzip.open(file_path, parallelization=NUM_WORKERS)
+        if index_dir:
+            index_path = os.path.join(index_dir, f"index-{shard_key(file_path)}.gzidx")
+            if os.path.exists(index_path):
+                try:
+                    f.import_index(index_path)
+                    index_path = None
+                except Exception:
+                    pass
+    else:
+        f = open_shard(file_path)
+    with f:
+        tail = b''
+        while True:
+            data = f.read(CHUNK_BYTES)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                tail = data
+                continue
+            tail = data[cut:]
+            yield data[:cut]
+        if tail:
+            yield tail
+        if index_path:
+            try:
+                os.makedirs(index_dir, exist_ok=True)
+                f.export_index(index_path)
+            except Exception as e:
+                print(f"⚠️  No se pudo exportar el índice de {os.path.basename(file_path)}: {e}")
+
+
+def shard_key(file_path, *parts):
+    """Clave de un .gz del snapshot: ruta + mtime + tamaño (+ partes extra)."""
+    st = os.stat(file_path)
+    raw = ':'.join([os.path.abspath(file_path), str(st.st_mtime_ns), str(st.st_size)] + [str(p) for p in parts])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def cache_tag(copy_format, latam_source_ids=None, primary=True, open_access=True):
+    """Resume todo lo que cambia el resultado de procesar un .gz (además del propio archivo)."""
+    parts = [CACHE_VERSION, copy_format, ','.join(sorted(LATAM_CODES))]
+    if latam_source_ids is not None:
+        ids_digest = hashlib.blake2b('\n'.join(sorted(latam_source_ids)).encode('utf-8'), digest_size=16).hexdigest()
+        parts += [ids_digest, primary, open_access]
+    return ':'.join(str(p) for p in parts)
+
+
+def shard_cache_path(cache_dir, kind, file_path, tag):
+    """Ruta en caché del resultado procesado de un .gz."""
+    ext = 'pkl.zst' if zstandard is not None else 'pkl.gz'
+    return os.path.join(cache_dir, f"{kind}-{shard_key(file_path, tag)}.{ext}")
+
+
+def read_shard_cache(cache_path):
+    """Lee un resultado en caché; None si no existe o está dañado."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        if zstandard is not None:
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        return pickle.loads(data)
+    except Exception:
+        return None
+
+
+def write_shard_cache(cache_path, result):
+    """Guarda un resultado en caché de forma atómica (archivo temporal + os.replace)."""
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    if zstandard is not None:
+        data = zstandard.ZstdCompressor(level=3).compress(data)
+    else:
+        data = gzip.compress(data, compresslevel=1)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  No se pudo escribir la caché {cache_path}: {e}")
+
+
+def cached_shard(kind, file_path, process):
+    """Devuelve el resultado de process(file_path), usando la caché del worker si está activa."""
+    cache_dir = _worker.get('cache_dir')
+    if not cache_dir:
+        return process(file_path)
+    cache_path = shard_cache_path(cache_dir, kind, file_path, _worker['cache_tag'])
+    result = read_shard_cache(cache_path)
+    if result is None:
+        result = process(file_path)
+        write_shard_cache(cache_path, result)
+    return result
+
+
+def list_shards(path):
+    """Lista (ordenados) los archivos .gz de una carpeta del snapshot."""
+    shard_paths = []
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.endswith(".gz"):
+                shard_paths.append(os.path.join(root, file))
+    return sorted(shard_paths)
+
+
+def process_source_shard(file_path):
+    """
+    Procesa un archivo de sources (se ejecuta en un proceso worker).
+    Devuelve (file_path, filas codificadas para COPY, IDs de revistas LATAM encontradas).
+    """
+    return cached_shard('sources', file_path, _process_source_shard)
+
+
+def _process_source_shard(file_path):
+    encode_row = _worker['encode_row']
+    has_latam_country = _worker['has_latam_country']
+    lines = []
+    ids = []
+    with open_shard(file_path) as f:
+        for line in f:
+            # La mayoría de registros no son LATAM: descartar antes de parsear
+            if not has_latam_country(line):
+                continue
+            try:
+                data = json_loads(line)
+                
+                # Filtrar solo LATAM
+                if data.get('country_code') in LATAM_CODES:
+                    # Preparar fila para sources
+                    row = build_source_row(data)
+                    
+                    # Detectar desalineación entre la fila y las columnas del COPY
+                    assert len(row) == len(SOURCES_COLUMNS), "fila de sources desalineada"
+                    lines.append(encode_row(row, SOURCES_TYPES))
+                    ids.append(data['id'])
+            except AssertionError:
+                raise
+            except Exception:
+                continue
+    return file_path, b''.join(lines), ids
+
+
+def process_institution_shard(file_path):
+    """
+    Procesa un archivo de institutions (se ejecuta en un proceso worker).
+    Devuelve (file_path, filas codificadas para COPY, IDs de instituciones LATAM encontradas).
+    """
+    return cached_shard('institutions', file_path, _process_institution_shard)
+
+
+def _process_institution_shard(file_path):
+    encode_row = _worker['encode_row']
+    has_latam_country = _worker['has_latam_country']
+    lines = []
+    ids = []
+    with open_shard(file_path) as f:
+        for line in f:
+            # La mayoría de registros no son LATAM: descartar antes de parsear
+            if not has_latam_country(line):
+                continue
+            try:
+                data = json_loads(line)
+                
+                # Filtrar solo LATAM
+                if data.get('country_code') in LATAM_CODES:
+                    # Preparar fila para institutions
+                    row = build_institution_row(data)
+                    
+                    # Detectar desalineación entre la fila y las columnas del COPY
+                    assert len(row) == len(INSTITUTIONS_COLUMNS), "fila de institutions desalineada"
+                    lines.append(encode_row(row, INSTITUTIONS_TYPES))
+                    ids.append(data['id'])
+            except AssertionError:
+                raise
+            except Exception:
+                continue
+    return file_path, b''.join(lines), ids
+
+
+def _init_worker(copy_format, cache_dir=None, latam_source_ids=None, primary=True, open_access=True):
+    """Fija el estado de cada proceso worker (una vez por proceso en el Pool)."""
+    _worker['encode_row'] = ROW_ENCODERS[copy_format]
+    _worker['cache_dir'] = cache_dir
+    _worker['cache_tag'] = cache_tag(copy_format, latam_source_ids, primary, open_access)
+    _worker['has_latam_country'] = build_country_prefilter()
+    if latam_source_ids is not None:
+        _worker['latam_source_ids'] = latam_source_ids
+        _worker['may_match'] = build_source_prefilter(latam_source_ids)
+    _worker['primary'] = primary
+    _worker['open_access'] = open_access
+
+
+def process_works_shard(file_path):
+    """
+    Procesa un archivo de works (se ejecuta en un proceso worker).
+    Devuelve (file_path, filas de works_primary_location, filas de works_open_access, registros).
+    """
+    return cached_shard('works', file_path, _process_works_shard)
+
+
+def _process_works_shard(file_path):
+    with open_shard(file_path) as f:
+        return (file_path,) + process_works_lines(f)
+
+
+def process_works_chunk(chunk):
+    """
+    Procesa un bloque de líneas de works ya descomprimido (ver iter_shard_chunks).
+    Devuelve (filas de works_primary_location, filas de works_open_access, registros).
+    """
+    return process_works_lines(chunk.splitlines())
+
+
+def process_works_lines(lines):
+    """Filtra works LATAM y codifica sus filas para ambas tablas."""
+    encode_row = _worker['encode_row']
+    latam_source_ids = _worker['latam_source_ids']
+    may_match = _worker['may_match']
+    primary = _worker['primary']
+    open_access = _worker['open_access']
+    
+    primary_lines = []
+    oa_lines = []
+    count = 0
+    for line in lines:
+        # La gran mayoría de works no son LATAM: descartar antes de parsear
+        if not may_match(line):
+            continue
+        try:
+            work = json_loads(line)
+            primary_loc = work.get('primary_location')
+            
+            if primary_loc and primary_loc.get('source'):
+                source_id = primary_loc['source'].get('id')
+                
+                # Solo procesar si es una revista LATAM
+                if source_id in latam_source_ids:
+                    count += 1
+                    
+                    if primary:
+                        row = build_works_primary_row(work['id'], source_id, primary_loc)
+                        primary_lines.append(encode_row(row, WORKS_PRIMARY_TYPES))
+                    
+                    if open_access:
+                        row = build_works_oa_row(work['id'], work.get('open_access') or {})
+                        oa_lines.append(encode_row(row, WORKS_OA_TYPES))
+        except Exception:
+            continue
+    return b''.join(primary_lines), b''.join(oa_lines), count
+
+
+def iter_works_results(pool, shard_paths, cache_dir=None, tag=None):
+    """
+    Reparte los archivos de works entre los workers y genera
+    (etiqueta, filas primary_location, filas open_access, registros).
+    Los archivos normales se procesan completos en un worker; los mayores a
+    SPLIT_SHARD_BYTES se descomprimen aquí y sus bloques se reparten entre todos.
+    Con cache_dir, el resultado de cada archivo grande se guarda completo en caché
+    (los normales los cachea cada worker, ver cached_shard).
+    """
+    small = [p for p in shard_paths if os.path.getsize(p) < SPLIT_SHARD_BYTES]
+    large = [p for p in shard_paths if os.path.getsize(p) >= SPLIT_SHARD_BYTES]
+    
+    for file_path, rows_primary, rows_oa, count in pool.imap_unordered(process_works_shard, small, chunksize=4):
+        yield os.path.basename(file_path), rows_primary, rows_oa, count
+    
+    # Como mucho 2 bloques pendientes por worker para acotar la memoria
+    max_pending = 2 * NUM_WORKERS
+    for file_path in large:
+        name = os.path.basename(file_path)
+        cache_path = shard_cache_path(cache_dir, 'works', file_path, tag) if cache_dir else None
+        if cache_path:
+            result = read_shard_cache(cache_path)
+            if result is not None:
+                # Mismo formato que process_works_shard: (file_path, primary, oa, registros)
+                yield (name,) + result[1:]
+                continue
+        print(f"  {name}: archivo grande, procesando por bloques...")
+        # Solo las filas LATAM (pocas) se acumulan para escribir la caché al final
+        parts_primary, parts_oa, total = [], [], 0
+        pending = deque()
+        
+        def take_result():
+            nonlocal total
+            rows_primary, rows_oa, count = pending.popleft().get()
+            if cache_path:
+                parts_primary.append(rows_primary)
+                parts_oa.append(rows_oa)
+                total += count
+            return (name, rows_primary, rows_oa, count)
+        
+        for chunk in iter_shard_chunks(file_path, index_dir=cache_dir):
+            pending.append(pool.apply_async(process_works_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                yield take_result()
+        while pending:
+            yield take_result()
+        if cache_path:
+            write_shard_cache(cache_path, (file_path, b''.join(parts_primary), b''.join(parts_oa), total))
 
 
 def load_sources():
@@ -66,61 +684,12 @@ def load_sources():
         print(f"✗ No se encuentra la carpeta {sources_path}")
         return None
     
-    buffer = StringIO()
-    total_loaded = 0
-    latam_source_ids = set()
-    
-    print("Procesando archivos...")
-    
-    for root, _, files in os.walk(sources_path):
-        for file in files:
-            if file.endswith(".gz"):
-                file_path = os.path.join(root, file)
-                count_in_file = 0
-                
-                with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            data = json.loads(line)
-                            
-                            # Filtrar solo LATAM
-                            if data.get('country_code') in LATAM_CODES:
-                                count_in_file += 1
-                                latam_source_ids.add(data['id'])
-                                
-                                # Preparar fila para sources
-                                row = [
-                                    data['id'],
-                                    data.get('issn_l'),
-                                    clean_json(data.get('issn')),
-                                    data.get('display_name'),
-                                    data.get('publisher'),
-                                    data.get('works_count', 0),
-                                    data.get('cited_by_count', 0),
-                                    data.get('is_oa', False),
-                                    data.get('is_in_doaj', False),
-                                    data.get('homepage_url'),
-                                    data.get('works_api_url'),
-                                    data.get('updated_date'),
-                                    data.get('country_code'),  # Agregado country_code
-                                    bool((data.get('ids') or {}).get('scopus')),  # Agregado is_scopus
-                                    clean_json(data.get('summary_stats'))  # Agregado summary_stats
-                                ]
-                                
-                                buffer.write('\t'.join([clean(i) for i in row]) + '\n')
-                        except Exception as e:
-                            continue
-                
-                if count_in_file > 0:
-                    print(f"  {file}: {count_in_file} revistas LATAM")
-                    total_loaded += count_in_file
-    
     # Crear la tabla sources con country_code si no existe
     # (Nota: Si ya existe sin country_code, deberás borrarla manualmente o el copy fallará si las columnas no coinciden)
     # Pero aquí asumimos que el usuario borrará la tabla antes de correr esto
     try:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS openalex.sources (
+            CREATE UNLOGGED TABLE IF NOT EXISTS openalex.sources (
                 id text PRIMARY KEY,
                 issn_l text,
                 issn json,
@@ -142,19 +711,29 @@ def load_sources():
     except Exception as e:
         print(f"Advertencia al crear tabla sources: {e}")
         conn.rollback()
-
-    # Cargar a la base de datos
+    
+    total_loaded = 0
+    latam_source_ids = set()
+    shard_paths = list_shards(sources_path)
+    
+    # Sin índices durante el COPY; se reconstruyen al final
+    index_defs = drop_table_indexes(conn, cur, 'sources')
+    
+    print(f"Procesando {len(shard_paths)} archivos con {NUM_WORKERS} procesos...")
+    
+    # Cargar a la base de datos mientras los workers leen los archivos
     try:
-        buffer.seek(0)
-        # Especificar columnas explícitamente para evitar errores si la tabla tiene diferente orden
-        columns = (
-            'id', 'issn_l', 'issn', 'display_name', 'publisher', 
-            'works_count', 'cited_by_count', 'is_oa', 'is_in_doaj', 
-            'homepage_url', 'works_api_url', 'updated_date', 'country_code', 'is_scopus', 'summary_stats'
-        )
         # Especificar encoding UTF-8 explícitamente
         cur.execute("SET client_encoding TO 'UTF8';")
-        cur.copy_from(buffer, 'sources', sep='\t', null='\\N', columns=columns)
+        # El pool se crea antes que el hilo y el pipe del COPY, para no heredarlos en el fork
+        with multiprocessing.Pool(NUM_WORKERS, initializer=_init_worker, initargs=(COPY_FORMAT, CACHE_DIR)) as pool:
+            with copy_stream(cur, 'sources', SOURCES_COLUMNS, COPY_FORMAT) as out:
+                for file_path, rows, ids in pool.imap_unordered(process_source_shard, shard_paths, chunksize=4):
+                    if ids:
+                        out.write(rows)
+                        latam_source_ids.update(ids)
+                        print(f"  {os.path.basename(file_path)}: {len(ids)} revistas LATAM")
+                        total_loaded += len(ids)
         conn.commit()
         print(f"\n✓ Cargadas {total_loaded} revistas LATAM")
     except Exception as e:
@@ -162,8 +741,11 @@ def load_sources():
         print(f"✗ Error al cargar sources: {e}")
         latam_source_ids = None
     
-    cur.close()
-    conn.close()
+    try:
+        rebuild_table_indexes(conn, cur, 'sources', 'id', index_defs)
+    finally:
+        cur.close()
+        conn.close()
     
     return latam_source_ids
 
@@ -189,58 +771,10 @@ def load_institutions():
         print(f"✗ No se encuentra la carpeta {institutions_path}")
         return None
     
-    buffer = StringIO()
-    total_loaded = 0
-    latam_inst_ids = set()
-    
-    print("Procesando archivos...")
-    
-    for root, _, files in os.walk(institutions_path):
-        for file in files:
-            if file.endswith(".gz"):
-                file_path = os.path.join(root, file)
-                count_in_file = 0
-                
-                with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            data = json.loads(line)
-                            
-                            # Filtrar solo LATAM
-                            if data.get('country_code') in LATAM_CODES:
-                                count_in_file += 1
-                                latam_inst_ids.add(data['id'])
-                                
-                                # Preparar fila para institutions
-                                row = [
-                                    data['id'],
-                                    data.get('ror'),
-                                    data.get('display_name'),
-                                    data.get('country_code'),
-                                    data.get('type'),
-                                    data.get('homepage_url'),
-                                    data.get('image_url'),
-                                    data.get('image_thumbnail_url'),
-                                    clean_json(data.get('display_name_acronyms')),
-                                    clean_json(data.get('display_name_alternatives')),
-                                    data.get('works_count', 0),
-                                    data.get('cited_by_count', 0),
-                                    data.get('works_api_url'),
-                                    data.get('updated_date')
-                                ]
-                                
-                                buffer.write('\t'.join([clean(i) for i in row]) + '\n')
-                        except Exception as e:
-                            continue
-                
-                if count_in_file > 0:
-                    print(f"  {file}: {count_in_file} instituciones LATAM")
-                    total_loaded += count_in_file
-    
     # Crear tabla con PRIMARY KEY si no existe
     try:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS openalex.institutions (
+            CREATE UNLOGGED TABLE IF NOT EXISTS openalex.institutions (
                 id text PRIMARY KEY,
                 ror text,
                 display_name text,
@@ -261,19 +795,29 @@ def load_institutions():
     except Exception as e:
         print(f"Advertencia al crear tabla institutions: {e}")
         conn.rollback()
-
-    # Cargar a la base de datos
+    
+    total_loaded = 0
+    latam_inst_ids = set()
+    shard_paths = list_shards(institutions_path)
+    
+    # Sin índices durante el COPY; se reconstruyen al final
+    index_defs = drop_table_indexes(conn, cur, 'institutions')
+    
+    print(f"Procesando {len(shard_paths)} archivos con {NUM_WORKERS} procesos...")
+    
+    # Cargar a la base de datos mientras los workers leen los archivos
     try:
-        buffer.seek(0)
-        columns = (
-            'id', 'ror', 'display_name', 'country_code', 'type',
-            'homepage_url', 'image_url', 'image_thumbnail_url',
-            'display_name_acronyms', 'display_name_alternatives',
-            'works_count', 'cited_by_count', 'works_api_url', 'updated_date'
-        )
         # Especificar encoding UTF-8 explícitamente
         cur.execute("SET client_encoding TO 'UTF8';")
-        cur.copy_from(buffer, 'institutions', sep='\t', null='\\N', columns=columns)
+        # El pool se crea antes que el hilo y el pipe del COPY, para no heredarlos en el fork
+        with multiprocessing.Pool(NUM_WORKERS, initializer=_init_worker, initargs=(COPY_FORMAT, CACHE_DIR)) as pool:
+            with copy_stream(cur, 'institutions', INSTITUTIONS_COLUMNS, COPY_FORMAT) as out:
+                for file_path, rows, ids in pool.imap_unordered(process_institution_shard, shard_paths, chunksize=4):
+                    if ids:
+                        out.write(rows)
+                        latam_inst_ids.update(ids)
+                        print(f"  {os.path.basename(file_path)}: {len(ids)} instituciones LATAM")
+                        total_loaded += len(ids)
         conn.commit()
         print(f"\n✓ Cargadas {total_loaded} instituciones LATAM")
     except Exception as e:
@@ -281,25 +825,32 @@ def load_institutions():
         print(f"✗ Error al cargar institutions: {e}")
         latam_inst_ids = None
     
-    cur.close()
-    conn.close()
+    try:
+        rebuild_table_indexes(conn, cur, 'institutions', 'id', index_defs)
+    finally:
+        cur.close()
+        conn.close()
     
     return latam_inst_ids
 
 
-def load_works_primary_location(latam_source_ids):
+def load_works_derived(latam_source_ids, primary=True, open_access=True):
     """
-    Carga works_primary_location para los works que ya están en la BD.
-    Requiere que ya se hayan cargado los works con load2.py
+    Carga works_primary_location y works_open_access en un solo recorrido de works/.
+    Cada archivo .gz se descomprime y cada línea se parsea una sola vez (en un Pool
+    de procesos); las filas de ambas tablas se cargan con un COPY por tabla.
     """
     print("\n" + "="*70)
-    print("CARGANDO WORKS_PRIMARY_LOCATION")
+    print("CARGANDO WORKS_PRIMARY_LOCATION / WORKS_OPEN_ACCESS")
     print("="*70)
     
     if not latam_source_ids:
         print("✗ No hay IDs de sources LATAM. Ejecuta load_sources() primero.")
         return
     
+    if not (primary or open_access):
+        return
+    
     try:
         conn = psycopg2.connect(**DB_PARAMS)
         cur = conn.cursor()
@@ -309,26 +860,39 @@ def load_works_primary_location(latam_source_ids):
         print(f"✗ Error de conexión: {e}")
         return
     
-    # Primero, crear la tabla si no existe
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS openalex.works_primary_location (
-        work_id text PRIMARY KEY,
-        source_id text,
-        is_oa boolean,
-        landing_page_url text,
-        pdf_url text,
-        license text,
-        version text
-    );
-    """
+    # Primero, crear las tablas si no existen
+    create_tables_sql = []
+    if primary:
+        create_tables_sql.append(("works_primary_location", """
+        CREATE UNLOGGED TABLE IF NOT EXISTS openalex.works_primary_location (
+            work_id text PRIMARY KEY,
+            source_id text,
+            is_oa boolean,
+            landing_page_url text,
+            pdf_url text,
+            license text,
+            version text
+        );
+        """))
+    if open_access:
+        create_tables_sql.append(("works_open_access", """
+        CREATE UNLOGGED TABLE IF NOT EXISTS openalex.works_open_access (
+            work_id text PRIMARY KEY,
+            is_oa boolean,
+            oa_status text,
+            oa_url text,
+            any_repository_has_fulltext boolean
+        );
+        """))
     
-    try:
-        cur.execute(create_table_sql)
-        conn.commit()
-        print("✓ Tabla works_primary_location verificada/creada")
-    except Exception as e:
-        print(f"✗ Error al crear tabla: {e}")
-        return
+    for table_name, create_table_sql in create_tables_sql:
+        try:
+            cur.execute(create_table_sql)
+            conn.commit()
+            print(f"✓ Tabla {table_name} verificada/creada")
+        except Exception as e:
+            print(f"✗ Error al crear tabla {table_name}: {e}")
+            return
     
     works_path = os.path.join(SNAPSHOT_DIR, "works")
     
@@ -336,157 +900,80 @@ def load_works_primary_location(latam_source_ids):
         print(f"✗ No se encuentra la carpeta {works_path}")
         return
     
-    buffer = StringIO()
     total_loaded = 0
+    shard_paths = list_shards(works_path)
     
-    print("Procesando archivos...")
-    
-    for root, _, files in os.walk(works_path):
-        for file in files:
-            if file.endswith(".gz"):
-                file_path = os.path.join(root, file)
-                count_in_file = 0
-                
-                with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            work = json.loads(line)
-                            primary_loc = work.get('primary_location')
-                            
-                            if primary_loc and primary_loc.get('source'):
-                                source_id = primary_loc['source'].get('id')
-                                
-                                # Solo procesar si es una revista LATAM
-                                if source_id in latam_source_ids:
-                                    count_in_file += 1
-                                    
-                                    row = [
-                                        work['id'],
-                                        source_id,
-                                        primary_loc.get('is_oa', False),
-                                        primary_loc.get('landing_page_url'),
-                                        primary_loc.get('pdf_url'),
-                                        primary_loc.get('license'),
-                                        primary_loc.get('version')
-                                    ]
-                                    
-                                    buffer.write('\t'.join([clean(i) for i in row]) + '\n')
-                        except Exception:
-                            continue
-                
-                if count_in_file > 0:
-                    try:
-                        buffer.seek(0)
-                        cur.copy_from(buffer, 'works_primary_location', sep='\t', null='\\N')
-                        conn.commit()
-                        print(f"  {file}: {count_in_file} registros")
-                        total_loaded += count_in_file
-                        buffer = StringIO()  # Reset buffer
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"  ✗ Error en {file}: {e}")
-                        buffer = StringIO()
-    
-    print(f"\n✓ Cargados {total_loaded} registros de works_primary_location")
+    # Muchos archivos aportan pocos works LATAM: acumular filas de varios archivos
+    # y hacer un COPY + commit por lote de WORKS_BATCH_ROWS filas
+    batch_primary = []
+    batch_oa = []
+    batch_count = 0
     
-    cur.close()
-    conn.close()
-
-
-def load_works_open_access(latam_source_ids):
-    """
-    Carga información de Open Access para los works LATAM.
-    """
-    print("\n" + "="*70)
-    print("CARGANDO WORKS_OPEN_ACCESS")
-    print("="*70)
+    def flush_batch():
+        nonlocal batch_primary, batch_oa, batch_count, total_loaded
+        if batch_count == 0:
+            return
+        # Ambas tablas se cargan en la misma transacción
+        try:
+            if primary:
+                copy_rows(cur, 'works_primary_location', WORKS_PRIMARY_COLUMNS, b''.join(batch_primary), COPY_FORMAT)
+            if open_access:
+                copy_rows(cur, 'works_open_access', WORKS_OA_COLUMNS, b''.join(batch_oa), COPY_FORMAT)
+            conn.commit()
+            total_loaded += batch_count
+            print(f"  ✓ Lote cargado: {batch_count} registros (total {total_loaded})")
+        except Exception as e:
+            conn.rollback()
+            print(f"  ✗ Error cargando lote de {batch_count} registros: {e}")
+        batch_primary = []
+        batch_oa = []
+        batch_count = 0
     
-    if not latam_source_ids:
-        print("✗ No hay IDs de sources LATAM. Ejecuta load_sources() primero.")
-        return
+    # Carga masiva: no esperar el flush del WAL en cada commit
+    cur.execute("SET synchronous_commit TO OFF;")
     
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cur = conn.cursor()
-        cur.execute("SET search_path TO openalex, public;")
-        print("✓ Conexión establecida")
-    except Exception as e:
-        print(f"✗ Error de conexión: {e}")
-        return
+    # Sin índices durante el COPY; se reconstruyen al final (aquí es donde más pesa)
+    index_defs = {}
+    if primary:
+        index_defs['works_primary_location'] = drop_table_indexes(conn, cur, 'works_primary_location')
+    if open_access:
+        index_defs['works_open_access'] = drop_table_indexes(conn, cur, 'works_open_access')
     
-    # Crear la tabla si no existe
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS openalex.works_open_access (
-        work_id text PRIMARY KEY,
-        is_oa boolean,
-        oa_status text,
-        oa_url text,
-        any_repository_has_fulltext boolean
-    );
-    """
+    print(f"Procesando {len(shard_paths)} archivos con {NUM_WORKERS} procesos...")
     
-    try:
-        cur.execute(create_table_sql)
-        conn.commit()
-        print("✓ Tabla works_open_access verificada/creada")
-    except Exception as e:
-        print(f"✗ Error al crear tabla: {e}")
-        return
+    latam_source_ids = frozenset(latam_source_ids)
+    tag = cache_tag(COPY_FORMAT, latam_source_ids, primary, open_access)
+    with multiprocessing.Pool(
+        NUM_WORKERS,
+        initializer=_init_worker,
+        initargs=(COPY_FORMAT, CACHE_DIR, latam_source_ids, primary, open_access),
+    ) as pool:
+        for name, rows_primary, rows_oa, count in iter_works_results(pool, shard_paths, CACHE_DIR, tag):
+            if count > 0:
+                print(f"  {name}: {count} registros")
+                batch_primary.append(rows_primary)
+                batch_oa.append(rows_oa)
+                batch_count += count
+                if batch_count >= WORKS_BATCH_ROWS:
+                    flush_batch()
     
-    works_path = os.path.join(SNAPSHOT_DIR, "works")
-    buffer = StringIO()
-    total_loaded = 0
+    flush_batch()
     
-    print("Procesando archivos...")
+    # Reconstruir todas las tablas antes de reportar una PRIMARY KEY fallida
+    rebuild_errors = []
+    for table_name, table_index_defs in index_defs.items():
+        try:
+            rebuild_table_indexes(conn, cur, table_name, 'work_id', table_index_defs)
+        except RuntimeError as e:
+            rebuild_errors.append(e)
     
-    for root, _, files in os.walk(works_path):
-        for file in files:
-            if file.endswith(".gz"):
-                file_path = os.path.join(root, file)
-                count_in_file = 0
-                
-                with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            work = json.loads(line)
-                            primary_loc = work.get('primary_location')
-                            
-                            if primary_loc and primary_loc.get('source'):
-                                source_id = primary_loc['source'].get('id')
-                                
-                                if source_id in latam_source_ids:
-                                    oa_info = work.get('open_access', {})
-                                    count_in_file += 1
-                                    
-                                    row = [
-                                        work['id'],
-                                        oa_info.get('is_oa', False),
-                                        oa_info.get('oa_status'),
-                                        oa_info.get('oa_url'),
-                                        oa_info.get('any_repository_has_fulltext', False)
-                                    ]
-                                    
-                                    buffer.write('\t'.join([clean(i) for i in row]) + '\n')
-                        except Exception:
-                            continue
-                
-                if count_in_file > 0:
-                    try:
-                        buffer.seek(0)
-                        cur.copy_from(buffer, 'works_open_access', sep='\t', null='\\N')
-                        conn.commit()
-                        print(f"  {file}: {count_in_file} registros")
-                        total_loaded += count_in_file
-                        buffer = StringIO()
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"  ✗ Error en {file}: {e}")
-                        buffer = StringIO()
-    
-    print(f"\n✓ Cargados {total_loaded} registros de works_open_access")
+    print(f"\n✓ Cargados {total_loaded} registros de works")
     
     cur.close()
     conn.close()
+    
+    if rebuild_errors:
+        raise rebuild_errors[0]
 
 
 if __name__ == "__main__":
@@ -498,8 +985,15 @@ if __name__ == "__main__":
     parser.add_argument('--only-institutions', action='store_true', help='Cargar solo la tabla institutions')
     parser.add_argument('--only-locations', action='store_true', help='Cargar solo works_primary_location')
     parser.add_argument('--only-oa', action='store_true', help='Cargar solo works_open_access')
+    parser.add_argument('--copy-format', choices=sorted(ROW_ENCODERS), default=COPY_FORMAT,
+                        help='Formato del COPY a Postgres (default: binary)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Caché de archivos ya procesados (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='No leer ni escribir la caché')
     
     args = parser.parse_args()
+    COPY_FORMAT = args.copy_format
+    CACHE_DIR = None if args.no_cache else args.cache_dir
     
     # Si no se especifica ninguna bandera, cargar todo (comportamiento por defecto)
     load_all = not (args.only_sources or args.only_institutions or args.only_locations or args.only_oa)
@@ -509,11 +1003,13 @@ if __name__ == "__main__":
     print("="*70)
     
     latam_source_ids = set()
+    loaded_tables = []
 
     # Paso 1: Cargar sources (o recuperar IDs si no se carga)
     if load_all or args.only_sources:
         print(">> Cargando Sources (Revistas)...")
         latam_source_ids = load_sources()
+        loaded_tables.append('sources')
         if not latam_source_ids and (load_all or args.only_sources):
              print("❌ Error cargando sources o conjunto vacío.")
     
@@ -535,22 +1031,26 @@ if __name__ == "__main__":
     if load_all or args.only_institutions:
         print("\n>> Cargando Institutions...")
         load_institutions()
+        loaded_tables.append('institutions')
     
-    # Paso 3: Cargar works_primary_location
-    if load_all or args.only_locations:
-        print("\n>> Cargando Works Primary Location...")
+    # Paso 3: Cargar works_primary_location y works_open_access (un solo recorrido)
+    load_locations = load_all or args.only_locations
+    load_oa = load_all or args.only_oa
+    if load_locations or load_oa:
+        print("\n>> Cargando Works Primary Location / Open Access...")
         if latam_source_ids:
-            load_works_primary_location(latam_source_ids)
+            load_works_derived(latam_source_ids, primary=load_locations, open_access=load_oa)
+            if load_locations:
+                loaded_tables.append('works_primary_location')
+            if load_oa:
+                loaded_tables.append('works_open_access')
         else:
-            print("⚠️ Saltando locations: Se requieren IDs de revistas LATAM.")
+            print("⚠️ Saltando works: Se requieren IDs de revistas LATAM.")
     
-    # Paso 4: Cargar works_open_access
-    if load_all or args.only_oa:
-        print("\n>> Cargando Works Open Access...")
-        if latam_source_ids:
-            load_works_open_access(latam_source_ids)
-        else:
-            print("⚠️ Saltando Open Access: Se requieren IDs de revistas LATAM.")
+    # Paso 4: Hacer durables las tablas cargadas (se crearon UNLOGGED)
+    if loaded_tables:
+        print("\n>> Marcando tablas como LOGGED...")
+        set_tables_logged(loaded_tables)
     
     print("\n" + "="*70)
     print("PROCESO COMPLETADO")
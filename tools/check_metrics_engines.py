@@ -0,0 +1,114 @@
+"""
+Checks that the aggregation engines of pipeline/transform_metrics.py (numba kernel,
+NumPy fallback and DuckDB) give the same per-(journal, year) sums, on works whose
+percentiles sit exactly on the top-10% / top-1% cut-offs (0.90, 0.99).
+
+    python tools/check_metrics_engines.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'pipeline'))
+import transform_metrics as tm
+
+def build_works(path):
+    """Small works file: fixed edge cases plus random works with 2-decimal percentiles."""
+    edge = pd.DataFrame({
+        'journal_id': ['S1'] * 6 + ['S2'] * 4,
+        'publication_year': [2020] * 6 + [2021] * 4,
+        'citation_normalized_percentile': [0.90, 0.99, 0.89, 0.9, 0.98, None, 0.90, 0.90, 0.99, 0.5],
+    })
+    rng = np.random.default_rng(0)
+    n = 5000
+    pct = np.round(rng.random(n), 2)
+    pct[rng.random(n) < 0.1] = np.nan
+    extra = pd.DataFrame({
+        'journal_id': rng.choice(['S1', 'S2', 'S3', None], n),
+        'publication_year': rng.integers(2018, 2023, n),
+        'citation_normalized_percentile': pct,
+    })
+    works = pd.concat([edge, extra], ignore_index=True)
+    works['fwci'] = np.where(rng.random(len(works)) < 0.1, np.nan, rng.gamma(1, 1.3, len(works)))
+    works['is_in_top_10_percent'] = rng.choice([True, False, None], len(works))
+    works['is_in_top_1_percent'] = rng.choice([True, False], len(works))
+    works['oa_status'] = rng.choice(['gold', 'diamond', 'green', 'closed', None], len(works))
+    works['language'] = rng.choice(['en', 'es', 'pt', 'zh', None], len(works))
+    works.to_parquet(path, index=False)
+    return works
+
+def expected_counts(works, ids, years):
+    """Works at or above 0.90 / 0.99 per (journal, year), counted directly in float64."""
+    pct = works['citation_normalized_percentile']
+    counts = {}
+    for col, threshold in ((tm.ANNUAL_N_090, 0.90), (tm.ANNUAL_N_099, 0.99)):
+        table = (
+            works.assign(hit=pct >= threshold)
+            .groupby(['journal_id', 'publication_year'], dropna=False)['hit'].sum()
+        )
+        dense = np.zeros((len(ids), len(years)))
+        for (journal_id, year), value in table.items():
+            dense[ids.get_loc(journal_id), year - years[0]] = value
+        counts[col] = dense
+    return counts
+
+def aligned(result, ids):
+    """Sums and max of an engine result, rows in the order of `ids`."""
+    group_ids, years, sums, year_max = result
+    order = group_ids.get_indexer(ids)
+    return years, sums[order], year_max[order]
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        works_file = Path(tmp) / 'works.parquet'
+        works = build_works(works_file)
+
+        # NumPy fallback (the kernel is looked up when group_year_sums runs)
+        kernel = tm._group_year_sums_kernel
+        tm._group_year_sums_kernel = tm._group_year_sums_numpy
+        try:
+            reference = tm.kernel_journal_year_sums(works_file)
+        finally:
+            tm._group_year_sums_kernel = kernel
+        ids = reference[0]
+        years, ref_sums, ref_max = aligned(reference, ids)
+        engines = {}
+        if tm.njit is not None:
+            engines['numba'] = tm.kernel_journal_year_sums(works_file)
+        else:
+            print("⚠️  numba not installed, kernel not checked")
+        if tm.duckdb is not None:
+            engines['duckdb'] = tm.duckdb_journal_year_sums(works_file)
+        else:
+            print("⚠️  duckdb not installed, DuckDB engine not checked")
+
+    for col, counts in expected_counts(works, ids, years).items():
+        if not np.array_equal(ref_sums[:, :, col], counts):
+            failures.append(f"NumPy: percentile threshold column {col} differs from the direct count")
+
+    for name, result in engines.items():
+        engine_years, sums, year_max = aligned(result, ids)
+        if not np.array_equal(engine_years, years):
+            failures.append(f"{name}: years {engine_years} != {years}")
+            continue
+        # Counts must be identical; float sums only change with the summation order
+        counts = [c for c in range(tm.ANNUAL_FIELDS) if c not in (tm.ANNUAL_FWCI, tm.ANNUAL_PCT)]
+        if not np.array_equal(sums[:, :, counts], ref_sums[:, :, counts]):
+            failures.append(f"{name}: counts differ from the NumPy fallback")
+        exact = name == 'numba'
+        same_floats = np.array_equal(sums, ref_sums) if exact else np.allclose(sums, ref_sums)
+        if not same_floats or not np.array_equal(year_max, ref_max):
+            failures.append(f"{name}: sums / percentile max differ from the NumPy fallback")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print(f"✅ Engines agree ({', '.join(['numpy'] + list(engines))}), cut-off percentiles counted")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())